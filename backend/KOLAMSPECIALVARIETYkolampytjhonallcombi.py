@@ -3,6 +3,7 @@ import math
 import csv
 import json
 from itertools import permutations
+from kolam_geometry import arc_segment_count
 
 # ---------- Logger for Animation Export -----------
 class KolamLogger:
@@ -146,16 +147,17 @@ class KolamVisualizer:
 
     def _suli_arc(self, r, sweep):
         self.turtle.pencolor(self.next_color())
-        steps = int(abs(sweep) / 5)
+        # One logged vertex per chord, as few chords as the radius allows
+        steps = arc_segment_count(r, sweep)
         for _ in range(steps):
-            self.turtle.circle(r, sweep / steps)
+            self.turtle.circle(r, sweep / steps, 1)
             self.logger.log_position("arc", self.turtle)
 
     def _combo_arc(self):
         I = 5 / math.sqrt(2)
         self.turtle.forward(I)
         self.logger.log_position("forward-B-start", self.turtle)
-        self.turtle.circle(I, 270)
+        self.turtle.circle(I, 270, arc_segment_count(I, 270))
         self.logger.log_position("arc-B", self.turtle)
         self.turtle.forward(I)
         self.logger.log_position("forward-B-end", self.turtle)
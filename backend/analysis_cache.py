@@ -0,0 +1,181 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+import cv2
+import numpy as np
+from PIL import Image
+
+from kolam_analysis import REDUCING_GAP, ink_mask
+
+# Model analyses cached by what the image looks like, not its bytes.
+#
+# The key is a 64-bit perceptual hash of the drawing (dHash of its ink mask,
+# cropped to the drawing) plus a hash of the prompt. Re-uploads, recompressed
+# copies and screenshots of the same kolam land within a few bits of each other,
+# so lookups search a BK-tree for the nearest stored hash within
+# HAMMING_THRESHOLD instead of requiring an exact match. Dense line work can
+# hash alike without being the same design, so an entry also records the
+# design's locally measured signature (see design_signature) and only matches
+# an upload measured alike. Entries live in SQLite
+# so they survive restarts (KOLAM_ANALYSIS_CACHE=":memory:" keeps them in RAM);
+# the least recently used go first beyond MAX_ENTRIES, and entries older than
+# MAX_AGE_SECONDS are dropped.
+
+CACHE_PATH = os.getenv("KOLAM_ANALYSIS_CACHE", os.path.join(os.path.dirname(os.path.abspath(__file__)), "analysis_cache.sqlite3"))
+MAX_ENTRIES = int(os.getenv("KOLAM_ANALYSIS_CACHE_ENTRIES", 5000))
+MAX_AGE_SECONDS = 30 * 24 * 3600
+HAMMING_THRESHOLD = 6
+# Side of the coverage map the hash is taken from, and its blur (pixels)
+HASH_SIZE = 64
+HASH_BLUR = 1.5
+# Side the upload is shrunk to before hashing
+HASH_INPUT_SIZE = 256
+
+
+def perceptual_hash(image):
+    # 64-bit difference hash of the ink mask: crop to the drawing (so margins,
+    # screenshots and rescales agree), blur away JPEG and antialiasing noise,
+    # then one bit per horizontally adjacent pair of a 9x8 thumbnail.
+    # `image` is a decoded RGB upload (see load_image).
+    if max(image.size) > HASH_INPUT_SIZE:
+        image = image.copy()
+        image.thumbnail((HASH_INPUT_SIZE, HASH_INPUT_SIZE), Image.BOX, reducing_gap=REDUCING_GAP)
+    mask = ink_mask(image)
+    rows, cols = np.nonzero(mask.any(axis=1))[0], np.nonzero(mask.any(axis=0))[0]
+    if len(rows):
+        mask = mask[rows[0]:rows[-1] + 1, cols[0]:cols[-1] + 1]
+    coverage = cv2.resize(mask.astype(np.float32), (HASH_SIZE, HASH_SIZE), interpolation=cv2.INTER_AREA)
+    coverage = cv2.GaussianBlur(coverage, (0, 0), HASH_BLUR)
+    small = cv2.resize(coverage, (9, 8), interpolation=cv2.INTER_AREA)
+    bits = small[:, 1:] > small[:, :-1]
+    return int.from_bytes(np.packbits(bits).tobytes(), "big")
+
+
+def prompt_hash(prompt):
+    return hashlib.sha1((prompt or "").encode()).hexdigest()[:16]
+
+
+def design_signature(local):
+    # Dense line work can hash alike without being the same design: a hash
+    # match only counts as the same design if these measurements agree too.
+    # `local` is an analyze_image result.
+    return local.get("symmetryType"), local.get("gridSystem"), local.get("specifications", {}).get("dotCount")
+
+
+def signature_key(signature):
+    return json.dumps(list(signature))
+
+
+def hamming(a, b):
+    return (a ^ b).bit_count()
+
+
+class BKTree:
+    # Metric tree over Hamming distance: each child edge is labelled with its
+    # distance to the parent, so a radius-r search only descends edges within
+    # [d - r, d + r] of the query's distance to the node.
+    def __init__(self):
+        self.root = None
+        self.size = 0
+
+    def add(self, key):
+        if self.root is None:
+            self.root = (key, {})
+            self.size = 1
+            return
+        node = self.root
+        while True:
+            distance = hamming(key, node[0])
+            if distance == 0:
+                return
+            child = node[1].get(distance)
+            if child is None:
+                node[1][distance] = (key, {})
+                self.size += 1
+                return
+            node = child
+
+    def nearest(self, key, radius):
+        # -> (distance, key) of the closest stored key within radius, or None
+        best = None
+        pending = [self.root] if self.root is not None else []
+        while pending:
+            node_key, children = pending.pop()
+            distance = hamming(key, node_key)
+            if distance <= radius and (best is None or distance < best[0]):
+                best = (distance, node_key)
+                if distance == 0:
+                    break
+            for edge, child in children.items():
+                if distance - radius <= edge <= distance + radius:
+                    pending.append(child)
+        return best
+
+
+class AnalysisCache:
+    def __init__(self, path=CACHE_PATH, max_entries=MAX_ENTRIES, threshold=HAMMING_THRESHOLD):
+        self.max_entries = max_entries
+        self.threshold = threshold
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        columns = [row[1] for row in self.db.execute("PRAGMA table_info(analyses)")]
+        if columns and "signature" not in columns:
+            # Entries from before signatures were kept can't be told apart safely
+            self.db.execute("DROP TABLE analyses")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS analyses ("
+            "prompt TEXT NOT NULL, signature TEXT NOT NULL, phash TEXT NOT NULL, analysis TEXT NOT NULL, "
+            "created REAL NOT NULL, used REAL NOT NULL, PRIMARY KEY (prompt, signature, phash))"
+        )
+        self.db.execute("DELETE FROM analyses WHERE created < ?", (time.time() - MAX_AGE_SECONDS,))
+        self.db.commit()
+        self._rebuild()
+
+    def _rebuild(self):
+        # One tree per prompt and signature; deletions (eviction) just rebuild the trees
+        self.trees = {}
+        for prompt, signature, phash in self.db.execute("SELECT prompt, signature, phash FROM analyses"):
+            self.trees.setdefault((prompt, signature), BKTree()).add(int(phash, 16))
+
+    def get(self, phash, signature, prompt):
+        key, signature = prompt_hash(prompt), signature_key(signature)
+        with self.lock:
+            tree = self.trees.get((key, signature))
+            match = tree.nearest(phash, self.threshold) if tree else None
+            if match is None:
+                return None
+            where, entry = "WHERE prompt = ? AND signature = ? AND phash = ?", (key, signature, f"{match[1]:016x}")
+            row = self.db.execute(f"SELECT analysis, created FROM analyses {where}", entry).fetchone()
+            if row is None:
+                return None
+            if row[1] < time.time() - MAX_AGE_SECONDS:
+                self.db.execute(f"DELETE FROM analyses {where}", entry)
+                self.db.commit()
+                self._rebuild()
+                return None
+            self.db.execute(f"UPDATE analyses SET used = ? {where}", (time.time(), *entry))
+            self.db.commit()
+        # A fresh copy each time: callers merge their own fields into it
+        return json.loads(row[0])
+
+    def put(self, phash, signature, prompt, analysis):
+        key, signature, now = prompt_hash(prompt), signature_key(signature), time.time()
+        with self.lock:
+            self.db.execute(
+                "INSERT OR REPLACE INTO analyses (prompt, signature, phash, analysis, created, used) VALUES (?, ?, ?, ?, ?, ?)",
+                (key, signature, f"{phash:016x}", json.dumps(analysis), now, now),
+            )
+            self.trees.setdefault((key, signature), BKTree()).add(phash)
+            count = self.db.execute("SELECT COUNT(*) FROM analyses").fetchone()[0]
+            if count > self.max_entries:
+                # Evict a tenth at a time so the trees aren't rebuilt on every put
+                self.db.execute(
+                    "DELETE FROM analyses WHERE rowid IN (SELECT rowid FROM analyses ORDER BY used LIMIT ?)",
+                    (count - self.max_entries * 9 // 10,),
+                )
+                self._rebuild()
+            self.db.commit()
@@ -1,66 +1,230 @@
 from flask import Flask, jsonify, request
 from flask_cors import CORS
+import atexit
 import base64
+import os
+import threading
+import time
 import traceback
 import multiprocessing
-import queue
-from kolampython import generate_kolam_image
+from kolam_geometry import flatten_geometry
+from kolam_shm import SharedLease, discard, new_token, publish_arrays
+from kolampython import generate_kolam_image, kolam_geometry
 
 app = Flask(__name__)
 CORS(app) # Enable CORS for all routes
 
-def kolam_generation_worker(axiom, rules, angle, dot_size, iterations, result_queue):
+# Long-lived pool of prewarmed render workers, shared by all requests
+WORKER_COUNT = int(os.getenv("KOLAM_WORKERS", os.cpu_count() or 2))
+TASK_TIMEOUT = float(os.getenv("KOLAM_TASK_TIMEOUT", 30)) # seconds
+MAX_TASKS_PER_WORKER = int(os.getenv("KOLAM_MAX_TASKS_PER_WORKER", 200))
+
+_pool = None
+_pool_lock = threading.Lock()
+# Tasks not yet collected, per pool (live or retired): {pool: {token: AsyncResult}}
+_pool_tasks = {}
+# Pools already retired and waiting to be torn down
+_retiring = set()
+# When a worker picked each task up (wall clock, reported by the worker
+# through _started_queue), so a task queued behind others isn't timed out
+_task_starts = {}
+_started_queue = None
+# Teardown polling interval for retired pools
+TEARDOWN_POLL = 0.1
+
+def _warm_worker(started_queue):
+    # Runs once per worker: touch the render path so the first real request
+    # doesn't pay for NumPy/Pillow code paths being loaded
+    global _started_queue
+    _started_queue = started_queue
+    generate_kolam_image("FB", {}, 45, 10, 0)
+
+def _timed_task(token, func, args):
+    # Report the pick-up before running: the caller's timeout starts here
+    _started_queue.put((token, time.time()))
+    return func(*args)
+
+def _collect_starts(started_queue):
+    while True:
+        token, started = started_queue.get()
+        with _pool_lock:
+            # Ignore tasks already collected or torn down
+            if any(token in tasks for tasks in _pool_tasks.values()):
+                _task_starts.setdefault(token, started)
+
+def kolam_generation_worker(axiom, rules, angle, dot_size, iterations, dpi, coordinates, token):
     try:
-        png_data = generate_kolam_image(axiom, rules, angle, dot_size, iterations)
-        result_queue.put({"image": png_data})
+        geometry = kolam_geometry(axiom, rules, dot_size, iterations)
+        arrays = {"png": generate_kolam_image(axiom, rules, angle, dot_size, iterations, dpi, geometry)}
+        if coordinates:
+            primitives = flatten_geometry(geometry)
+            arrays.update(lines=primitives["lines"], arcs=primitives["arcs"], dots=primitives["dots"])
+        # Only the shared-memory handle is pickled back, never the payload
+        return {"handle": publish_arrays(arrays, token)}
     except Exception as e:
-        result_queue.put({"error": str(e), "traceback": traceback.format_exc()})
+        return {"error": str(e), "traceback": traceback.format_exc()}
+
+def _create_pool():
+    # forkserver workers fork from a server that already imported the renderer,
+    # so starting (or replacing) a worker costs a fork, not a fresh interpreter
+    global _started_queue
+    if "forkserver" in multiprocessing.get_all_start_methods():
+        context = multiprocessing.get_context("forkserver")
+        context.set_forkserver_preload(["kolampython"])
+    else:
+        context = multiprocessing.get_context("spawn")
+    if _started_queue is None:
+        _started_queue = context.SimpleQueue()
+        threading.Thread(target=_collect_starts, args=(_started_queue,), daemon=True).start()
+    pool = context.Pool(WORKER_COUNT, initializer=_warm_worker, initargs=(_started_queue,),
+                        maxtasksperchild=MAX_TASKS_PER_WORKER)
+    _pool_tasks[pool] = {}
+    return pool
+
+def get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = _create_pool()
+        return _pool
+
+def submit_task(func, args, token):
+    # -> (pool, AsyncResult). Submitting under the lock means a pool is never
+    # handed a task after it has been retired.
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = _create_pool()
+        task = _pool.apply_async(_timed_task, (token, func, args))
+        _pool_tasks[_pool][token] = task
+        return _pool, task
+
+def _overdue(token, now):
+    started = _task_starts.get(token)
+    return started is not None and now >= started + TASK_TIMEOUT
+
+def wait_task(pool, task, token):
+    # The task's result, or multiprocessing.TimeoutError once it has run for
+    # TASK_TIMEOUT seconds since a worker picked it up (or its pool was torn
+    # down before it started). Time spent queued doesn't count.
+    try:
+        while not task.ready():
+            with _pool_lock:
+                started = _task_starts.get(token)
+                torn_down = pool not in _pool_tasks
+            if torn_down:
+                break
+            if started is None:
+                task.wait(TEARDOWN_POLL)
+                continue
+            remaining = started + TASK_TIMEOUT - time.time()
+            if remaining <= 0:
+                break
+            task.wait(remaining)
+        return task.get(timeout=0)
+    finally:
+        with _pool_lock:
+            if task.ready() or pool not in _pool_tasks:
+                _pool_tasks.get(pool, {}).pop(token, None)
+                _task_starts.pop(token, None)
+
+def _discard_pool(pool):
+    # A timed-out task can't be cancelled inside a Pool, so retire the pool:
+    # new requests go to a fresh one, while this one takes no new work but
+    # keeps running the other requests' tasks. The stuck worker is only
+    # killed (with the pool) once no task submitted to it is still running
+    # within its own deadline; tasks still queued then (every worker stuck)
+    # fail as timed out, and any result published too late is unlinked.
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+            pool.close()
+        if pool in _retiring or pool not in _pool_tasks:
+            return
+        _retiring.add(pool)
+
+    def busy():
+        now = time.time()
+        with _pool_lock:
+            tasks = _pool_tasks[pool]
+            return any(not task.ready() and token in _task_starts and not _overdue(token, now)
+                       for token, task in tasks.items())
+
+    def teardown():
+        # Twice in a row, so a worker that just picked up a queued task has
+        # had time to report it
+        idle = 0
+        while idle < 2:
+            time.sleep(TEARDOWN_POLL)
+            idle = 0 if busy() else idle + 1
+        pool.terminate()
+        with _pool_lock:
+            tasks = _pool_tasks.pop(pool)
+            _retiring.discard(pool)
+            for token in tasks:
+                _task_starts.pop(token, None)
+        for token in tasks:
+            discard(token)
+
+    threading.Thread(target=teardown, daemon=True).start()
+
+@atexit.register
+def _shutdown_pool():
+    # The current pool and any retired ones still waiting out their tasks
+    with _pool_lock:
+        pools = list(_pool_tasks)
+    for pool in pools:
+        pool.terminate()
 
 @app.route('/generate-kolam', methods=['POST'])
 def generate_kolam():
     data = request.get_json()
-    
+
     axiom = data.get("axiom", "FBFBFBFB")
     rules = data.get("rules", {"A": "AFBFA", "B": "AFBFBFBFA"})
     angle = data.get("angle", 45)
     dot_size = data.get("dot_size", 10)
     iterations = data.get("iterations", 2)
-    
-    result_queue = multiprocessing.Queue()
-    process = multiprocessing.Process(
-        target=kolam_generation_worker,
-        args=(axiom, rules, angle, dot_size, iterations, result_queue)
-    )
-    process.start()
-    
+    dpi = data.get("dpi", 96)
+    # Also return the flattened geometry (screen coordinates, y down)
+    coordinates = bool(data.get("coordinates", False))
+
+    token = new_token()
+    pool, task = submit_task(kolam_generation_worker,
+                             (axiom, rules, angle, dot_size, iterations, dpi, coordinates, token), token)
+
     try:
-        # Wait for the process to complete with a timeout
-        result = result_queue.get(timeout=30) # 30-second timeout
-        
-        if "image" in result:
-            png_data = result["image"]
-            encoded_image = base64.b64encode(png_data).decode('utf-8')
-            return jsonify({"image": encoded_image}), 200
+        # Wait for the worker with a per-task timeout, counted from pick-up
+        result = wait_task(pool, task, token)
+
+        if "handle" in result:
+            # Encode straight from the worker's segment; the lease unlinks it
+            with SharedLease(result["handle"]) as arrays:
+                response = {"image": base64.b64encode(arrays["png"]).decode('utf-8')}
+                if coordinates:
+                    response.update({key: arrays[key].tolist() for key in ("lines", "arcs", "dots")})
+                del arrays
+            return jsonify(response), 200
         else:
             # An error occurred in the worker process
             app.logger.error("Error from kolam generation worker: %s", result["traceback"])
             return jsonify({"error": result["error"], "traceback": result["traceback"]}), 500
-            
-    except queue.Empty:
-        process.terminate()
-        process.join()
+
+    except multiprocessing.TimeoutError:
+        _discard_pool(pool)
         error_msg = "Kolam generation timed out."
         app.logger.error(error_msg)
         return jsonify({"error": error_msg}), 500
     except Exception as e:
         app.logger.error("Error in main Flask process: %s", traceback.format_exc())
         return jsonify({"error": str(e), "traceback": traceback.format_exc()}), 500
-    finally:
-        if process.is_alive():
-            process.terminate()
-            process.join()
 
 if __name__ == '__main__':
     # This is important for multiprocessing on Windows
     multiprocessing.freeze_support()
+    # Start and warm the workers before the first request (in the reloader's
+    # serving child only, not in the watcher process)
+    if os.environ.get("WERKZEUG_RUN_MAIN") == "true":
+        get_pool()
     app.run(debug=True)
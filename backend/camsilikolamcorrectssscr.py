@@ -1,5 +1,6 @@
 import cv2
 import numpy as np
+from kolam_geometry import flatten_arc
 
 # L-System parameters
 axiom = "FBFBFBFB"  # Initiator
@@ -43,7 +44,9 @@ def draw_arc(radius, angle, img):
     global x, y
     x2 = x + radius * np.cos(np.radians(angle + 90))
     y2 = y - radius * np.sin(np.radians(angle + 90))
-    cv2.ellipse(img, (int(x), int(y)), (int(radius), int(radius)), angle, 0, 90, (0, 0, 0), thickness=dot_size)
+    # Sub-pixel polyline (4 fractional bits) with as few segments as the radius allows
+    points = np.round(flatten_arc(x, y, radius, angle, 90) * 16).astype(np.int32)
+    cv2.polylines(img, [points], False, (0, 0, 0), thickness=dot_size, lineType=cv2.LINE_AA, shift=4)
     x, y = x2, y2
 
 # Set the dot size and number of iterations
@@ -1,9 +1,10 @@
-from fastapi import FastAPI, UploadFile, File
-from fastapi.responses import Response
+from fastapi import FastAPI, UploadFile, File, Request, Query
+from fastapi.responses import FileResponse, JSONResponse, Response, StreamingResponse
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import UploadFile as StarletteUploadFile
+from starlette.formparsers import MultiPartParser
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
-import svgwrite
-import math
 import os
 import io
 from PIL import Image
@@ -11,6 +12,30 @@ import base64
 from dotenv import load_dotenv
 import google.generativeai as genai
 import json # Import the json module
+import asyncio
+import copy
+import hashlib
+import math
+import re
+import shutil
+import uuid
+import zipfile
+import tempfile
+import threading
+from contextlib import asynccontextmanager
+from collections import OrderedDict
+from kolam_geometry import geometry_spilled, lsystem_geometry, lsystem_symmetric_geometry, grouptheory_geometry
+from kolam_svg import UnsupportedSVG, geometry_to_svg, iter_svg, read_svg
+from kolam_lsystem import lsystem_expansion
+from kolam_analysis import ANALYSIS_SIZE, ImageTooLarge, analyze_image, analyze_vectors, generated_design_fields
+from kolam_preprocess import encode_payload, model_payload, prepare_upload
+from gemini_client import UNSUPPORTED_REQUEST_ERRORS, CircuitOpen, stream_content, configure as configure_gemini
+from gemini_quota import QuotaExceeded
+from json_fields import TopLevelFields, parse_model_text
+from kolam_batch import BatchJob, checkpoint_counts, output_format_available
+from kolam_prompts import prompt_template
+from analysis_cache import AnalysisCache, design_signature, perceptual_hash
+from kolam_raster import RASTER_FORMATS, encode_image, raster_format_available, render_geometry, thumbnail_pyramid
 
 load_dotenv() # Load environment variables from .env
 
@@ -20,7 +45,7 @@ app = FastAPI()
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
 if not GEMINI_API_KEY:
     raise ValueError("GEMINI_API_KEY not found in environment variables")
-genai.configure(api_key=GEMINI_API_KEY)
+configure_gemini(GEMINI_API_KEY)
 
 # Enable CORS
 app.add_middleware(
@@ -49,6 +74,7 @@ class KolamParameters(BaseModel):
     polygon1_radius: int = 3 # New parameter for Group Theory Kolam
     polygon2_sides: int = 8 # New parameter for Group Theory Kolam
     polygon2_radius: int = 2 # New parameter for Group Theory Kolam
+    use_symmetry: bool = False # Interpret one fundamental domain and replicate it by the axiom's symmetry
 
 class ImageProcessRequest(BaseModel):
     image: str # Base64 encoded image string
@@ -58,333 +84,442 @@ class GeminiAnalysisRequest(BaseModel):
     image_data: str # Base64 encoded image string
     prompt: str
 
-@app.post("/gemini-analyze-image")
-async def gemini_analyze_image(request: GeminiAnalysisRequest):
-    import time
-    try:
-        # Detect mime type from data URL if present
-        header_part = request.image_data.split(",")[0] if "," in request.image_data else ""
-        mime_type = "image/png"
-        if header_part.startswith("data:") and ";base64" in header_part:
-            try:
-                mime_type = header_part.split("data:", 1)[1].split(";", 1)[0] or "image/png"
-            except Exception:
-                mime_type = "image/png"
+def decode_image_data(image_data: str):
+    # Detect mime type from data URL if present
+    header_part = image_data.split(",")[0] if "," in image_data else ""
+    mime_type = "image/png"
+    if header_part.startswith("data:") and ";base64" in header_part:
+        try:
+            mime_type = header_part.split("data:", 1)[1].split(";", 1)[0] or "image/png"
+        except Exception:
+            mime_type = "image/png"
 
-        # Decode base64 image bytes
-        raw_b64 = request.image_data.split(",")[-1]
-        decoded_bytes = base64.b64decode(raw_b64)
+    # Decode base64 image bytes
+    raw_b64 = image_data.split(",")[-1]
+    decoded_bytes = base64.b64decode(raw_b64)
 
-        # If the input is an SVG, rasterize to PNG to ensure Gemini compatibility
-        if mime_type == "image/svg+xml":
-            try:
-                import cairosvg  # type: ignore
-                decoded_bytes = cairosvg.svg2png(bytestring=decoded_bytes)
-                mime_type = "image/png"
-            except Exception:
-                pass
+    return mime_type, decoded_bytes
 
-        # Ensure image is not excessively large; downscale if needed
+def rasterize_svg(mime_type, decoded_bytes):
+    # If the input is an SVG, rasterize to PNG to ensure Gemini compatibility
+    if mime_type == "image/svg+xml":
         try:
-            img = Image.open(io.BytesIO(decoded_bytes))
-            img_format = "PNG" if mime_type == "image/png" else ("JPEG" if mime_type in ("image/jpeg", "image/jpg") else "PNG")
-            max_side = 1536
-            if max(img.size) > max_side:
-                ratio = max_side / float(max(img.size))
-                new_size = (int(img.size[0] * ratio), int(img.size[1] * ratio))
-                img = img.convert("RGB").resize(new_size)
-            out = io.BytesIO()
-            img.save(out, format=img_format, optimize=True)
-            decoded_bytes = out.getvalue()
-            mime_type = "image/png" if img_format == "PNG" else "image/jpeg"
+            import cairosvg  # type: ignore
+            decoded_bytes = cairosvg.svg2png(bytestring=decoded_bytes)
+            mime_type = "image/png"
         except Exception:
             pass
-
-        # Prepare model and content parts - use latest 2.5 flash
-        model = genai.GenerativeModel("gemini-2.5-flash")
-        image_part = {"mime_type": mime_type, "data": decoded_bytes}
-
-        # Retry with exponential backoff on transient errors
-        last_error: Exception | None = None
-        for attempt in range(3):
+    return mime_type, decoded_bytes
+
+def prepare_image_source(mime_type, source):
+    # Decode the upload once; every later stage works from this. `source` is
+    # the raw bytes or a spooled upload file, which PIL reads directly.
+    if not isinstance(source, bytes) and (mime_type == "image/svg+xml" or looks_like_svg(source)):
+        source.seek(0)
+        source, mime_type = source.read(), "image/svg+xml"
+    if isinstance(source, bytes) and mime_type == "image/svg+xml":
+        # Lines, arcs, dots and polygons (our own output, among others) are
+        # measured from the markup itself; only other SVGs are rasterized
+        try:
+            document = read_svg(source)
+            return {"image": None, "original_size": (document["width"], document["height"]),
+                    "data": source, "mime_type": mime_type, "vector": document}
+        except UnsupportedSVG:
+            mime_type, source = rasterize_svg(mime_type, source)
+    try:
+        return prepare_upload(source)
+    except ImageTooLarge:
+        raise
+    except Exception:
+        # Nothing PIL can open (an SVG without cairosvg): the model still gets it as sent
+        if not isinstance(source, bytes):
+            source.seek(0)
+            source = source.read()
+        return {"image": None, "original_size": None, "data": source, "mime_type": mime_type}
+
+def prepare_image_data(image_data: str):
+    return prepare_image_source(*decode_image_data(image_data))
+
+def looks_like_svg(file):
+    file.seek(0)
+    head = file.read(256).lstrip()
+    return head.startswith(b"<svg") or (head.startswith(b"<?xml") and b"<svg" in head)
+
+# Binary uploads: bodies stream into a spooled temp file (in RAM up to
+# SPOOL_MEMORY_BYTES, then on disk) and are cut off past MAX_UPLOAD_BYTES
+MAX_UPLOAD_BYTES = int(os.getenv("KOLAM_MAX_UPLOAD_BYTES", 20 << 20))
+SPOOL_MEMORY_BYTES = 1 << 20
+
+class UploadTooLarge(Exception):
+    pass
+
+async def limited_body(request: Request, limit=MAX_UPLOAD_BYTES):
+    received = 0
+    async for chunk in request.stream():
+        received += len(chunk)
+        if received > limit:
+            raise UploadTooLarge(f"Upload is larger than the {limit}-byte limit")
+        yield chunk
+
+@asynccontextmanager
+async def received_upload(request: Request, limit=MAX_UPLOAD_BYTES):
+    # -> (mime_type, file, form fields) for a multipart/form-data body (image
+    # in a "file" field) or a raw body such as application/octet-stream
+    declared = request.headers.get("content-length", "")
+    if declared.isdigit() and int(declared) > limit:
+        raise UploadTooLarge(f"Upload is larger than the {limit}-byte limit")
+    content_type = request.headers.get("content-type", "")
+    if content_type.startswith("multipart/form-data"):
+        form = await MultiPartParser(request.headers, limited_body(request, limit), max_files=1).parse()
+        try:
+            upload = form.get("file")
+            if not isinstance(upload, StarletteUploadFile):
+                raise ValueError("Multipart upload needs the image in a 'file' field")
+            fields = {key: value for key, value in form.multi_items() if isinstance(value, str)}
+            yield upload.content_type or "application/octet-stream", upload.file, fields
+        finally:
+            await form.close()
+        return
+    with tempfile.SpooledTemporaryFile(max_size=SPOOL_MEMORY_BYTES) as spool:
+        async for chunk in limited_body(request, limit):
+            spool.write(chunk)
+        yield content_type.split(";")[0].strip() or "application/octet-stream", spool, {}
+
+async def receive_prepared_upload(request: Request):
+    # -> (prepared image, form fields), or an error Response
+    try:
+        async with received_upload(request) as (mime_type, file, fields):
+            prepared = await run_in_threadpool(prepare_image_source, mime_type, file)
+        return prepared, fields
+    except (UploadTooLarge, ImageTooLarge) as e:
+        return Response(content=str(e), media_type="text/plain", status_code=413), None
+    except ValueError as e:
+        return Response(content=str(e), media_type="text/plain", status_code=400), None
+
+def measure_prepared(prepared):
+    try:
+        if prepared.get("vector") is not None:
+            return analyze_vectors(prepared["vector"])
+        if prepared["image"] is None:
+            return {}
+        return analyze_image(prepared["image"], prepared["original_size"])
+    except Exception:
+        return {}
+
+def analyze_image_locally(prepared):
+    # Pixel-measured analysis fields (vector-measured for an SVG read by
+    # read_svg); empty if the upload can't be decoded here. Measured once per
+    # upload (the cache lookup and the tiered response both need them); each
+    # caller gets its own copy to merge into.
+    with prepared.setdefault("local_lock", threading.Lock()):
+        if "local" not in prepared:
+            prepared["local"] = measure_prepared(prepared)
+    return copy.deepcopy(prepared["local"])
+
+def generated_design(prepared):
+    # One of our own designs, uploaded back: everything the standard analysis
+    # asks the model is known from its markup
+    return prepared.get("vector") is not None and prepared["vector"]["generated"]
+
+def generated_design_analysis(prepared):
+    analysis = analyze_image_locally(prepared)
+    return dict(analysis, **generated_design_fields(prepared["vector"], analysis)) if analysis else {}
+
+# Gemini analyses keyed by perceptual hash + design signature + prompt,
+# shared across restarts
+analysis_cache = AnalysisCache()
+
+def image_cache_key(prepared):
+    # (perceptual hash, design signature), or None if either can't be measured
+    if prepared["image"] is None:
+        return None
+    try:
+        phash = perceptual_hash(prepared["image"])
+    except Exception:
+        return None
+    local = analyze_image_locally(prepared)
+    return (phash, design_signature(local)) if local else None
+
+def model_image_part(prepared, compact=True):
+    # compact: the drawing cropped, binarised and shrunk as far as its measured
+    # structure allows (see model_payload), for the template analysis whose
+    # size, stroke and colour fields are measured locally. Free-form prompts
+    # may ask about exactly those, so they get the upload as prepared.
+    # Vector uploads are rendered from their geometry for the model only.
+    image = prepared["image"]
+    if prepared.get("vector") is not None:
+        if not compact:
+            mime_type, data = rasterize_svg(prepared["mime_type"], prepared["data"])
+            if mime_type != "image/svg+xml":
+                return {"mime_type": mime_type, "data": data}
+        geometry = prepared["vector"]["geometry"]
+        image = render_geometry(geometry, min(1.0, ANALYSIS_SIZE / max(geometry.width, geometry.height)))
+        if not compact:
+            data, mime_type = encode_payload(image, False)
+            return {"mime_type": mime_type, "data": data}
+    if image is not None and compact:
+        try:
+            data, mime_type, _ = model_payload(image)
+            return {"mime_type": mime_type, "data": data}
+        except Exception:
+            pass
+    return {"mime_type": prepared["mime_type"], "data": prepared["data"]}
+
+async def gemini_analysis_events(prepared, prompt: str = "", template=None):
+    # Streams the model's answer as it is generated:
+    #   ("field", key, value) -> a top-level field of the JSON answer, as soon as it closes
+    #   ("result", response)  -> last; what gemini_analysis returns. While the
+    #                            circuit breaker is open that is the local
+    #                            analysis with "degraded": true
+    # Either a free-form prompt or a versioned template (see kolam_prompts)
+    try:
+        # One of our own designs asked for the standard analysis: answered from
+        # its markup. A free-form prompt still goes to the model (with a render).
+        if generated_design(prepared) and (template is not None or not prompt):
+            analysis = await run_in_threadpool(generated_design_analysis, prepared)
+            for key, value in analysis.items():
+                yield "field", key, value
+            yield "result", {"analysis": analysis}
+            return
+
+        # The same kolam (re-uploaded, recompressed, screenshotted) analysed
+        # with the same prompt before: reuse that answer instead of a paid call
+        cache_key = template["id"] if template else prompt
+        image_key = await run_in_threadpool(image_cache_key, prepared)
+        if image_key is not None:
+            cached = await run_in_threadpool(analysis_cache.get, *image_key, cache_key)
+            if cached is not None:
+                for key, value in cached.items():
+                    yield "field", key, value
+                yield "result", {"analysis": cached}
+                return
+
+        # Shared model; the call itself doesn't block the event loop and is
+        # retried with jittered backoff (see gemini_client)
+        image_part = await run_in_threadpool(model_image_part, prepared, template is not None)
+        if template is None:
+            attempts = [(None, prompt or "Analyze the kolam image and return the JSON as specified.")]
+        else:
+            attempts = [(template, template["prompt"])]
+            if template.get("fallback"):
+                # Structured output or system instructions not accepted: the prose version
+                fallback = prompt_template(template["fallback"])
+                attempts.append((fallback, fallback["prompt"]))
+        chunks, fields = [], TopLevelFields()
+        for index, (attempt_template, attempt_prompt) in enumerate(attempts):
             try:
-                response = model.generate_content([
-                    request.prompt or "Analyze the kolam image and return the JSON as specified.",
-                    image_part,
-                ])
-                gemini_response_text = (response.text or "").strip()
-                if gemini_response_text.startswith("json "):
-                    gemini_response_text = gemini_response_text[len("json "):]
-                if gemini_response_text.startswith("```json"):
-                    gemini_response_text = gemini_response_text[len("```json\n"):].strip()
-                if gemini_response_text.endswith("```"):
-                    gemini_response_text = gemini_response_text[:-3].strip()
-
-                try:
-                    parsed = json.loads(gemini_response_text) if gemini_response_text else {}
-                    if isinstance(parsed, str):
-                        parsed = json.loads(parsed)
-                    return {"analysis": parsed}
-                except json.JSONDecodeError:
-                    return {"analysis": gemini_response_text or response.text}
-            except Exception as err:
-                last_error = err
-                time.sleep(0.5 * (2 ** attempt))
-
-        raise last_error  # type: ignore[misc]
+                async for text in stream_content([attempt_prompt, image_part], template=attempt_template):
+                    chunks.append(text)
+                    for key, value in fields.feed(text):
+                        yield "field", key, value
+                break
+            except UNSUPPORTED_REQUEST_ERRORS:
+                if chunks or index + 1 == len(attempts):
+                    raise
+
+        parsed = parse_model_text("".join(chunks))
+        if image_key is not None and isinstance(parsed, dict) and parsed:
+            await run_in_threadpool(analysis_cache.put, *image_key, cache_key, parsed)
+        yield "result", {"analysis": parsed}
+    except QuotaExceeded as e:
+        # Queued behind more than GEMINI_MAX_QUEUE_WAIT of quota: come back later
+        yield "result", Response(content=str(e), media_type="text/plain", status_code=429, headers={"Retry-After": str(math.ceil(e.retry_after))})
+    except CircuitOpen:
+        # Gemini keeps failing: answer with what can be measured locally
+        yield "result", {"analysis": await run_in_threadpool(analyze_image_locally, prepared), "degraded": True}
     except Exception as e:
         import traceback
-        return Response(content=f"Error in Gemini analysis: {e}\n{traceback.format_exc()}", media_type="text/plain", status_code=500)
-
-# Preflight requests are handled automatically by CORSMiddleware
-
-# Function to expand the L-System string (from kolampython.py)
-def expand_lsystem_string(axiom, rules, iterations):
-    result = axiom
-    for _ in range(iterations):
-        result = "".join([rules.get(ch, ch) for ch in result])
-    return result
-
-def generate_lsystem_kolam_svg(params: KolamParameters):
-    dwg = svgwrite.Drawing('kolam.svg', profile='tiny', size=('600px', '600px'))
-    dwg.add(dwg.rect(insert=(0, 0), size=('100%', '100%'), fill='white'))
-
-    current_x, current_y = 300, 300
-    current_angle = 0
-
-    def draw_line_svg(length):
-        nonlocal current_x, current_y, current_angle
-        new_x = current_x + length * math.cos(math.radians(current_angle))
-        new_y = current_y + length * math.sin(math.radians(current_angle))
-        dwg.add(dwg.line(start=(current_x, current_y), end=(new_x, new_y), stroke='black', stroke_width=2))
-        current_x, current_y = new_x, new_y
-
-    def draw_arc_svg(radius, angle_degrees):
-        nonlocal current_x, current_y, current_angle
-        current_angle_rad = math.radians(current_angle)
-        
-        if radius > 0:
-            center_angle_rad = current_angle_rad + math.pi / 2
+        yield "result", Response(content=f"Error in Gemini analysis: {e}\n{traceback.format_exc()}", media_type="text/plain", status_code=500)
+
+async def gemini_analysis(prepared, prompt: str = "", template=None):
+    async for event in gemini_analysis_events(prepared, prompt, template):
+        if event[0] == "result":
+            return event[1]
+
+def sse_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+def error_event(response):
+    data = {"status": response.status_code, "detail": response.body.decode(errors="replace")}
+    if "retry-after" in response.headers:
+        data["retryAfter"] = int(response.headers["retry-after"])
+    return data
+
+async def stream_gemini_analysis(prepared, prompt):
+    # Server-sent events: "field" per top-level field as the model writes it,
+    # then "done" with the whole analysis, or "error"
+    async for event in gemini_analysis_events(prepared, prompt):
+        if event[0] == "field":
+            yield sse_event("field", {"analysis": {event[1]: event[2]}})
+        elif isinstance(event[1], Response):
+            yield sse_event("error", error_event(event[1]))
         else:
-            center_angle_rad = current_angle_rad - math.pi / 2
-            radius = abs(radius)
-
-        center_x = current_x + radius * math.cos(center_angle_rad)
-        center_y = current_y + radius * math.sin(center_angle_rad)
+            yield sse_event("done", event[1])
 
-        start_angle_rad = math.atan2(current_y - center_y, current_x - center_x)
-        end_angle_rad = start_angle_rad + math.radians(angle_degrees)
+async def gemini_analysis_response(prepared, prompt, http_request: Request):
+    if "text/event-stream" in http_request.headers.get("accept", ""):
+        return StreamingResponse(
+            stream_gemini_analysis(prepared, prompt),
+            media_type="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        )
+    return await gemini_analysis(prepared, prompt)
 
-        sweep_flag = 1 if radius > 0 else 0
-        if angle_degrees < 0:
-            sweep_flag = 1 - sweep_flag
-
-        large_arc_flag = 1 if abs(angle_degrees) > 180 else 0
-
-        end_x = center_x + radius * math.cos(end_angle_rad)
-        end_y = center_y + radius * math.sin(end_angle_rad)
-
-        path_data = f"M {current_x},{current_y} A {radius},{radius} 0 {large_arc_flag} {sweep_flag} {end_x},{end_y}"
-        dwg.add(dwg.path(d=path_data, stroke='black', stroke_width=2, fill='none'))
-
-        current_x, current_y = end_x, end_y
-        current_angle += angle_degrees
-
-    lsystem_string = expand_lsystem_string(params.axiom, params.rules, params.iterations)
-
-    current_x = 300 - params.dot_size
-    current_y = 300 + params.dot_size
-
-    for symbol in lsystem_string:
-        if symbol == "F":
-            draw_line_svg(params.dot_size)
-        elif symbol == "A":
-            draw_arc_svg(params.dot_size, 90)
-        elif symbol == "B":
-            forward_units = 5 / (2 ** 0.5)
-            draw_line_svg(forward_units)
-            draw_arc_svg(forward_units, 270)
-
-    return dwg.tostring()
-
-def generate_suzhi_kolam_svg(params: KolamParameters):
-    dwg = svgwrite.Drawing('suzhi_kolam.svg', profile='tiny', size=('600px', '600px'))
-    dwg.add(dwg.rect(insert=(0, 0), size=('100%', '100%'), fill='white'))
-
-    current_x, current_y = 300, 300
-    current_angle = 0
-
-    def draw_line_svg(length):
-        nonlocal current_x, current_y, current_angle
-        new_x = current_x + length * math.cos(math.radians(current_angle))
-        new_y = current_y + length * math.sin(math.radians(current_angle))
-        dwg.add(dwg.line(start=(current_x, current_y), end=(new_x, new_y), stroke='black', stroke_width=2))
-        current_x, current_y = new_x, new_y
-
-    def draw_arc_svg(radius, angle_degrees):
-        nonlocal current_x, current_y, current_angle
-        current_angle_rad = math.radians(current_angle)
-        
-        if radius > 0:
-            center_angle_rad = current_angle_rad + math.pi / 2
-        else:
-            center_angle_rad = current_angle_rad - math.pi / 2
-            radius = abs(radius)
-
-        center_x = current_x + radius * math.cos(center_angle_rad)
-        center_y = current_y + radius * math.sin(center_angle_rad)
-
-        start_angle_rad = math.atan2(current_y - center_y, current_x - center_x)
-        end_angle_rad = start_angle_rad + math.radians(angle_degrees)
-
-        sweep_flag = 1 if radius > 0 else 0
-        if angle_degrees < 0:
-            sweep_flag = 1 - sweep_flag
-
-        large_arc_flag = 1 if abs(angle_degrees) > 180 else 0
-
-        end_x = center_x + radius * math.cos(end_angle_rad)
-        end_y = center_y + radius * math.sin(end_angle_rad)
-
-        path_data = f"M {current_x},{current_y} A {radius},{radius} 0 {large_arc_flag} {sweep_flag} {end_x},{end_y}"
-        dwg.add(dwg.path(d=path_data, stroke='black', stroke_width=2, fill='none'))
-
-        current_x, current_y = end_x, end_y
-        current_angle += angle_degrees
-
-    lsystem_string = expand_lsystem_string(params.axiom, params.rules, params.iterations)
-
-    current_x = 300 - params.dot_size
-    current_y = 300 + params.dot_size
-
-    for symbol in lsystem_string:
-        if symbol == "F":
-            draw_line_svg(params.dot_size)
-        elif symbol == "A":
-            draw_arc_svg(params.dot_size, 90)
-        elif symbol == "B":
-            forward_units = 5 / (2 ** 0.5)
-            draw_line_svg(forward_units)
-            draw_arc_svg(forward_units, 270)
-
-    return dwg.tostring()
-
-def generate_kambi_kolam_svg(params: KolamParameters):
-    dwg = svgwrite.Drawing('kambi_kolam.svg', profile='tiny', size=('600px', '600px'))
-    dwg.add(dwg.rect(insert=(0, 0), size=('100%', '100%'), fill='white'))
-
-    current_x, current_y = 300, 300
-    current_angle = 0
+@app.post("/gemini-analyze-image")
+async def gemini_analyze_image(request: GeminiAnalysisRequest, http_request: Request):
+    try:
+        prepared = await run_in_threadpool(prepare_image_data, request.image_data)
+    except ImageTooLarge as e:
+        return Response(content=str(e), media_type="text/plain", status_code=413)
+    except Exception as e:
+        import traceback
+        return Response(content=f"Error in Gemini analysis: {e}\n{traceback.format_exc()}", media_type="text/plain", status_code=500)
+    return await gemini_analysis_response(prepared, request.prompt, http_request)
 
-    # Calculate the side length of the rhombus based on the dot size and rhombus size
-    rhombus_side = params.rhombus_size * params.dot_size
+@app.post("/gemini-analyze-image/upload")
+async def gemini_analyze_upload(request: Request, prompt: str = ""):
+    # Multipart ("file", optional "prompt" field) or raw image body
+    try:
+        prepared, fields = await receive_prepared_upload(request)
+        if isinstance(prepared, Response):
+            return prepared
+    except Exception as e:
+        import traceback
+        return Response(content=f"Error in Gemini analysis: {e}\n{traceback.format_exc()}", media_type="text/plain", status_code=500)
+    return await gemini_analysis_response(prepared, fields.get("prompt", prompt), request)
 
-    # Set up the initial position (adjusting for SVG coordinate system)
-    current_x = 300 - rhombus_side / 2
-    current_y = 300 + rhombus_side / 2
+# Preflight requests are handled automatically by CORSMiddleware
 
-    def draw_line_svg(length):
-        nonlocal current_x, current_y, current_angle
-        new_x = current_x + length * math.cos(math.radians(current_angle))
-        new_y = current_y + length * math.sin(math.radians(current_angle))
-        dwg.add(dwg.line(start=(current_x, current_y), end=(new_x, new_y), stroke='black', stroke_width=2))
-        current_x, current_y = new_x, new_y
+def build_lsystem_geometry(params: KolamParameters, start_x, start_y):
+    if params.use_symmetry:
+        return lsystem_symmetric_geometry(params.axiom, params.rules, params.iterations, params.dot_size, start_x, start_y)
+    lsystem_string = lsystem_expansion(params.axiom, params.rules, params.iterations)
+    return lsystem_geometry(lsystem_string, params.dot_size, start_x, start_y)
+
+def build_kolam_geometry(params: KolamParameters):
+    if params.design_type in ("lsystem", "suzhi"):
+        return build_lsystem_geometry(params, 300 - params.dot_size, 300 + params.dot_size)
+    if params.design_type == "kambi":
+        # Calculate the side length of the rhombus based on the dot size and rhombus size
+        rhombus_side = params.rhombus_size * params.dot_size
+        return build_lsystem_geometry(params, 300 - rhombus_side / 2, 300 + rhombus_side / 2)
+    if params.design_type == "grouptheory":
+        return grouptheory_geometry(
+            params.grid_size,
+            params.polygon1_sides, params.polygon1_radius,
+            params.polygon2_sides, params.polygon2_radius,
+        )
+    return None
+
+MAX_RASTER_SIZE = 4096
+ACCEPT_FORMATS = {
+    "image/svg+xml": "svg",
+    "image/png": "png",
+    "image/webp": "webp",
+    "image/avif": "avif",
+}
 
-    def draw_arc_svg(radius, angle_degrees):
-        nonlocal current_x, current_y, current_angle
-        current_angle_rad = math.radians(current_angle)
-        
-        if radius > 0:
-            center_angle_rad = current_angle_rad + math.pi / 2
-        else:
-            center_angle_rad = current_angle_rad - math.pi / 2
-            radius = abs(radius)
-
-        center_x = current_x + radius * math.cos(center_angle_rad)
-        center_y = current_y + radius * math.sin(center_angle_rad)
-
-        start_angle_rad = math.atan2(current_y - center_y, current_x - center_x)
-        end_angle_rad = start_angle_rad + math.radians(angle_degrees)
-
-        sweep_flag = 1 if radius > 0 else 0
-        if angle_degrees < 0:
-            sweep_flag = 1 - sweep_flag
-
-        large_arc_flag = 1 if abs(angle_degrees) > 180 else 0
-
-        end_x = center_x + radius * math.cos(end_angle_rad)
-        end_y = center_y + radius * math.sin(end_angle_rad)
-
-        path_data = f"M {current_x},{current_y} A {radius},{radius} 0 {large_arc_flag} {sweep_flag} {end_x},{end_y}"
-        dwg.add(dwg.path(d=path_data, stroke='black', stroke_width=2, fill='none'))
-
-        current_x, current_y = end_x, end_y
-        current_angle += angle_degrees
-
-    lsystem_string = expand_lsystem_string(params.axiom, params.rules, params.iterations)
-
-    for symbol in lsystem_string:
-        if symbol == "F":
-            draw_line_svg(params.dot_size)
-        elif symbol == "A":
-            draw_arc_svg(params.dot_size, 90)
-        elif symbol == "B":
-            forward_units = 5 / (2 ** 0.5)
-            draw_line_svg(forward_units)
-            draw_arc_svg(forward_units, 270)
-
-    return dwg.tostring()
-
-def create_polygon_svg(center, sides, radius, dwg, offset_x, offset_y):
-    angle = 2 * math.pi / sides
-    points = []
-    for i in range(sides):
-        x = center[0] + radius * math.cos(i * angle)
-        y = center[1] + radius * math.sin(i * angle)
-        points.append((x + offset_x, y + offset_y))
-    
-    points_str = " ".join([f"{p[0]},{p[1]}" for p in points])
-    dwg.add(dwg.polygon(points=points, stroke='black', fill='none', stroke_width=2))
-
-def generate_grouptheory_kolam_svg(params: KolamParameters):
-    dwg = svgwrite.Drawing('grouptheory_kolam.svg', profile='tiny', size=('800px', '800px'))
-    dwg.add(dwg.rect(insert=(0, 0), size=('100%', '100%'), fill='white'))
-
-    center_x, center_y = 400, 400 # Center of the 800x800 canvas
-    scale_factor = 40 # Corresponds to the 40 used in the python turtle example
-
-    def get_polygon_points(sides, radius):
-        local_points = []
-        angle_step = 2 * math.pi / sides
-        for i in range(sides):
-            x = radius * math.cos(i * angle_step)
-            y = radius * math.sin(i * angle_step)
-            local_points.append((x, y))
-        return local_points
-
-    polygon1_local = get_polygon_points(params.polygon1_sides, params.polygon1_radius)
-    polygon2_local = get_polygon_points(params.polygon2_sides, params.polygon2_radius)
-
-    grid_offset_x = center_x - (params.grid_size - 1) * scale_factor / 2
-    grid_offset_y = center_y - (params.grid_size - 1) * scale_factor / 2
-
-    for r_idx in range(params.grid_size):
-        for c_idx in range(params.grid_size):
-            current_polygon_local = polygon1_local if (r_idx + c_idx) % 2 == 0 else polygon2_local
-            
-            # Calculate the position for each polygon based on grid index
-            offset_x = grid_offset_x + c_idx * scale_factor
-            offset_y = grid_offset_y + r_idx * scale_factor
-
-            points_for_svg = []
-            for px, py in current_polygon_local:
-                points_for_svg.append((offset_x + px * scale_factor / 3, offset_y + py * scale_factor / 3))
-            
-            if points_for_svg:
-                points_str = " ".join([f"{p[0]},{p[1]}" for p in points_for_svg])
-                dwg.add(dwg.polygon(points=points_for_svg, stroke='black', fill='none', stroke_width=1))
-
-    return dwg.tostring()
+def negotiate_output_format(requested, accept_header):
+    # An explicit ?format= wins; otherwise take the best supported type from Accept.
+    # Anything else (no header, wildcards, only non-image types, unavailable
+    # rasters) keeps the historical SVG response unless Accept rules SVG out.
+    if requested:
+        requested = requested.lower()
+        if requested == "svg" or raster_format_available(requested):
+            return requested
+        return None
+    if not accept_header:
+        return "svg"
+    candidates, qualities = [], {}
+    for position, item in enumerate(accept_header.split(",")):
+        media_type, _, options = item.strip().partition(";")
+        media_type = media_type.strip().lower()
+        quality = 1.0
+        for option in options.split(";"):
+            name, _, value = option.strip().partition("=")
+            if name == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        qualities.setdefault(media_type, quality)
+        if quality > 0:
+            candidates.append((-quality, position, media_type))
+    # SVG's quality comes from its most specific matching range
+    svg_quality = next((qualities[media_type] for media_type in ("image/svg+xml", "image/*", "*/*")
+                        if media_type in qualities), None)
+    svg_excluded = svg_quality is not None and svg_quality <= 0
+    for _, _, media_type in sorted(candidates):
+        if media_type in ("*/*", "image/*"):
+            if not svg_excluded:
+                return "svg"
+            continue
+        output_format = ACCEPT_FORMATS.get(media_type)
+        if output_format and (output_format == "svg" or raster_format_available(output_format)):
+            return output_format
+    return None if svg_excluded else "svg"
+
+def render_kolam_raster(geometry, size, output_format):
+    scale = size / max(geometry.width, geometry.height) if size else 1.0
+    return encode_image(render_geometry(geometry, scale), output_format)
+
+# Thumbnails rendered once per design and kept as encoded bytes, least recently used evicted first
+THUMBNAIL_CACHE_BYTES = 64 * 1024 * 1024
+THUMBNAIL_SIZES = (128, 256, 512, 1024)
+_thumbnail_cache: "OrderedDict[tuple, bytes]" = OrderedDict()
+_thumbnail_cache_bytes = 0
+_thumbnail_params: "OrderedDict[str, KolamParameters]" = OrderedDict()
+_thumbnail_lock = threading.Lock()
+
+def _cache_thumbnail(cache_key, data):
+    global _thumbnail_cache_bytes
+    with _thumbnail_lock:
+        if cache_key in _thumbnail_cache:
+            return
+        _thumbnail_cache[cache_key] = data
+        _thumbnail_cache_bytes += len(data)
+        while _thumbnail_cache_bytes > THUMBNAIL_CACHE_BYTES and _thumbnail_cache:
+            _, evicted = _thumbnail_cache.popitem(last=False)
+            _thumbnail_cache_bytes -= len(evicted)
+
+def _cached_thumbnail(cache_key):
+    with _thumbnail_lock:
+        data = _thumbnail_cache.get(cache_key)
+        if data is not None:
+            _thumbnail_cache.move_to_end(cache_key)
+        return data
+
+def kolam_design_key(params: KolamParameters):
+    return hashlib.sha1(params.model_dump_json().encode()).hexdigest()[:20]
+
+def ensure_thumbnails(key, params: KolamParameters, sizes, output_format):
+    # Render only if some size is missing, and then only once at the largest
+    # size; every smaller size is derived from it by pyramid downsampling
+    cached = {size: _cached_thumbnail((key, size, output_format)) for size in sizes}
+    rendered = {}
+    if any(data is None for data in cached.values()):
+        geometry = build_kolam_geometry(params)
+        largest = max(sizes)
+        image = render_geometry(geometry, largest / max(geometry.width, geometry.height))
+        for size, thumbnail in thumbnail_pyramid(image, sizes).items():
+            rendered[size] = encode_image(thumbnail, output_format)
+            _cache_thumbnail((key, size, output_format), rendered[size])
+    with _thumbnail_lock:
+        _thumbnail_params[key] = params
+        _thumbnail_params.move_to_end(key)
+        while len(_thumbnail_params) > 4096:
+            _thumbnail_params.popitem(last=False)
+    # What was just rendered, not a re-read: the cache may already have evicted it
+    return rendered or cached
+
+# Placeholder: return a simple SVG
+PLACEHOLDER_KOLAM_SVG = """
+<svg width="200" height="200" viewBox="0 0 200 200" xmlns="http://www.w3.org/2000/svg">
+  <rect x="0" y="0" width="200" height="200" fill="#f0f0f0"/>
+  <circle cx="100" cy="100" r="80" stroke="#333" stroke-width="2" fill="none"/>
+  <text x="50%" y="50%" font-family="sans-serif" font-size="16" fill="#333" text-anchor="middle" alignment-baseline="middle">Generated from Image (Placeholder)</text>
+</svg>
+        """
 
 @app.post("/generate-from-image")
 async def generate_kolam_from_image(request: ImageProcessRequest):
@@ -392,55 +527,118 @@ async def generate_kolam_from_image(request: ImageProcessRequest):
         # Here you would add your image processing logic
         # For now, let's return a simple static SVG or an error indicating it's not implemented
         # In a real scenario, you'd decode the base64 image, process it, and generate a kolam SVG
+        return Response(content=PLACEHOLDER_KOLAM_SVG, media_type="image/svg+xml")
+    except Exception as e:
+        import traceback
+        return Response(content=f"<svg><text x=\"10\" y=\"20\" fill=\"red\">Error: {e}\n{traceback.format_exc()}</text></svg>", media_type="image/svg+xml", status_code=500)
 
-        # Placeholder: return a simple SVG
-        svg_data = """
-<svg width="200" height="200" viewBox="0 0 200 200" xmlns="http://www.w3.org/2000/svg">
-  <rect x="0" y="0" width="200" height="200" fill="#f0f0f0"/>
-  <circle cx="100" cy="100" r="80" stroke="#333" stroke-width="2" fill="none"/>
-  <text x="50%" y="50%" font-family="sans-serif" font-size="16" fill="#333" text-anchor="middle" alignment-baseline="middle">Generated from Image (Placeholder)</text>
-</svg>
-        """
-        return Response(content=svg_data, media_type="image/svg+xml")
+@app.post("/generate-from-image/upload")
+async def generate_kolam_from_upload(request: Request):
+    try:
+        # The placeholder doesn't look at the image: drain the body (enforcing
+        # the size limit) without decoding it
+        try:
+            async with received_upload(request):
+                pass
+        except UploadTooLarge as e:
+            return Response(content=str(e), media_type="text/plain", status_code=413)
+        except ValueError as e:
+            return Response(content=str(e), media_type="text/plain", status_code=400)
+        return Response(content=PLACEHOLDER_KOLAM_SVG, media_type="image/svg+xml")
     except Exception as e:
         import traceback
         return Response(content=f"<svg><text x=\"10\" y=\"20\" fill=\"red\">Error: {e}\n{traceback.format_exc()}</text></svg>", media_type="image/svg+xml", status_code=500)
 
 # Preflight requests are handled automatically by CORSMiddleware
 
+async def stream_tiered_analysis(prepared, template):
+    # Server-sent events for clients that ask for text/event-stream:
+    #   local      -> measured fields, as soon as they are computed
+    #   enrichment -> each of the model's remaining fields (algorithm,
+    #                 culturalSignificance, ...) as soon as the model has written it
+    #   done       -> the merged analysis, same shape as the JSON response
+    #                 ("degraded": true when only the local fields are in it)
+    #   error      -> the model call failed; the local fields still stand
+    local_task = asyncio.ensure_future(run_in_threadpool(analyze_image_locally, prepared))
+    model_events = asyncio.Queue()
+
+    async def read_model():
+        async for event in gemini_analysis_events(prepared, template=template):
+            await model_events.put(event)
+
+    gemini_task = asyncio.ensure_future(read_model())
+    sent = set()
+    try:
+        local_analysis = await local_task
+        yield sse_event("local", {"analysis": local_analysis})
+        while True:
+            event = await model_events.get()
+            if event[0] == "result":
+                gemini_response = event[1]
+                break
+            if event[1] not in local_analysis:
+                sent.add(event[1])
+                yield sse_event("enrichment", {"analysis": {event[1]: event[2]}})
+    finally:
+        # Client went away: don't leave the model call running for nobody
+        gemini_task.cancel()
+
+    if isinstance(gemini_response, Response):
+        yield sse_event("error", error_event(gemini_response))
+        return
+    analysis = gemini_response.get("analysis")
+    if not isinstance(analysis, dict):
+        yield sse_event("error", {"status": 502, "detail": "Model response was not JSON", "analysis": analysis})
+        return
+    enrichment = {key: value for key, value in analysis.items() if key not in local_analysis}
+    # Whatever the incremental parse missed (e.g. a double-encoded answer)
+    remaining = {key: value for key, value in enrichment.items() if key not in sent}
+    if remaining:
+        yield sse_event("enrichment", {"analysis": remaining})
+    done = {"analysis": {**enrichment, **local_analysis}}
+    if gemini_response.get("degraded"):
+        done["degraded"] = True
+    yield sse_event("done", done)
+
+async def kolam_image_analysis(prepared, http_request: Request):
+    template = prompt_template("kolam-analysis")
+    if "text/event-stream" in http_request.headers.get("accept", ""):
+        return StreamingResponse(
+            stream_tiered_analysis(prepared, template),
+            media_type="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        )
+    if generated_design(prepared):
+        return await gemini_analysis(prepared, template=template)
+    # Symmetry, grid and specifications are measured locally (in a worker
+    # thread) while Gemini describes the rest; measured fields take precedence
+    local_analysis, gemini_response = await asyncio.gather(
+        run_in_threadpool(analyze_image_locally, prepared),
+        gemini_analysis(prepared, template=template),
+    )
+    if isinstance(gemini_response, dict) and isinstance(gemini_response.get("analysis"), dict):
+        gemini_response["analysis"].update(local_analysis)
+    return gemini_response
+
 @app.post("/analyze-kolam-image")
-async def analyze_kolam_image(request: ImageProcessRequest):
+async def analyze_kolam_image(request: ImageProcessRequest, http_request: Request):
     try:
-        # The user's requested hardcoded prompt for Kambi Kolam
-        user_prompt = '''
-Analyze the provided Kolam design image. Generate a detailed mathematical and cultural analysis in JSON format. The JSON must adhere to the following structure and content guidelines, inferring all details from the image:
-
-{
-  "symmetryType": "<Inferred symmetry type, e.g., Mathematical Analysis, D4 Dihedral Symmetry>",
-  "rotationPatterns": [
-    "<Describe specific rotation patterns, e.g., 90-degree Rotational Symmetry, 180-degree Rotational Symmetry>",
-    "<Add more patterns as applicable, or 'No specific pattern found' if none>"
-  ],
-  "gridSystem": "<Inferred grid system, e.g., Pulli Kolam (Kambi Kolam), Square Grid, Hexagonal Grid>",
-  "complexity": "<Inferred complexity level: e.g., Beginner, Intermediate, Advanced>",
-  "specifications": {
-    "dimensions": "<Image dimensions, e.g., 500 x 500 pixels>",
-    "dotCount": <Inferred dot count, or 0 if N/A>,
-    "lineLength": "<Estimated total line length, or 'N/A'>",
-    "strokeWidth": "<Estimated average stroke width, or 'N/A'>"
-  },
-  "algorithm": [
-    "<Step-by-step description of how the Kolam appears to be constructed>",
-    "<Add more steps as detailed as possible>"
-  ],
-  "culturalSignificance": "<Detailed explanation of the cultural significance and symbolism of the Kolam design, its elements, and its context>"
-}
+        try:
+            prepared = await run_in_threadpool(prepare_image_data, request.image)
+        except ImageTooLarge as e:
+            return Response(content=str(e), media_type="text/plain", status_code=413)
+        return await kolam_image_analysis(prepared, http_request)
+    except Exception as e:
+        import traceback
+        return Response(content=f"Error: {e}\n{traceback.format_exc()}", media_type="text/plain", status_code=500)
 
-For `symmetryType`, provide a precise mathematical description if identifiable. For `rotationPatterns`, list all identifiable rotational and reflectional symmetries. For `gridSystem`, identify the underlying grid structure. For `complexity`, assign a level based on intricacy. For `specifications`, infer these details from the image; provide 'N/A' for strings or 0 for numbers if exact values cannot be determined. For `algorithm`, describe the likely construction method. For `culturalSignificance`, give a comprehensive cultural context. Ensure all arrays are populated with relevant information or a single 'N/A' entry if no patterns are found. Do not include any additional text outside the JSON object.
-        '''
-        # Call the Gemini analysis endpoint with the image and prompt
-        gemini_response = await gemini_analyze_image(GeminiAnalysisRequest(image_data=request.image, prompt=user_prompt))
-        return gemini_response
+@app.post("/analyze-kolam-image/upload")
+async def analyze_kolam_upload(request: Request):
+    try:
+        prepared, _ = await receive_prepared_upload(request)
+        if isinstance(prepared, Response):
+            return prepared
+        return await kolam_image_analysis(prepared, request)
     except Exception as e:
         import traceback
         return Response(content=f"Error: {e}\n{traceback.format_exc()}", media_type="text/plain", status_code=500)
@@ -448,21 +646,184 @@ For `symmetryType`, provide a precise mathematical description if identifiable.
 # Preflight requests are handled automatically by CORSMiddleware
 
 @app.post("/generate-kolam-svg")
-async def generate_kolam_design(params: KolamParameters):
+async def generate_kolam_design(params: KolamParameters, request: Request, format: str | None = None, size: int | None = Query(None, ge=16, le=MAX_RASTER_SIZE)):
     try:
-        if params.design_type == "lsystem":
-            svg_data = generate_lsystem_kolam_svg(params)
-        elif params.design_type == "suzhi":
-            svg_data = generate_suzhi_kolam_svg(params)
-        elif params.design_type == "kambi":
-            svg_data = generate_kambi_kolam_svg(params)
-        elif params.design_type == "grouptheory":
-            svg_data = generate_grouptheory_kolam_svg(params)
-        else:
+        output_format = negotiate_output_format(format, request.headers.get("accept"))
+        if output_format is None:
+            supported = ", ".join(["svg"] + [name for name in RASTER_FORMATS if raster_format_available(name)])
+            return Response(content=f"Unsupported output format. Supported formats: {supported}", media_type="text/plain", status_code=406)
+
+        geometry = build_kolam_geometry(params)
+        if geometry is None:
             return Response(content=f"<svg><text x=\"10\" y=\"20\" fill=\"red\">Error: Unknown design type {params.design_type}</text></svg>", media_type="image/svg+xml", status_code=400)
-        return Response(content=svg_data, media_type="image/svg+xml")
+
+        headers = {"Vary": "Accept"}
+        if output_format == "svg":
+            if geometry_spilled(geometry):
+                # Too big for RAM: stream the markup straight off the mapped columns
+                return StreamingResponse(iter_svg(geometry), media_type="image/svg+xml", headers=headers)
+            return Response(content=geometry_to_svg(geometry), media_type="image/svg+xml", headers=headers)
+
+        image_data = await run_in_threadpool(render_kolam_raster, geometry, size, output_format)
+        return Response(content=image_data, media_type=RASTER_FORMATS[output_format][1], headers=headers)
     except Exception as e:
         import traceback
         return Response(content=f"<svg><text x=\"10\" y=\"20\" fill=\"red\">Error: {e}\n{traceback.format_exc()}</text></svg>", media_type="image/svg+xml", status_code=500)
 
 # Preflight requests are handled automatically by CORSMiddleware
+
+@app.post("/generate-kolam-thumbnails")
+async def generate_kolam_thumbnails(params: KolamParameters, sizes: str = ",".join(map(str, THUMBNAIL_SIZES)), format: str = "webp"):
+    try:
+        output_format = format.lower()
+        if not raster_format_available(output_format):
+            return Response(content=f"Unsupported thumbnail format: {format}", media_type="text/plain", status_code=406)
+        try:
+            size_list = sorted({int(size) for size in sizes.split(",") if size.strip()})
+        except ValueError:
+            return Response(content=f"Invalid sizes: {sizes}", media_type="text/plain", status_code=400)
+        if not size_list or size_list[0] < 16 or size_list[-1] > MAX_RASTER_SIZE:
+            return Response(content=f"Thumbnail sizes must be between 16 and {MAX_RASTER_SIZE}", media_type="text/plain", status_code=400)
+        if build_kolam_geometry(params) is None:
+            return Response(content=f"Error: Unknown design type {params.design_type}", media_type="text/plain", status_code=400)
+
+        key = kolam_design_key(params)
+        await run_in_threadpool(ensure_thumbnails, key, params, size_list, output_format)
+        return {
+            "key": key,
+            "format": output_format,
+            "thumbnails": {str(size): f"/kolam-thumbnails/{key}/{size}.{output_format}" for size in size_list},
+        }
+    except Exception as e:
+        import traceback
+        return Response(content=f"Error: {e}\n{traceback.format_exc()}", media_type="text/plain", status_code=500)
+
+@app.get("/kolam-thumbnails/{key}/{size}.{output_format}")
+async def get_kolam_thumbnail(key: str, size: int, output_format: str):
+    if output_format not in RASTER_FORMATS:
+        return Response(content=f"Unsupported thumbnail format: {output_format}", media_type="text/plain", status_code=406)
+    data = _cached_thumbnail((key, size, output_format))
+    if data is None:
+        # Evicted: re-render from the remembered parameters if we still have them
+        with _thumbnail_lock:
+            params = _thumbnail_params.get(key)
+        if params is None or not 16 <= size <= MAX_RASTER_SIZE or not raster_format_available(output_format):
+            return Response(content="Thumbnail not found", media_type="text/plain", status_code=404)
+        sizes = sorted(set(THUMBNAIL_SIZES) | {size})
+        data = (await run_in_threadpool(ensure_thumbnails, key, params, sizes, output_format))[size]
+    return Response(content=data, media_type=RASTER_FORMATS[output_format][1],
+                    headers={"Cache-Control": "public, max-age=31536000, immutable"})
+
+# Bulk jobs: a .zip of kolam images is uploaded once and analysed in the
+# background (see kolam_batch); progress is polled and results fetched when
+# done. Everything a job needs lives in its own directory, so a job cut short
+# by a restart is resumed from its checkpoint.
+BATCH_DIR = os.getenv("KOLAM_BATCH_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "batch_jobs"))
+MAX_ARCHIVE_BYTES = int(os.getenv("KOLAM_MAX_ARCHIVE_BYTES", 2 << 30))
+# job id -> (BatchJob, task) for jobs started by this process
+batch_jobs = {}
+
+def batch_job_paths(job_id):
+    job_dir = os.path.join(BATCH_DIR, job_id)
+    with open(os.path.join(job_dir, "job.json")) as f:
+        output_format = json.load(f)["format"]
+    return {
+        "archive": os.path.join(job_dir, "archive.zip"),
+        "checkpoint": os.path.join(job_dir, "checkpoint.sqlite3"),
+        "output": os.path.join(job_dir, f"results.{output_format}"),
+        "format": output_format,
+    }
+
+def save_upload(file, path):
+    file.seek(0)
+    with open(path, "wb") as f:
+        shutil.copyfileobj(file, f)
+
+def start_batch_job(job_id):
+    paths = batch_job_paths(job_id)
+    if job_id in batch_jobs:
+        # Resumed: the finished run's checkpoint connection is done with
+        batch_jobs[job_id][0].close()
+    job = BatchJob(paths["archive"], paths["checkpoint"], cache=analysis_cache)
+    task = asyncio.ensure_future(job.run(paths["output"], paths["format"]))
+    # Failures are reported through the job's status
+    task.add_done_callback(lambda done: done.cancelled() or done.exception())
+    batch_jobs[job_id] = (job, task)
+    return job
+
+def find_batch_job(job_id):
+    # -> the running (or finished) job, None for one left by an earlier process
+    if not re.fullmatch(r"[0-9a-f]{32}", job_id) or not os.path.isdir(os.path.join(BATCH_DIR, job_id)):
+        raise KeyError(job_id)
+    entry = batch_jobs.get(job_id)
+    return entry[0] if entry else None
+
+def batch_job_status(job_id):
+    job = find_batch_job(job_id)
+    if job is None:
+        # Left by an earlier process: read its checkpoint without opening a job
+        paths = batch_job_paths(job_id)
+        status = "done" if os.path.exists(paths["output"]) else "interrupted"
+        return {"id": job_id, "status": status, "error": None, "total": None, **checkpoint_counts(paths["checkpoint"])}
+    return {"id": job_id, **job.progress()}
+
+@app.post("/batch-jobs")
+async def create_batch_job(request: Request, format: str = "jsonl"):
+    # A .zip of images, as the raw body or a multipart "file" field
+    if not output_format_available(format):
+        return Response(content=f"Unsupported results format: {format}", media_type="text/plain", status_code=400)
+    job_id = uuid.uuid4().hex
+    job_dir = os.path.join(BATCH_DIR, job_id)
+    try:
+        os.makedirs(job_dir)
+        async with received_upload(request, MAX_ARCHIVE_BYTES) as (_, file, _fields):
+            archive = os.path.join(job_dir, "archive.zip")
+            await run_in_threadpool(save_upload, file, archive)
+        if not zipfile.is_zipfile(archive):
+            raise ValueError("Upload is not a .zip archive")
+        with open(os.path.join(job_dir, "job.json"), "w") as f:
+            json.dump({"format": format}, f)
+        job = start_batch_job(job_id)
+        return JSONResponse({"id": job_id, **job.progress()}, status_code=202)
+    except (UploadTooLarge, ValueError) as e:
+        shutil.rmtree(job_dir, ignore_errors=True)
+        return Response(content=str(e), media_type="text/plain", status_code=413 if isinstance(e, UploadTooLarge) else 400)
+    except Exception as e:
+        import traceback
+        shutil.rmtree(job_dir, ignore_errors=True)
+        return Response(content=f"Error creating batch job: {e}\n{traceback.format_exc()}", media_type="text/plain", status_code=500)
+
+@app.get("/batch-jobs/{job_id}")
+async def get_batch_job(job_id: str):
+    try:
+        return await run_in_threadpool(batch_job_status, job_id)
+    except (KeyError, FileNotFoundError):
+        # FileNotFoundError: a job directory whose creation failed halfway
+        return Response(content="Batch job not found", media_type="text/plain", status_code=404)
+
+@app.post("/batch-jobs/{job_id}/resume")
+async def resume_batch_job(job_id: str):
+    # Picks up an interrupted or failed job where its checkpoint left off
+    try:
+        job = find_batch_job(job_id)
+    except KeyError:
+        return Response(content="Batch job not found", media_type="text/plain", status_code=404)
+    if job is not None and not batch_jobs[job_id][1].done():
+        return Response(content="Batch job is still running", media_type="text/plain", status_code=409)
+    try:
+        job = start_batch_job(job_id)
+    except FileNotFoundError:
+        return Response(content="Batch job not found", media_type="text/plain", status_code=404)
+    return JSONResponse({"id": job_id, **job.progress()}, status_code=202)
+
+@app.get("/batch-jobs/{job_id}/results")
+async def get_batch_job_results(job_id: str):
+    try:
+        status = await run_in_threadpool(batch_job_status, job_id)
+    except (KeyError, FileNotFoundError):
+        return Response(content="Batch job not found", media_type="text/plain", status_code=404)
+    if status["status"] != "done":
+        return JSONResponse(status, status_code=409)
+    paths = batch_job_paths(job_id)
+    media_type = "application/x-ndjson" if paths["format"] == "jsonl" else "application/vnd.apache.parquet"
+    return FileResponse(paths["output"], media_type=media_type, filename=f"kolam-analysis-{job_id}.{paths['format']}")
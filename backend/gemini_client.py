@@ -0,0 +1,404 @@
+import asyncio
+import os
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+import google.generativeai as genai
+from google.api_core import exceptions as google_exceptions
+from google.generativeai import caching
+
+from gemini_quota import INTERACTIVE, estimate_tokens, scheduler
+
+# Process-wide, non-blocking access to the Gemini model.
+#
+# One GenerativeModel (and with it one transport) is shared by every request.
+# Calls go through the SDK's async API when it has one, otherwise through a
+# small dedicated thread pool, so the event loop keeps serving other users
+# while a call is in flight. A semaphore caps in-flight calls and transient
+# failures are retried with jittered exponential backoff via asyncio.sleep.
+#
+# Prompt templates (see kolam_prompts) get a model of their own carrying the
+# template's fixed instruction block and response schema. When the block is
+# long enough for the API's context cache it is uploaded once as cached
+# content and every call only sends the image and the short per-call prompt;
+# otherwise (too short, or caching unsupported) it is sent with each call.
+#
+# stream_content yields the response text as the model produces it, so
+# callers can act on the first fields long before the full answer is in.
+#
+# Tail latency: when a streamed call hasn't produced its first chunk after the
+# recent p95 time-to-first-chunk, an identical hedge call is started and
+# whichever answers first is used (the other is cancelled), so one slow
+# backend replica no longer sets the response time. A circuit breaker counts
+# consecutive failed calls; once open, calls fail fast with CircuitOpen
+# (callers fall back to local-only analysis) until a probe call succeeds.
+#
+# Every call, retries included, first waits for its share of the RPM/TPM
+# quota (see gemini_quota); hedges only run on spare quota.
+#
+# GEMINI_API_ENDPOINT points the SDK's REST transport at another server, e.g.
+# gemini_stub for injecting latency and errors.
+
+GEMINI_MODEL = os.getenv("GEMINI_MODEL", "gemini-2.5-flash")
+MAX_CONCURRENT_CALLS = int(os.getenv("GEMINI_MAX_CONCURRENT_CALLS", 4))
+RETRIES = 3
+BACKOFF_BASE = 0.5
+BACKOFF_MAX = 8.0
+PROMPT_CACHE = os.getenv("GEMINI_PROMPT_CACHE", "1") != "0"
+PROMPT_CACHE_TTL = 3600
+# The API refuses to cache fewer input tokens than this (~4 characters each)
+PROMPT_CACHE_MIN_TOKENS = 1024
+# What the SDK says when it can't express a template's options (an unknown
+# response_schema field, or a version without system_instruction)
+REJECTED_OPTION_MESSAGES = ("for Schema", "response_schema", "response_mime_type", "system_instruction")
+GEMINI_API_ENDPOINT = os.getenv("GEMINI_API_ENDPOINT")
+HEDGING = os.getenv("GEMINI_HEDGE", "1") != "0"
+HEDGE_QUANTILE = 0.95
+# Hedge delay until LATENCY_MIN_SAMPLES first-chunk times have been seen
+HEDGE_DEFAULT_DELAY = 4.0
+LATENCY_WINDOW = 200
+LATENCY_MIN_SAMPLES = 20
+BREAKER_FAILURES = int(os.getenv("GEMINI_BREAKER_FAILURES", 5))
+BREAKER_RESET_SECONDS = float(os.getenv("GEMINI_BREAKER_RESET_SECONDS", 30))
+# The SDK's own retry (up to 10 minutes on 503s) is switched off: retries,
+# hedges and the breaker here need to see each failure as it happens
+REQUEST_OPTIONS = {"retry": None}
+
+_model = None
+_model_lock = threading.Lock()
+# template id -> (model, time after which it is rebuilt)
+_template_models = {}
+_call_slots = asyncio.Semaphore(MAX_CONCURRENT_CALLS)
+# A call abandoned by a cancelled request or a lost hedge still holds its
+# thread until the SDK returns: room for one such call per slot, no more
+_executor = ThreadPoolExecutor(max_workers=2 * MAX_CONCURRENT_CALLS, thread_name_prefix="gemini")
+
+
+class CircuitOpen(Exception):
+    pass
+
+
+class UnsupportedRequest(Exception):
+    # The API or SDK refused the request itself (e.g. structured output or a
+    # system instruction not accepted): it will never work, so it is neither
+    # retried nor counted by the breaker; callers may try a simpler template
+    pass
+
+
+# Errors that mean "this request will never work", not "try again"
+UNSUPPORTED_REQUEST_ERRORS = (UnsupportedRequest,)
+
+
+def rejected_options(err):
+    return isinstance(err, (TypeError, ValueError)) and any(message in str(err) for message in REJECTED_OPTION_MESSAGES)
+
+
+class LatencyTracker:
+    # Sliding window of recent durations
+    def __init__(self, window=LATENCY_WINDOW):
+        self.samples = deque(maxlen=window)
+
+    def record(self, seconds):
+        self.samples.append(seconds)
+
+    def quantile(self, q):
+        if len(self.samples) < LATENCY_MIN_SAMPLES:
+            return None
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class CircuitBreaker:
+    # Closed until `failures` calls in a row fail; then open (allow() is
+    # False) for `reset_after` seconds, after which a single call is let
+    # through as a probe. Its success closes the breaker, its failure (or no
+    # verdict at all, e.g. a cancelled probe) keeps it open another period.
+    def __init__(self, failures=BREAKER_FAILURES, reset_after=BREAKER_RESET_SECONDS):
+        self.threshold = failures
+        self.reset_after = reset_after
+        self.failures = 0
+        self.opened_at = None
+        self.lock = threading.Lock()
+
+    @property
+    def is_open(self):
+        return self.opened_at is not None
+
+    def allow(self):
+        with self.lock:
+            if self.opened_at is None:
+                return True
+            now = time.monotonic()
+            if now - self.opened_at < self.reset_after:
+                return False
+            self.opened_at = now
+            return True
+
+    def record_success(self):
+        with self.lock:
+            self.failures = 0
+            self.opened_at = None
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.failures >= self.threshold:
+                self.opened_at = time.monotonic()
+
+
+breaker = CircuitBreaker()
+first_chunk_latency = LatencyTracker()
+
+
+def configure(api_key):
+    if GEMINI_API_ENDPOINT:
+        genai.configure(api_key=api_key, transport="rest", client_options={"api_endpoint": GEMINI_API_ENDPOINT})
+    else:
+        genai.configure(api_key=api_key)
+
+
+def get_model():
+    global _model
+    if _model is None:
+        with _model_lock:
+            if _model is None:
+                _model = genai.GenerativeModel(GEMINI_MODEL)
+    return _model
+
+
+def _build_template_model(template, now):
+    try:
+        return _template_model_entry(template, now)
+    except (TypeError, ValueError) as err:
+        if rejected_options(err):
+            raise UnsupportedRequest(str(err)) from err
+        raise
+
+
+def _template_model_entry(template, now):
+    generation_config = None
+    if template.get("response_schema"):
+        generation_config = genai.GenerationConfig(response_mime_type="application/json", response_schema=template["response_schema"])
+    instruction = template.get("system_instruction")
+    if PROMPT_CACHE and instruction and len(instruction) / 4 >= PROMPT_CACHE_MIN_TOKENS:
+        try:
+            cached = caching.CachedContent.create(
+                model=f"models/{GEMINI_MODEL}",
+                display_name=template["id"],
+                system_instruction=instruction,
+                ttl=timedelta(seconds=PROMPT_CACHE_TTL),
+            )
+            # Rebuilt a minute before the cache entry expires server-side
+            return genai.GenerativeModel.from_cached_content(cached, generation_config=generation_config), now + PROMPT_CACHE_TTL - 60
+        except Exception:
+            pass
+    # Uncached: rebuilt after the same interval, which retries the cache
+    return genai.GenerativeModel(GEMINI_MODEL, system_instruction=instruction, generation_config=generation_config), now + PROMPT_CACHE_TTL
+
+
+def template_model(template):
+    now = time.time()
+    with _model_lock:
+        entry = _template_models.get(template["id"])
+        if entry is None or entry[1] <= now:
+            entry = _build_template_model(template, now)
+            _template_models[template["id"]] = entry
+        return entry[0]
+
+
+def backoff_delay(attempt):
+    # "Full jitter": uniform over the exponential window, so clients that
+    # failed together don't retry together
+    return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt))
+
+
+def _async_api(model):
+    # The REST transport has no async client
+    return None if GEMINI_API_ENDPOINT else getattr(model, "generate_content_async", None)
+
+
+async def _call_once(model, contents, **kwargs):
+    kwargs.setdefault("request_options", REQUEST_OPTIONS)
+    generate_async = _async_api(model)
+    if generate_async is not None:
+        return await generate_async(contents, **kwargs)
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor, lambda: model.generate_content(contents, **kwargs))
+
+
+async def _resolve_model(template):
+    if template is None:
+        return get_model()
+    # May create server-side cached content: a network call, kept off the loop
+    return await asyncio.get_running_loop().run_in_executor(_executor, template_model, template)
+
+
+def _record_failure(err):
+    breaker.record_failure()
+    if isinstance(err, google_exceptions.ResourceExhausted):
+        scheduler.exhausted()
+
+
+async def generate_content(contents, template=None, retries=RETRIES, priority=INTERACTIVE, **kwargs):
+    model = await _resolve_model(template)
+    tokens = estimate_tokens(contents, template)
+    last_error = None
+    for attempt in range(retries):
+        if not breaker.allow():
+            raise CircuitOpen("Gemini circuit breaker is open")
+        await scheduler.acquire(tokens, priority)
+        try:
+            async with _call_slots:
+                response = await _call_once(model, contents, **kwargs)
+            breaker.record_success()
+            return response
+        except google_exceptions.BadRequest as err:
+            # A 400: InvalidArgument over gRPC, plain BadRequest over REST
+            raise UnsupportedRequest(str(err)) from err
+        except Exception as err:
+            _record_failure(err)
+            last_error = err
+            if attempt + 1 < retries:
+                await asyncio.sleep(backoff_delay(attempt))
+    raise last_error
+
+
+def _chunk_text(chunk):
+    # Chunks without text parts (finish reason, safety ratings) raise on .text
+    try:
+        return chunk.text or ""
+    except ValueError:
+        return ""
+
+
+async def _stream_once(model, contents, **kwargs):
+    kwargs.setdefault("request_options", REQUEST_OPTIONS)
+    generate_async = _async_api(model)
+    if generate_async is not None:
+        response = await generate_async(contents, stream=True, **kwargs)
+        async for chunk in response:
+            text = _chunk_text(chunk)
+            if text:
+                yield text
+        return
+    # Blocking SDK: iterate the stream on a pool thread and hand chunks over
+    loop = asyncio.get_running_loop()
+    chunks = asyncio.Queue()
+    abandoned = threading.Event()
+
+    def pump():
+        try:
+            for chunk in model.generate_content(contents, stream=True, **kwargs):
+                if abandoned.is_set():
+                    return
+                loop.call_soon_threadsafe(chunks.put_nowait, (chunk, None))
+            loop.call_soon_threadsafe(chunks.put_nowait, (None, None))
+        except Exception as err:
+            loop.call_soon_threadsafe(chunks.put_nowait, (None, err))
+
+    loop.run_in_executor(_executor, pump)
+    try:
+        while True:
+            chunk, error = await chunks.get()
+            if error is not None:
+                raise error
+            if chunk is None:
+                return
+            text = _chunk_text(chunk)
+            if text:
+                yield text
+    finally:
+        abandoned.set()
+
+
+def hedge_delay():
+    return first_chunk_latency.quantile(HEDGE_QUANTILE) or HEDGE_DEFAULT_DELAY
+
+
+async def _tracked_stream(model, contents, kwargs):
+    # One call: holds a slot, and feeds the latency tracker and the breaker.
+    # A call cancelled before answering (a losing hedge) counts as neither.
+    async with _call_slots:
+        started, answered = time.monotonic(), False
+        try:
+            async for text in _stream_once(model, contents, **kwargs):
+                if not answered:
+                    answered = True
+                    first_chunk_latency.record(time.monotonic() - started)
+                    breaker.record_success()
+                yield text
+        except google_exceptions.BadRequest as err:
+            raise UnsupportedRequest(str(err)) from err
+        except Exception as err:
+            _record_failure(err)
+            raise
+
+
+async def _hedged_stream(model, contents, tokens, kwargs):
+    # Streams from the first of up to two identical calls to produce a chunk;
+    # the second starts only once the first has been silent for hedge_delay()
+    streams = [_tracked_stream(model, contents, kwargs)]
+    pending = {asyncio.ensure_future(streams[0].__anext__()): streams[0]}
+    winner = first = None
+    try:
+        while winner is None:
+            hedge = HEDGING and len(streams) == 1
+            done, _ = await asyncio.wait(pending, timeout=hedge_delay() if hedge else None, return_when=asyncio.FIRST_COMPLETED)
+            if not done:
+                if breaker.allow() and scheduler.try_acquire(tokens):
+                    streams.append(_tracked_stream(model, contents, kwargs))
+                    pending[asyncio.ensure_future(streams[1].__anext__())] = streams[1]
+                else:
+                    # Keep waiting on the first call alone
+                    streams.append(None)
+                continue
+            task = done.pop()
+            stream = pending.pop(task)
+            try:
+                first = task.result()
+                winner = stream
+            except StopAsyncIteration:
+                winner = stream
+            except Exception:
+                # The other call may still answer
+                if not pending:
+                    raise
+    finally:
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+        for stream in streams:
+            if stream is not None and stream is not winner:
+                await stream.aclose()
+    if first is not None:
+        yield first
+    async for text in winner:
+        yield text
+
+
+async def stream_content(contents, template=None, retries=RETRIES, priority=INTERACTIVE, **kwargs):
+    # Like generate_content, but yields text chunks as they arrive. Only a
+    # failure before the first chunk is retried: after that the caller has
+    # already acted on part of the answer.
+    model = await _resolve_model(template)
+    tokens = estimate_tokens(contents, template)
+    for attempt in range(retries):
+        if not breaker.allow():
+            raise CircuitOpen("Gemini circuit breaker is open")
+        await scheduler.acquire(tokens, priority)
+        started = False
+        try:
+            async for text in _hedged_stream(model, contents, tokens, kwargs):
+                started = True
+                yield text
+            return
+        except UNSUPPORTED_REQUEST_ERRORS:
+            raise
+        except Exception:
+            if started or attempt + 1 >= retries:
+                raise
+        await asyncio.sleep(backoff_delay(attempt))
@@ -0,0 +1,163 @@
+import asyncio
+import heapq
+import io
+import itertools
+import math
+import os
+import time
+
+from PIL import Image
+
+# Client-side pacing of Gemini calls to the project's rate limits.
+#
+# Two token buckets, one per quota (requests per minute, input tokens per
+# minute), each holding up to a minute's worth and refilling continuously.
+# Calls wait in a priority queue (interactive before bulk, then first come
+# first served) and are released as soon as both buckets can cover them, so a
+# burst is spread over the quota instead of turning into a wall of 429s from
+# the API. A caller whose predicted wait exceeds its limit is refused at once
+# with QuotaExceeded, carrying how long to wait before retrying.
+
+# Tier 1 limits for gemini-2.5-flash; set to the project's actual quota
+GEMINI_RPM = int(os.getenv("GEMINI_RPM", 1000))
+GEMINI_TPM = int(os.getenv("GEMINI_TPM", 1_000_000))
+# Longest an interactive request may queue before it is refused
+MAX_QUEUE_WAIT = float(os.getenv("GEMINI_MAX_QUEUE_WAIT", 10))
+INTERACTIVE = 0
+BULK = 1
+# Per priority; bulk work (archive jobs) just waits its turn
+MAX_QUEUE_WAITS = {INTERACTIVE: MAX_QUEUE_WAIT, BULK: None}
+
+# Gemini bills an image of at most 384 px a side as one tile, larger ones
+# per 768 px tile; text at roughly four characters a token
+IMAGE_TILE_TOKENS = 258
+SMALL_IMAGE_SIDE = 384
+IMAGE_TILE_SIDE = 768
+CHARS_PER_TOKEN = 4
+
+
+class QuotaExceeded(Exception):
+    def __init__(self, retry_after):
+        super().__init__(f"Gemini quota exhausted; retry in {retry_after:.1f}s")
+        self.retry_after = retry_after
+
+
+def image_tokens(width, height):
+    if max(width, height) <= SMALL_IMAGE_SIDE:
+        return IMAGE_TILE_TOKENS
+    return math.ceil(width / IMAGE_TILE_SIDE) * math.ceil(height / IMAGE_TILE_SIDE) * IMAGE_TILE_TOKENS
+
+
+def estimate_tokens(contents, template=None):
+    # Input tokens of a call (the per-minute token quota counts input only):
+    # text parts by length, image parts ({"mime_type", "data"} or PIL images)
+    # by tile count from their header, plus the template's instruction block
+    parts = contents if isinstance(contents, (list, tuple)) else [contents]
+    characters, tokens = 0, 0
+    for part in parts:
+        if isinstance(part, str):
+            characters += len(part)
+        elif isinstance(part, Image.Image):
+            tokens += image_tokens(*part.size)
+        elif isinstance(part, dict) and "data" in part:
+            try:
+                tokens += image_tokens(*Image.open(io.BytesIO(part["data"])).size)
+            except Exception:
+                tokens += IMAGE_TILE_TOKENS
+    if template and template.get("system_instruction"):
+        characters += len(template["system_instruction"])
+    return tokens + math.ceil(characters / CHARS_PER_TOKEN)
+
+
+class TokenBucket:
+    def __init__(self, per_minute):
+        self.capacity = per_minute
+        self.rate = per_minute / 60
+        self.level = per_minute
+        self.updated = time.monotonic()
+
+    def refill(self, now):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_for(self, amount, now):
+        # Seconds until `amount` (queued work included) has been refilled
+        self.refill(now)
+        return max(0.0, (amount - self.level) / self.rate)
+
+    def take(self, amount):
+        self.level -= amount
+
+
+class QuotaScheduler:
+    def __init__(self, rpm=GEMINI_RPM, tpm=GEMINI_TPM):
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        # (priority, arrival, tokens, future) of callers waiting their turn
+        self.queue = []
+        self.arrivals = itertools.count()
+        self.timer = None
+
+    def predicted_wait(self, tokens, priority=INTERACTIVE):
+        # Until a new call is released: everything queued at the same or a
+        # higher priority goes first, and the buckets refill at their rate
+        now = time.monotonic()
+        ahead = [entry for entry in self.queue if entry[0] <= priority and not entry[3].done()]
+        return max(
+            self.requests.wait_for(len(ahead) + 1, now),
+            self.tokens.wait_for(sum(entry[2] for entry in ahead) + tokens, now),
+        )
+
+    async def acquire(self, tokens, priority=INTERACTIVE):
+        # Waits for quota for one call of `tokens` input tokens. Raises
+        # QuotaExceeded when that would take longer than the priority's
+        # MAX_QUEUE_WAITS; its retry_after is when the same call would be
+        # accepted.
+        tokens = min(tokens, self.tokens.capacity)
+        max_wait = MAX_QUEUE_WAITS[priority]
+        wait = self.predicted_wait(tokens, priority)
+        if max_wait is not None and wait > max_wait:
+            raise QuotaExceeded(wait - max_wait)
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self.queue, (priority, next(self.arrivals), tokens, future))
+        self._dispatch()
+        # A caller cancelled while queued leaves a done future, skipped below
+        await future
+
+    def try_acquire(self, tokens):
+        # Only spare quota, right now, with nobody waiting (used for hedges)
+        tokens = min(tokens, self.tokens.capacity)
+        now = time.monotonic()
+        if self.queue or self.requests.wait_for(1, now) or self.tokens.wait_for(tokens, now):
+            return False
+        self.requests.take(1)
+        self.tokens.take(tokens)
+        return True
+
+    def exhausted(self):
+        # The API answered 429 after all: its view of the minute wins, so
+        # start refilling requests from empty
+        self.requests.refill(time.monotonic())
+        self.requests.level = min(self.requests.level, 0)
+
+    def _dispatch(self):
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        now = time.monotonic()
+        while self.queue:
+            _, _, tokens, future = self.queue[0]
+            if future.done():
+                heapq.heappop(self.queue)
+                continue
+            wait = max(self.requests.wait_for(1, now), self.tokens.wait_for(tokens, now))
+            if wait > 0:
+                self.timer = asyncio.get_running_loop().call_later(wait, self._dispatch)
+                return
+            heapq.heappop(self.queue)
+            self.requests.take(1)
+            self.tokens.take(tokens)
+            future.set_result(None)
+
+
+scheduler = QuotaScheduler()
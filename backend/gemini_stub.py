@@ -0,0 +1,124 @@
+import asyncio
+import json
+import os
+import random
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+# Stand-in for the Gemini REST API with injectable latency and errors, for
+# exercising gemini_client's hedging and circuit breaker without a key:
+#
+#   uvicorn gemini_stub:app --port 8090
+#   GEMINI_API_ENDPOINT=http://127.0.0.1:8090 uvicorn fastapi_app:app
+#
+# Faults start from the STUB_* variables and can be changed while running:
+#   POST /stub/config {"latency": 0.2, "slow_rate": 0.1, "error_rate": 1}
+#   POST /stub/config {"reject_structured": 1}  (answer 400 to structured output)
+#   GET  /stub/stats  -> calls, slow and failed calls so far
+
+config = {
+    # Seconds before the first chunk
+    "latency": float(os.getenv("STUB_LATENCY", 0.3)),
+    # Fraction of calls that take slow_latency instead
+    "slow_rate": float(os.getenv("STUB_SLOW_RATE", 0)),
+    "slow_latency": float(os.getenv("STUB_SLOW_LATENCY", 10)),
+    # The next this many calls are slow whatever slow_rate says
+    "slow_calls": int(os.getenv("STUB_SLOW_CALLS", 0)),
+    # Fraction of calls answered with error_status after the latency
+    "error_rate": float(os.getenv("STUB_ERROR_RATE", 0)),
+    "error_status": int(os.getenv("STUB_ERROR_STATUS", 503)),
+    # Pause between streamed chunks
+    "chunk_delay": float(os.getenv("STUB_CHUNK_DELAY", 0.05)),
+    # Refuse system instructions and response schemas with 400
+    # INVALID_ARGUMENT, as models and API versions without them do
+    "reject_structured": bool(int(os.getenv("STUB_REJECT_STRUCTURED", 0))),
+}
+stats = {"calls": 0, "slow": 0, "errors": 0, "rejected": 0}
+
+ANSWER = json.dumps({
+    "complexity": "Intermediate",
+    "algorithm": ["Lay out the dot grid", "Loop a single line around every dot", "Close the line where it started"],
+    "culturalSignificance": "A stub answer standing in for the model's description.",
+})
+# Schema types arrive as enum numbers (enum-encoding=int)
+ARRAY_TYPE = 5
+ERROR_STATUS_NAMES = {400: "INVALID_ARGUMENT", 429: "RESOURCE_EXHAUSTED", 500: "INTERNAL", 503: "UNAVAILABLE", 504: "DEADLINE_EXCEEDED"}
+
+app = FastAPI()
+
+
+def candidate(text, finished):
+    content = {"content": {"parts": [{"text": text}], "role": "model"}, "index": 0}
+    if finished:
+        content["finishReason"] = "STOP"
+    return {"candidates": [content]}
+
+
+def error_response(status, message):
+    return JSONResponse({"error": {"code": status, "message": message, "status": ERROR_STATUS_NAMES.get(status, "UNKNOWN")}}, status_code=status)
+
+
+async def injected_fault(body):
+    # Waits out the call's latency; -> an error response or None
+    stats["calls"] += 1
+    if config["reject_structured"] and ("systemInstruction" in body or (body.get("generationConfig") or {}).get("responseSchema")):
+        stats["rejected"] += 1
+        return error_response(400, "Injected by gemini_stub: structured output is not supported")
+    latency = config["latency"]
+    if config["slow_calls"] > 0 or random.random() < config["slow_rate"]:
+        config["slow_calls"] = max(0, config["slow_calls"] - 1)
+        stats["slow"] += 1
+        latency = config["slow_latency"]
+    await asyncio.sleep(latency)
+    if random.random() < config["error_rate"]:
+        stats["errors"] += 1
+        return error_response(config["error_status"], "Injected by gemini_stub")
+    return None
+
+
+async def stream_answer(pieces):
+    # The REST streaming call answers with one JSON array, element by element
+    yield "["
+    for index, piece in enumerate(pieces):
+        if index:
+            await asyncio.sleep(config["chunk_delay"])
+            yield ","
+        yield json.dumps(candidate(piece, index == len(pieces) - 1))
+    yield "]"
+
+
+def answer_for(body):
+    # An array schema (several images per call) gets one answer per image
+    schema = (body.get("generationConfig") or {}).get("responseSchema") or {}
+    if schema.get("type") not in ("ARRAY", "array", ARRAY_TYPE):
+        return ANSWER
+    images = sum("inlineData" in part for content in body.get("contents", []) for part in content.get("parts", []))
+    return "[" + ",".join([ANSWER] * images) + "]"
+
+
+@app.post("/v1beta/models/{call}")
+async def generate(call: str, request: Request):
+    body = await request.json()
+    _, _, method = call.partition(":")
+    fault = await injected_fault(body)
+    if fault is not None:
+        return fault
+    answer = answer_for(body)
+    if method == "streamGenerateContent":
+        pieces = [answer[i:i + 32] for i in range(0, len(answer), 32)]
+        return StreamingResponse(stream_answer(pieces), media_type="application/json")
+    return candidate(answer, True)
+
+
+@app.post("/stub/config")
+async def update_config(changes: dict):
+    for key, value in changes.items():
+        if key in config:
+            config[key] = type(config[key])(value)
+    return config
+
+
+@app.get("/stub/stats")
+async def get_stats():
+    return stats
@@ -0,0 +1,90 @@
+import json
+
+# JSON answers from the model.
+#
+# parse_model_text reads a complete answer. TopLevelFields extracts top-level
+# fields from one that arrives in pieces (a streamed response):
+# feed() takes the next piece of text and returns the (key, value) members of
+# the outer object whose values closed within it, so a caller can forward each
+# field as soon as it is complete instead of waiting for the whole document.
+# Anything before the opening brace (a ```json fence, a "json " prefix) is
+# skipped. The scanner only tracks string/escape state and nesting depth, so
+# each character is looked at once however the text is split.
+
+
+def parse_model_text(text):
+    # The model's answer with any ```json fence or "json " prefix removed,
+    # parsed when it is JSON (also when double-encoded as a JSON string)
+    text = (text or "").strip()
+    if text.startswith("json "):
+        text = text[len("json "):]
+    if text.startswith("```json"):
+        text = text[len("```json\n"):].strip()
+    if text.endswith("```"):
+        text = text[:-3].strip()
+    try:
+        parsed = json.loads(text) if text else {}
+        if isinstance(parsed, str):
+            parsed = json.loads(parsed)
+        return parsed
+    except json.JSONDecodeError:
+        return text
+
+
+class TopLevelFields:
+    def __init__(self):
+        self.buffer = ""
+        self.pos = 0
+        self.depth = 0
+        self.in_string = False
+        self.escape = False
+        self.key_start = None
+        self.key = None
+        self.value_start = None
+        self.closed = False
+
+    def _close_member(self, end, fields):
+        if self.key is not None and self.value_start is not None:
+            try:
+                fields.append((self.key, json.loads(self.buffer[self.value_start:end])))
+            except json.JSONDecodeError:
+                # Malformed member: leave it to whoever parses the full text
+                pass
+        self.key_start = self.key = self.value_start = None
+
+    def feed(self, text):
+        self.buffer += text
+        buffer, fields = self.buffer, []
+        i = self.pos
+        while i < len(buffer) and not self.closed:
+            ch = buffer[i]
+            if self.in_string:
+                if self.escape:
+                    self.escape = False
+                elif ch == "\\":
+                    self.escape = True
+                elif ch == '"':
+                    self.in_string = False
+                    if self.depth == 1 and self.key_start is not None and self.key is None:
+                        self.key = json.loads(buffer[self.key_start:i + 1])
+            elif self.depth == 0:
+                if ch == "{":
+                    self.depth = 1
+            elif ch == '"':
+                self.in_string = True
+                if self.depth == 1 and self.key is None:
+                    self.key_start = i
+            elif ch in "{[":
+                self.depth += 1
+            elif ch in "}]":
+                self.depth -= 1
+                if self.depth == 0:
+                    self._close_member(i, fields)
+                    self.closed = True
+            elif self.depth == 1 and ch == ":":
+                self.value_start = i + 1
+            elif self.depth == 1 and ch == ",":
+                self._close_member(i, fields)
+            i += 1
+        self.pos = i
+        return fields
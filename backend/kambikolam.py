@@ -1,4 +1,5 @@
 import turtle
+from kolam_geometry import arc_segment_count
 
 # L-System parameters
 axiom = "FBFBFBFB"  # Initiator
@@ -46,7 +47,7 @@ def draw_line(length):
 
 # Function to draw an arc
 def draw_arc(radius, angle):
-    turtle.circle(radius, angle)
+    turtle.circle(radius, angle, arc_segment_count(radius, angle))
 
 # Prompt the user to enter the dot size and rhombus size
 dot_size = int(input("Enter the dot size: "))
@@ -0,0 +1,761 @@
+import io
+import os
+import re
+from collections import Counter
+import cv2
+import numpy as np
+from PIL import Image, ImageColor, ImageOps
+
+from kolam_geometry import flatten_arcs, flatten_geometry
+from kolam_raster import arc_extents, scale_primitives
+
+# Local, deterministic kolam image analysis.
+#
+# Everything here is measured from the pixels with NumPy/OpenCV, so the fields
+# it fills come back in milliseconds and are identical for identical uploads;
+# only the descriptive fields are left to the language model. SVG uploads
+# read by kolam_svg.read_svg are measured from their primitives instead (see
+# analyze_vectors): no rasterizing, and counts and lengths are exact.
+
+# Longest side an upload is decoded at (matches the Gemini payload size)
+ANALYSIS_SIZE = 1536
+# Uploads with more pixels than this are refused before decoding
+# (decompression bombs); a 48-MP phone photo still fits
+MAX_IMAGE_PIXELS = int(os.getenv("KOLAM_MAX_IMAGE_PIXELS", 50_000_000))
+EXIF_ORIENTATION = 0x0112
+# thumbnail() first shrinks by an integer factor with reduce() until within
+# this factor of the target, then resamples the rest of the way
+REDUCING_GAP = 2.0
+# Side of the centred, downsampled copy the symmetry tests run on
+SYMMETRY_SIZE = 128
+# Largest misalignment (in SYMMETRY_SIZE pixels) a symmetry match may absorb
+SYMMETRY_MAX_SHIFT = 3
+# Normalised correlation above which a rotation/reflection counts as a symmetry
+SYMMETRY_THRESHOLD = 0.75
+# Pixels sampled for colour quantisation, palette size, and the largest
+# per-channel difference at which two palette colours count as one
+COLOR_SAMPLES = 8192
+DOMINANT_COLORS = 5
+COLOR_MERGE_DISTANCE = 24
+# Window (in skeleton pixels) over which line bending is measured
+SMOOTHNESS_WINDOW = 9
+# Points sampled along a vector design's strokes for the symmetry tests, and
+# the share of them a symmetry must map back onto the strokes (exact up to
+# the sampling step, so much stricter than SYMMETRY_THRESHOLD)
+VECTOR_SYMMETRY_SAMPLES = 20_000
+VECTOR_SYMMETRY_THRESHOLD = 0.95
+# Smallest sampling step: the coordinates in kolam_svg's markup are rounded to 0.001
+VECTOR_MIN_STEP = 0.01
+# complexityIndex bounds of the "Intermediate" and "Advanced" levels
+COMPLEXITY_LEVELS = ((0.65, "Advanced"), (0.35, "Intermediate"), (0.0, "Beginner"))
+
+
+class ImageTooLarge(ValueError):
+    pass
+
+
+def open_image(image_bytes):
+    # Header only; refuses decompression bombs before any pixels are decoded.
+    # Takes bytes or a seekable binary file (e.g. a spooled upload).
+    if isinstance(image_bytes, (bytes, bytearray, memoryview)):
+        source = io.BytesIO(image_bytes)
+    else:
+        source = image_bytes
+        source.seek(0)
+    try:
+        image = Image.open(source)
+    except Image.DecompressionBombError as e:
+        raise ImageTooLarge(str(e)) from e
+    if image.width * image.height > MAX_IMAGE_PIXELS:
+        raise ImageTooLarge(f"Image is {image.width} x {image.height} pixels; the limit is {MAX_IMAGE_PIXELS} pixels")
+    return image
+
+
+def load_image(image_bytes, max_side=ANALYSIS_SIZE):
+    # -> (upright RGB image at most max_side on its long side, the upload's
+    # upright (width, height)). The only full decode an upload gets: JPEGs
+    # decode straight at a reduced DCT scale, everything else is shrunk with
+    # reduce() before the final resample.
+    image = open_image(image_bytes)
+    orientation = image.getexif().get(EXIF_ORIENTATION, 1)
+    original_size = image.size[::-1] if orientation in (5, 6, 7, 8) else image.size
+    # Let JPEG decode at a reduced scale straight away when the upload is
+    # huge; draft() keeps both sides at least the requested size
+    scale = max_side / max(image.size)
+    if scale < 1:
+        image.draft("RGB", (int(np.ceil(image.width * scale)), int(np.ceil(image.height * scale))))
+    ImageOps.exif_transpose(image, in_place=True)
+    if image.mode in ("RGBA", "LA", "P"):
+        # Transparent areas read as paper, not ink
+        image = image.convert("RGBA")
+        background = Image.new("RGBA", image.size, (255, 255, 255, 255))
+        image = Image.alpha_composite(background, image)
+    if image.mode != "RGB":
+        image = image.convert("RGB")
+    if max(image.size) > max_side:
+        image.thumbnail((max_side, max_side), Image.BOX, reducing_gap=REDUCING_GAP)
+    return image, original_size
+
+
+def ink_mask(image):
+    gray = np.asarray(image.convert("L"))
+    _, dark = cv2.threshold(gray, 0, 1, cv2.THRESH_BINARY_INV | cv2.THRESH_OTSU)
+    dark = dark.view(bool)
+    # Ink is the minority class: chalk-on-floor photos invert the polarity
+    return dark if np.count_nonzero(dark) <= dark.size // 2 else ~dark
+
+
+def centred_square(mask, size=SYMMETRY_SIZE):
+    # The ink's bounding box, padded to a square around its centre and
+    # box-downsampled to size x size coverage values in [0, 1]
+    rows, cols = np.nonzero(mask.any(axis=1))[0], np.nonzero(mask.any(axis=0))[0]
+    if not len(rows):
+        return None
+    top, bottom, left, right = rows[0], rows[-1] + 1, cols[0], cols[-1] + 1
+    side = max(bottom - top, right - left)
+    square = np.zeros((side, side), dtype=np.uint8)
+    y0, x0 = (side - (bottom - top)) // 2, (side - (right - left)) // 2
+    square[y0:y0 + bottom - top, x0:x0 + right - left] = mask[top:bottom, left:right] * 255
+    small = Image.fromarray(square).resize((size, size), Image.BOX)
+    return np.asarray(small, dtype=np.float32) / 255
+
+
+def _rotate(image, degrees):
+    # Bilinear rotation about the image centre (for the non-right angles)
+    size = image.shape[0]
+    centre = (size - 1) / 2
+    theta = np.radians(degrees)
+    ys, xs = np.mgrid[0:size, 0:size].astype(np.float32) - centre
+    src_x = np.cos(theta) * xs + np.sin(theta) * ys + centre
+    src_y = -np.sin(theta) * xs + np.cos(theta) * ys + centre
+    x0, y0 = np.floor(src_x).astype(np.int64), np.floor(src_y).astype(np.int64)
+    fx, fy = src_x - x0, src_y - y0
+    padded = np.pad(image, 1)
+
+    def sample(y, x):
+        return padded[np.clip(y + 1, 0, size + 1), np.clip(x + 1, 0, size + 1)]
+
+    return ((1 - fy) * ((1 - fx) * sample(y0, x0) + fx * sample(y0, x0 + 1))
+            + fy * ((1 - fx) * sample(y0 + 1, x0) + fx * sample(y0 + 1, x0 + 1)))
+
+
+class _Correlator:
+    # Normalised cross-correlation of one reference image against transformed
+    # copies, maximised over small shifts via one FFT per candidate
+
+    def __init__(self, reference, max_shift=SYMMETRY_MAX_SHIFT):
+        self.shape = (2 * reference.shape[0], 2 * reference.shape[1])
+        self.max_shift = max_shift
+        centred = reference - reference.mean()
+        self.norm = np.sqrt((centred * centred).sum())
+        self.spectrum = np.fft.rfft2(centred, self.shape)
+
+    def score(self, candidate):
+        centred = candidate - candidate.mean()
+        norm = np.sqrt((centred * centred).sum())
+        if self.norm == 0 or norm == 0:
+            return 0.0
+        correlation = np.fft.irfft2(self.spectrum * np.conj(np.fft.rfft2(centred, self.shape)), self.shape)
+        k = self.max_shift
+        # Circular lags -k..k along both axes
+        window = np.concatenate([correlation[:k + 1], correlation[-k:]])
+        window = np.concatenate([window[:, :k + 1], window[:, -k:]], axis=1)
+        return float(np.clip(window.max() / (self.norm * norm), 0.0, 1.0))
+
+
+# (order, transform, description) and (name, transform, description) of the tests
+ROTATIONS = (
+    (2, lambda image: np.rot90(image, 2), "180-degree Rotational Symmetry"),
+    (4, lambda image: np.rot90(image, 1), "90-degree Rotational Symmetry"),
+    (8, lambda image: _rotate(image, 45), "45-degree Rotational Symmetry"),
+)
+REFLECTIONS = (
+    ("vertical", np.fliplr, "Reflection across the vertical axis"),
+    ("horizontal", np.flipud, "Reflection across the horizontal axis"),
+    ("diagonal", np.transpose, "Reflection across the main diagonal"),
+    ("antidiagonal", lambda image: np.rot90(image, 2).T, "Reflection across the anti-diagonal"),
+)
+
+
+def detect_symmetry(mask, threshold=SYMMETRY_THRESHOLD):
+    # Largest rotation order (C2/C4/C8) and the reflections the centred ink
+    # pattern is invariant under -> symmetry group plus a score in [0, 1]
+    square = centred_square(mask)
+    if square is None:
+        return symmetry_group({}, threshold)
+    correlator = _Correlator(square)
+    scores = {}
+    for order, transform, _ in ROTATIONS:
+        scores[f"C{order}"] = correlator.score(transform(square))
+    for name, transform, _ in REFLECTIONS:
+        scores[name] = correlator.score(transform(square))
+    return symmetry_group(scores, threshold)
+
+
+def symmetry_group(scores, threshold):
+    # Group, patterns and overall score from the per-test scores (keyed C2,
+    # C4, C8 and the REFLECTIONS names); no scores -> no drawing, no symmetry
+    if not scores:
+        return {"group": "C1", "order": 1, "reflections": [], "scores": {}, "score": 0.0, "patterns": []}
+    order = 1
+    for candidate, _, _ in ROTATIONS:
+        # C8 needs the 90 and 180 degree turns too, C4 the 180 degree one
+        if all(scores[f"C{o}"] >= threshold for o, _, _ in ROTATIONS if o <= candidate):
+            order = candidate
+    reflections = [name for name, _, _ in REFLECTIONS if scores[name] >= threshold]
+    group = f"{'D' if reflections else 'C'}{order}"
+
+    patterns = [text for o, _, text in ROTATIONS if o <= order and order % o == 0][::-1]
+    patterns += [text for name, _, text in REFLECTIONS if name in reflections]
+    defining = [scores[f"C{o}"] for o, _, _ in ROTATIONS if o <= order] + [scores[name] for name in reflections]
+    # Without any symmetry, report how close the nearest one came
+    score = float(np.mean(defining)) if defining else max(scores["C2"], *(scores[name] for name, _, _ in REFLECTIONS))
+    return {"group": group, "order": order, "reflections": reflections,
+            "scores": {key: round(value, 3) for key, value in scores.items()},
+            "score": round(score, 3), "patterns": patterns}
+
+
+def symmetry_type(group):
+    kind, order = group[0], int(group[1:])
+    if kind == "D":
+        return f"{group} Dihedral Symmetry" if order > 1 else "D1 Bilateral (Mirror) Symmetry"
+    return f"{group} Cyclic (Rotational) Symmetry" if order > 1 else "No Symmetry (C1)"
+
+
+def symmetry_fields(symmetry):
+    # The AnalysisResult fields the detector answers
+    return {
+        "symmetryType": symmetry_type(symmetry["group"]),
+        "rotationPatterns": symmetry["patterns"] or ["No specific pattern found"],
+        "symmetryScore": symmetry["score"],
+    }
+
+
+# Zhang-Suen deletion tables indexed by the 8-neighbour code
+# (bit k set <=> neighbour P(k + 2) is ink, clockwise from north)
+def _thinning_tables():
+    codes = np.arange(256)
+    bits = (codes[:, None] >> np.arange(8)) & 1
+    p2, p3, p4, p5, p6, p7, p8, p9 = bits.T
+    count = bits.sum(axis=1)
+    transitions = ((1 - bits) & np.roll(bits, -1, axis=1)).sum(axis=1)
+    common = (count >= 2) & (count <= 6) & (transitions == 1)
+    first = common & (p2 * p4 * p6 == 0) & (p4 * p6 * p8 == 0)
+    second = common & (p2 * p4 * p8 == 0) & (p2 * p6 * p8 == 0)
+    return first.astype(np.uint8), second.astype(np.uint8)
+
+
+_THINNING_TABLES = _thinning_tables()
+# filter2D kernel that packs the 8 neighbours into one byte (weights 1..128)
+_NEIGHBOUR_KERNEL = np.array([[128, 1, 2], [64, 0, 4], [32, 16, 8]], dtype=np.float32)
+
+
+def skeletonize(mask):
+    # One-pixel-wide centre lines (Zhang-Suen), two table lookups per pass
+    skeleton = np.ascontiguousarray(mask, dtype=np.uint8)
+    while True:
+        changed = False
+        for table in _THINNING_TABLES:
+            # Neighbour sums never exceed 255, so 8-bit output is exact
+            codes = cv2.filter2D(skeleton, -1, _NEIGHBOUR_KERNEL, borderType=cv2.BORDER_CONSTANT)
+            delete = cv2.LUT(codes, table) & skeleton
+            if delete.any():
+                skeleton ^= delete
+                changed = True
+        if not changed:
+            return skeleton.astype(bool)
+
+
+def skeleton_length(skeleton):
+    # Sum of steps between neighbouring skeleton pixels: 1 for edge neighbours,
+    # sqrt(2) for corner neighbours not already joined through an edge neighbour.
+    # An L of three pixels in a 2x2 block is a diagonal step drawn as two edge
+    # steps, so it is charged sqrt(2) rather than 2.
+    s = skeleton
+    right = s[:, :-1] & s[:, 1:]
+    down = s[:-1] & s[1:]
+    diagonal = s[:-1, :-1] & s[1:, 1:] & ~s[:-1, 1:] & ~s[1:, :-1]
+    antidiagonal = s[:-1, 1:] & s[1:, :-1] & ~s[:-1, :-1] & ~s[1:, 1:]
+    corners = (s[:-1, :-1].astype(np.uint8) + s[1:, 1:] + s[:-1, 1:] + s[1:, :-1]) == 3
+    return float(right.sum() + down.sum() + np.sqrt(2) * (diagonal.sum() + antidiagonal.sum())
+                 - (2 - np.sqrt(2)) * corners.sum())
+
+
+def find_dots(mask, stroke_width):
+    # Pulli dots: filled, round, isolated ink blobs (rings and arcs fail the
+    # colour/circularity/convexity tests), larger than a stroke's end cap
+    params = cv2.SimpleBlobDetector_Params()
+    # The mask is already binary: one threshold pass is enough
+    params.minThreshold, params.maxThreshold, params.thresholdStep = 127, 128, 1
+    params.minRepeatability = 1
+    params.filterByColor, params.blobColor = True, 255
+    params.filterByArea = True
+    params.minArea = max(4.0, 0.5 * stroke_width ** 2)
+    params.maxArea = max(params.minArea + 1, mask.size / 400)
+    params.filterByCircularity, params.minCircularity = True, 0.7
+    params.filterByConvexity, params.minConvexity = True, 0.9
+    params.filterByInertia, params.minInertiaRatio = True, 0.5
+    params.minDistBetweenBlobs = max(1.0, stroke_width)
+    detector = cv2.SimpleBlobDetector_create(params)
+    keypoints = detector.detect(mask.astype(np.uint8) * 255)
+    return np.array([(k.pt[0], k.pt[1], k.size / 2) for k in keypoints], dtype=float).reshape(-1, 3)
+
+
+def _row_pattern(points, spacing, axis_angle):
+    # Dot counts per lattice row, rows running along axis_angle
+    theta = np.radians(axis_angle)
+    across = -points[:, 0] * np.sin(theta) + points[:, 1] * np.cos(theta)
+    rows = np.round((across - across.min()) / max(spacing, 1e-9)).astype(np.int64)
+    return np.bincount(rows)[np.bincount(rows) > 0].tolist()
+
+
+def classify_grid(centres):
+    # Lattice from nearest-neighbour vectors: 4-fold angle statistics for
+    # square (0/90 degrees) vs diamond (45/135), 6-fold for triangular
+    if len(centres) < 4:
+        return {"type": "none", "spacing": None, "rows": []}
+    points = centres[:2000, :2]
+    distances = np.hypot(points[:, None, 0] - points[None, :, 0], points[:, None, 1] - points[None, :, 1])
+    np.fill_diagonal(distances, np.inf)
+    spacing = float(np.median(distances.min(axis=1)))
+    near = np.nonzero(distances <= 1.3 * spacing)
+    angles = np.arctan2(points[near[1], 1] - points[near[0], 1], points[near[1], 0] - points[near[0], 0])
+    four_fold = np.exp(4j * angles).mean()
+    six_fold = np.exp(6j * angles).mean()
+    if max(abs(four_fold), abs(six_fold)) < 0.5:
+        return {"type": "irregular", "spacing": spacing, "rows": []}
+    if abs(six_fold) > abs(four_fold):
+        offset = np.degrees(np.angle(six_fold)) / 6
+        return {"type": "triangular", "spacing": spacing, "rows": _row_pattern(points, spacing * np.sqrt(3) / 2, offset)}
+    offset = np.degrees(np.angle(four_fold)) / 4
+    if abs(offset) < 22.5:
+        return {"type": "square", "spacing": spacing, "rows": _row_pattern(points, spacing, offset)}
+    # Diamond lattices are read in horizontal rows, half a diagonal apart
+    return {"type": "diamond", "spacing": spacing, "rows": _row_pattern(points, spacing / np.sqrt(2), 0.0)}
+
+
+def grid_system(grid, dot_count):
+    names = {"square": "Square Grid", "diamond": "Diamond Grid", "triangular": "Triangular Grid"}
+    if grid["type"] == "none":
+        return "Freehand (no dot grid)" if dot_count == 0 else f"Dot Grid ({dot_count} dots)"
+    if grid["type"] == "irregular":
+        return f"Irregular Dot Grid ({dot_count} dots)"
+    rows = grid["rows"]
+    if grid["type"] == "square" and len(set(rows)) == 1:
+        layout = f"{len(rows)} x {rows[0]} dots"
+    elif len(rows) <= 12:
+        layout = "-".join(map(str, rows)) + " dots"
+    else:
+        layout = f"{dot_count} dots"
+    return f"{names[grid['type']]} (Pulli Kolam, {layout})"
+
+
+def structural_metrics(mask, scale=1.0):
+    # Dots, stroke width and line length in analysis pixels; `scale` maps them
+    # back to the upload's own pixels for reporting. Works on the ink's
+    # bounding box, so coordinates are relative to it.
+    rows, cols = np.nonzero(mask.any(axis=1))[0], np.nonzero(mask.any(axis=0))[0]
+    if len(rows):
+        mask = mask[max(rows[0] - 1, 0):rows[-1] + 2, max(cols[0] - 1, 0):cols[-1] + 2]
+    ink = mask.astype(np.uint8)
+    distance = cv2.distanceTransform(ink, cv2.DIST_L2, 5)
+    # Local maxima of the distance transform form the medial ridge, where a
+    # pixel sits half a stroke from either edge. Distances run to the nearest
+    # paper pixel's centre, which lands on average a quarter pixel past the edge.
+    ridge = (distance >= cv2.dilate(distance, np.ones((3, 3), np.uint8))) & mask
+    widths = 2 * distance[ridge] - 0.5
+    stroke_width = float(np.median(widths)) if len(widths) else 0.0
+
+    # Thin at a resolution where strokes are ~3 px wide: same centre lines,
+    # a fraction of the pixels and thinning passes
+    factor = max(1, int(round(stroke_width / 3)))
+    if factor > 1:
+        small = cv2.resize(ink * 255, (ink.shape[1] // factor, ink.shape[0] // factor), interpolation=cv2.INTER_AREA)
+        ink = (small > 127).astype(np.uint8)
+    skeleton = skeletonize(ink)
+
+    dots = find_dots(mask, stroke_width)
+    lines = skeleton.copy()
+    for x, y, radius in dots / factor:
+        cv2.circle(lines.view(np.uint8), (int(round(x)), int(round(y))), int(np.ceil(radius + stroke_width / factor)), 0, -1)
+    return {
+        "skeleton": skeleton,
+        "skeleton_scale": factor,
+        "lines": lines,
+        "scale": scale,
+        "ink_area": mask.size,
+        "widths": widths,
+        "stroke_width": stroke_width * scale,
+        "line_length": skeleton_length(lines) * factor * scale,
+        "dots": dots,
+        "grid": classify_grid(dots),
+    }
+
+
+def structure_fields(structure, original_size):
+    width, height = original_size
+    dot_count = len(structure["dots"])
+    return {
+        "gridSystem": grid_system(structure["grid"], dot_count),
+        "specifications": {
+            "dimensions": f"{width} x {height} pixels",
+            "dotCount": dot_count,
+            "lineLength": f"Approx. {structure['line_length']:.0f} px" if structure["line_length"] else "N/A",
+            "strokeWidth": f"{structure['stroke_width']:.1f}px" if structure["stroke_width"] else "N/A",
+        },
+    }
+
+
+def color_metrics(image):
+    # Palette of COLOR_SAMPLES pixels drawn from the whole image (a thumbnail
+    # would average thin strokes into paper-grey), most common first, and the
+    # spread of their chroma (Lab a*/b*): 0 for black-on-white line art
+    pixels = np.asarray(image).reshape(-1, 3)
+    rng = np.random.default_rng(0)
+    sample = pixels[rng.integers(0, len(pixels), min(COLOR_SAMPLES, len(pixels)))]
+    # Median cut seeds k-means; a few Lloyd steps pull the centres onto the
+    # actual paint colours instead of box averages
+    seeds = Image.fromarray(sample[None]).quantize(colors=DOMINANT_COLORS, method=Image.Quantize.MEDIANCUT)
+    centres = np.array(seeds.getpalette()[:3 * DOMINANT_COLORS], dtype=np.float32).reshape(-1, 3)
+    points = sample.astype(np.float32)
+    for _ in range(4):
+        labels = ((points[:, None] - centres[None]) ** 2).sum(axis=2).argmin(axis=1)
+        counts = np.bincount(labels, minlength=len(centres))
+        used = counts > 0
+        centres[used] = np.stack([np.bincount(labels, points[:, c], len(centres))[used] / counts[used]
+                                  for c in range(3)], axis=1)
+    colors = []
+    for index in np.argsort(-counts, kind="stable"):
+        if counts[index] < 0.01 * len(points):
+            break
+        # Near-duplicate centres (paper split in two) report once
+        if all(np.abs(centres[index] - kept).max() > COLOR_MERGE_DISTANCE for kept in colors):
+            colors.append(centres[index])
+    lab = cv2.cvtColor(points[None] / 255, cv2.COLOR_RGB2Lab)[0]
+    chroma_spread = np.sqrt(lab[:, 1].var() + lab[:, 2].var())
+    return {"colors": ["#%02x%02x%02x" % tuple(np.round(c).astype(int)) for c in colors],
+            "variance": float(min(chroma_spread / 50, 1.0))}
+
+
+def line_quality(structure):
+    # Bending of the centre lines: at each skeleton pixel, how well the pixels
+    # in a SMOOTHNESS_WINDOW box fit a straight segment (1 - minor/major axis
+    # of their scatter). Arcs wider than the window stay near 1, wobbly or
+    # jagged strokes drop. Junctions are left out and counted instead.
+    lines = structure["lines"].astype(np.uint8)
+    neighbours = cv2.filter2D(lines, -1, np.ones((3, 3), np.float32), borderType=cv2.BORDER_CONSTANT) - lines
+    junctions = (neighbours >= 3) & structure["lines"]
+    crossings = cv2.connectedComponents(junctions.astype(np.uint8), connectivity=8)[0] - 1
+
+    smoothness = None
+    if lines.any():
+        ys, xs = np.indices(lines.shape, dtype=np.float32)
+        ones = lines.astype(np.float32)
+        box = (SMOOTHNESS_WINDOW, SMOOTHNESS_WINDOW)
+        # Window-local coordinates keep the second moments well conditioned
+        xs -= lines.shape[1] / 2
+        ys -= lines.shape[0] / 2
+        n, sx, sy, sxx, syy, sxy = (cv2.boxFilter(ones * term, -1, box, normalize=False, borderType=cv2.BORDER_CONSTANT)
+                                    for term in (1, xs, ys, xs * xs, ys * ys, xs * ys))
+        at = lines.view(bool) & ~junctions & (n >= 3)
+        n, sx, sy, sxx, syy, sxy = n[at], sx[at], sy[at], sxx[at], syy[at], sxy[at]
+        cxx, cyy, cxy = sxx / n - (sx / n) ** 2, syy / n - (sy / n) ** 2, sxy / n - sx * sy / n ** 2
+        spread = np.sqrt((cxx - cyy) ** 2 + 4 * cxy ** 2)
+        major, minor = (cxx + cyy + spread) / 2, np.maximum((cxx + cyy - spread) / 2, 0)
+        if len(major):
+            smoothness = float(np.clip(1 - np.sqrt(minor / np.maximum(major, 1e-6)), 0, 1).mean())
+
+    # Thickness histogram in half-pixel bins: the mean of the commonest
+    # width's neighbourhood, so dots and junction bulges don't pull it up
+    widths, thickness = structure["widths"], None
+    if len(widths):
+        counts, edges = np.histogram(widths, bins=np.arange(0, widths.max() + 1, 0.5))
+        mode = edges[np.argmax(counts)] + 0.25
+        typical = widths[(widths >= 0.5 * mode) & (widths <= 1.5 * mode)]
+        thickness = float(typical.mean()) * structure["scale"]
+    return {"smoothness": smoothness, "thickness": thickness, "crossings": crossings}
+
+
+def dot_density(dots, spacing, area):
+    # Share of the drawing's area taken up by the dot lattice
+    if not len(dots):
+        return 0.0
+    if not spacing:
+        # Too few dots for a lattice: assume pulli spacing of ~4 dot radii
+        spacing = 4 * float(dots[:, 2].mean())
+    return min(len(dots) * spacing ** 2 / max(area, 1e-9), 1.0)
+
+
+def complexity_index(line_length, diagonal, crossings):
+    # Drawn length (in bounding-box diagonals) and crossings each saturate
+    # towards 1; a single loop scores ~0.1, a 7x7 sikku kolam ~0.8
+    length_term = 1 - np.exp(-line_length / max(diagonal, 1e-9) / 15)
+    crossing_term = 1 - np.exp(-crossings / 40)
+    return float((length_term + crossing_term) / 2)
+
+
+def quality_fields(structure, colors, quality):
+    # Extended AnalysisResult fields; everything but the colours is in [0, 1]
+    height, width = structure["lines"].shape
+    factor = structure["skeleton_scale"]
+    diagonal = np.hypot(width, height) * factor * structure["scale"]
+    density = dot_density(structure["dots"], structure["grid"]["spacing"], structure["ink_area"])
+    fields = {
+        "dominantColors": colors["colors"],
+        "colorVariance": round(colors["variance"], 3),
+        "dotDensity": round(float(density), 3),
+        "complexityIndex": round(complexity_index(structure["line_length"], diagonal, quality["crossings"]), 3),
+    }
+    if quality["smoothness"] is not None:
+        fields["lineSmoothness"] = round(quality["smoothness"], 3)
+    if quality["thickness"] is not None:
+        fields["averageLineThickness"] = round(quality["thickness"], 1)
+    return fields
+
+
+def local_kolam_analysis(image_bytes):
+    return analyze_image(*load_image(image_bytes))
+
+
+def analyze_image(image, original_size):
+    # All local fields for an image already decoded by load_image
+    mask = ink_mask(image)
+    structure = structural_metrics(mask, original_size[0] / image.size[0])
+    return dict(symmetry_fields(detect_symmetry(mask)), **structure_fields(structure, original_size),
+                **quality_fields(structure, color_metrics(image), line_quality(structure)))
+
+
+# Point versions of the ROTATIONS / REFLECTIONS tests, on offsets (dx, dy)
+# from the centre in image coordinates (y down)
+_HALF_SQRT2 = np.sqrt(0.5)
+POINT_TRANSFORMS = {
+    "C2": lambda dx, dy: (-dx, -dy),
+    "C4": lambda dx, dy: (-dy, dx),
+    "C8": lambda dx, dy: (_HALF_SQRT2 * (dx - dy), _HALF_SQRT2 * (dx + dy)),
+    "vertical": lambda dx, dy: (-dx, dy),
+    "horizontal": lambda dx, dy: (dx, -dy),
+    "diagonal": lambda dx, dy: (dy, dx),
+    "antidiagonal": lambda dx, dy: (-dy, -dx),
+}
+# Cell codes pack (column, row) into one int64
+_CELL_STRIDE = 1 << 32
+
+
+def _expand(counts):
+    # Item i repeated counts[i] times -> (item index, 0..counts[i] - 1) arrays
+    owners = np.repeat(np.arange(len(counts)), counts)
+    return owners, np.arange(len(owners)) - np.repeat(np.cumsum(counts) - counts, counts)
+
+
+def _spread(counts):
+    # Each item split into counts[i] steps -> (item index, parameter t in
+    # [0, 1]) for every step end point, both ends included
+    owners, offsets = _expand(counts + 1)
+    return owners, offsets / counts[owners]
+
+
+def stroke_samples(lines, arcs, step):
+    # Points at most `step` apart along every line (n, 4) and arc (n, 5)
+    lengths = np.hypot(lines[:, 2] - lines[:, 0], lines[:, 3] - lines[:, 1])
+    owners, t = _spread(np.maximum(np.ceil(lengths / step), 1).astype(np.int64))
+    x1, y1, x2, y2 = (lines[owners, i] for i in range(4))
+    points = [np.stack([x1 + t * (x2 - x1), y1 + t * (y2 - y1)], axis=1)]
+    lengths = np.abs(arcs[:, 2] * np.radians(arcs[:, 4]))
+    owners, t = _spread(np.maximum(np.ceil(lengths / step), 1).astype(np.int64))
+    angles = np.radians(arcs[owners, 3] + t * arcs[owners, 4])
+    points.append(np.stack([arcs[owners, 0] + arcs[owners, 2] * np.cos(angles),
+                            arcs[owners, 1] + arcs[owners, 2] * np.sin(angles)], axis=1))
+    return np.concatenate(points)
+
+
+def _cell_codes(points, cell):
+    cells = np.floor(points / cell).astype(np.int64)
+    return cells[:, 0] * _CELL_STRIDE + cells[:, 1]
+
+
+def detect_vector_symmetry(points, centre, step, threshold=VECTOR_SYMMETRY_THRESHOLD):
+    # detect_symmetry for points sampled along the strokes: each test scores
+    # the share of transformed points that land within a cell of a sample
+    if not len(points):
+        return symmetry_group({}, threshold)
+    # Cells holding a sample or next to one, built once for all the tests
+    offsets = np.array([dx * _CELL_STRIDE + dy for dx in (-1, 0, 1) for dy in (-1, 0, 1)])
+    occupied = np.sort((_cell_codes(points, step)[:, None] + offsets[None]).ravel())
+    scores = {}
+    for name, transform in POINT_TRANSFORMS.items():
+        moved = np.stack(transform(points[:, 0] - centre[0], points[:, 1] - centre[1]), axis=1) + centre
+        codes = _cell_codes(moved, step)
+        found = occupied[np.minimum(np.searchsorted(occupied, codes), len(occupied) - 1)] == codes
+        scores[name] = float(found.mean())
+    return symmetry_group(scores, threshold)
+
+
+def count_crossings(segments, merge):
+    # Points where two segments (n, 4) cross away from their end points (so
+    # consecutive pieces of one stroke don't count); crossings closer than
+    # `merge` count once, as a junction does in the raster measure
+    if len(segments) < 2:
+        return 0
+    lengths = np.hypot(segments[:, 2] - segments[:, 0], segments[:, 3] - segments[:, 1])
+    cell = max(2 * float(np.median(lengths)), merge, 1e-6)
+    lo = np.floor(np.minimum(segments[:, :2], segments[:, 2:]) / cell).astype(np.int64)
+    hi = np.floor(np.maximum(segments[:, :2], segments[:, 2:]) / cell).astype(np.int64)
+    # Every segment in each grid cell its box touches; a pair is tested in
+    # every cell it shares and counted in the one holding the crossing
+    spans = hi - lo + 1
+    owners, offsets = _expand(spans[:, 0] * spans[:, 1])
+    cells = lo[owners] + np.stack([offsets // spans[owners, 1], offsets % spans[owners, 1]], axis=1)
+    codes = cells[:, 0] * _CELL_STRIDE + cells[:, 1]
+    order = np.argsort(codes, kind="stable")
+    codes, owners, cells = codes[order], owners[order], cells[order]
+    starts = np.flatnonzero(np.r_[True, codes[1:] != codes[:-1]])
+    group_end = np.repeat(np.r_[starts[1:], len(codes)], np.diff(np.r_[starts, len(codes)]))
+    # Each entry paired with the later entries of its cell
+    left, later = _expand(group_end - np.arange(len(codes)) - 1)
+    index = left + 1 + later
+    a, b = segments[owners[left]], segments[owners[index]]
+
+    da, db = a[:, 2:] - a[:, :2], b[:, 2:] - b[:, :2]
+    denominator = da[:, 0] * db[:, 1] - da[:, 1] * db[:, 0]
+    gap = b[:, :2] - a[:, :2]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        t = (gap[:, 0] * db[:, 1] - gap[:, 1] * db[:, 0]) / denominator
+        u = (gap[:, 0] * da[:, 1] - gap[:, 1] * da[:, 0]) / denominator
+    # Clear of both ends by more than the markup's rounding
+    margin_a, margin_b = 0.01 / np.maximum(lengths[owners[left]], 1e-9), 0.01 / np.maximum(lengths[owners[index]], 1e-9)
+    crossing = (denominator != 0) & (t > margin_a) & (t < 1 - margin_a) & (u > margin_b) & (u < 1 - margin_b)
+    points = a[crossing, :2] + t[crossing, None] * da[crossing]
+    home = np.all(np.floor(points / cell).astype(np.int64) == cells[left][crossing], axis=1)
+    return len(np.unique(np.floor(points[home] / merge).astype(np.int64), axis=0))
+
+
+def vector_colors(document):
+    # dominantColors / colorVariance from the declared paint: the background,
+    # then the inks by how many primitives use them
+    names = ([document["background"]] if document["background"] else []) + \
+        [name for name, _ in document["colors"].most_common(DOMINANT_COLORS)]
+    colors = []
+    for name in names:
+        try:
+            rgb = ImageColor.getrgb(name)[:3]
+        except ValueError:
+            continue
+        if rgb not in colors:
+            colors.append(rgb)
+    if not colors:
+        return {"colors": [], "variance": 0.0}
+    lab = cv2.cvtColor(np.array([colors], dtype=np.float32) / 255, cv2.COLOR_RGB2Lab)[0]
+    chroma_spread = np.sqrt(lab[:, 1].var() + lab[:, 2].var())
+    return {"colors": ["#%02x%02x%02x" % rgb for rgb in colors], "variance": float(min(chroma_spread / 50, 1.0))}
+
+
+def analyze_vectors(document):
+    # All local fields for an SVG read by kolam_svg.read_svg, from its
+    # primitives: dot count, stroke length and bounding box exactly, symmetry
+    # on points sampled along the centre lines. The bounding box is that of
+    # the centre lines and dots, in the document's units.
+    geometry = document["geometry"]
+    flat = scale_primitives(flatten_geometry(geometry), 1.0)
+    lines, arcs, dots = (np.asarray(flat[kind], dtype=float) for kind in ("lines", "arcs", "dots"))
+    length = float(np.hypot(lines[:, 2] - lines[:, 0], lines[:, 3] - lines[:, 1]).sum()
+                   + np.abs(arcs[:, 2] * np.radians(arcs[:, 4])).sum())
+    boxes = np.concatenate([
+        np.stack([np.minimum(lines[:, 0], lines[:, 2]), np.minimum(lines[:, 1], lines[:, 3]),
+                  np.maximum(lines[:, 0], lines[:, 2]), np.maximum(lines[:, 1], lines[:, 3])], axis=1),
+        arc_extents(arcs),
+        np.stack([dots[:, 0] - dots[:, 2], dots[:, 1] - dots[:, 2], dots[:, 0] + dots[:, 2], dots[:, 1] + dots[:, 2]], axis=1),
+    ])
+    if len(boxes):
+        left, top = boxes[:, :2].min(axis=0)
+        right, bottom = boxes[:, 2:].max(axis=0)
+    else:
+        left = top = right = bottom = 0.0
+    step = max(length / VECTOR_SYMMETRY_SAMPLES, VECTOR_MIN_STEP)
+    points = np.concatenate([stroke_samples(lines, arcs, step), dots[:, :2]])
+    symmetry = detect_vector_symmetry(points, np.array([(left + right) / 2, (top + bottom) / 2]), step)
+
+    stroke_width = float(geometry.stroke_width) if len(lines) or len(arcs) else 0.0
+    segments = [lines] + [np.concatenate([v[:, :-1], v[:, 1:]], axis=2).reshape(-1, 4) for _, v in flatten_arcs(arcs)]
+    crossings = count_crossings(np.concatenate(segments), max(stroke_width, VECTOR_MIN_STEP))
+    grid = classify_grid(dots)
+    colors = vector_colors(document)
+    width, height = document["width"], document["height"]
+    fields = dict(symmetry_fields(symmetry), **{
+        "gridSystem": grid_system(grid, len(dots)),
+        "specifications": {
+            "dimensions": f"{width:g} x {height:g} pixels",
+            "dotCount": len(dots),
+            "lineLength": f"{length:.0f} px" if length else "N/A",
+            "strokeWidth": f"{stroke_width:.1f}px" if stroke_width else "N/A",
+            "boundingBox": {"x": round(float(left), 3), "y": round(float(top), 3),
+                            "width": round(float(right - left), 3), "height": round(float(bottom - top), 3)},
+        },
+        "dominantColors": colors["colors"],
+        "colorVariance": round(colors["variance"], 3),
+        "dotDensity": round(float(dot_density(dots, grid["spacing"], (right - left) * (bottom - top))), 3),
+        "complexityIndex": round(complexity_index(length, np.hypot(right - left, bottom - top), crossings), 3),
+    })
+    if stroke_width:
+        fields["averageLineThickness"] = round(stroke_width, 1)
+    return fields
+
+
+# Descriptions of the generators' designs, by the motif names they write
+GENERATED_FAMILIES = (
+    ({"A", "B"}, "A continuous-line (sikku / kambi) kolam grown by an L-system: a few turtle moves rewritten "
+                 "over and over, much as a kolam artist builds a design by repeating one loop around the dots. "
+                 "The unbroken line that returns to where it began is traditionally read as the endless cycle of "
+                 "life and as a protective boundary at the threshold; drawn afresh each morning in rice flour, it "
+                 "welcomes guests and feeds small creatures."),
+    ({"P1", "P2"}, "A geometric kolam of regular polygons alternating across a square lattice, in the manner of "
+                   "the tiled rangoli drawn for festivals. Repeating regular figures over a grid expresses the "
+                   "order and balance a kolam is meant to bring to the threshold of the home."),
+)
+GENERATED_DESIGN = ("A kolam generated by this application. Kolams are drawn each morning at the threshold of South "
+                    "Indian homes as a sign of welcome and auspiciousness; their symmetry and unbroken lines stand "
+                    "for harmony and continuity.")
+
+
+def complexity_level(index):
+    return next(level for bound, level in COMPLEXITY_LEVELS if index >= bound)
+
+
+def _plural(count, noun, plural=None):
+    return f"{count} {noun}" if count == 1 else f"{count} {plural or noun + 's'}"
+
+
+def _describe_item(item, names, placements=True):
+    # "3 straight strokes, 2 arcs and 4 copies of motif A" for a geometry or motif
+    parts = [_plural(len(store), noun) for store, noun in
+             ((item.lines, "straight stroke"), (item.arcs, "arc"), (item.dots, "dot"), (item.polygons, "polygon"))
+             if len(store)]
+    if placements:
+        placed = Counter(name for name, _, _, _ in item.instances)
+        parts += [f"{_plural(count, 'copy', 'copies')} of motif {names.get(name, name)}" for name, count in placed.items()]
+    return ", ".join(parts[:-1]) + " and " + parts[-1] if len(parts) > 1 else "".join(parts)
+
+
+def generated_design_fields(document, analysis):
+    # complexity, algorithm and culturalSignificance for a design kolam_svg
+    # wrote (document["generated"]), from its structure instead of the model
+    geometry, names = document["geometry"], document["motif_names"]
+    steps = []
+    if analysis["specifications"]["dotCount"]:
+        steps.append(f"Lay out the dots: {analysis['gridSystem']}")
+    for motif_id, motif in geometry.motifs.items():
+        steps.append(f"Draw motif {names.get(motif_id, motif_id)}: {_describe_item(motif, names) or 'empty'}")
+    rotations = {}
+    for name, _, _, rotation in geometry.instances:
+        rotations.setdefault(name, Counter())[round(rotation, 3) % 360] += 1
+    for name, turns in rotations.items():
+        step = f"Place motif {names.get(name, name)} {_plural(sum(turns.values()), 'time')}"
+        steps.append(step + (f", turned through {len(turns)} different angles" if len(turns) > 1 else ""))
+    direct = _describe_item(geometry, names, placements=False)
+    if direct:
+        steps.append(f"Draw {direct} directly")
+    if analysis["symmetryType"] != symmetry_type("C1"):
+        steps.append(f"The finished drawing has {analysis['symmetryType']}")
+    motif_names = set(names.values())
+    significance = next((text for family, text in GENERATED_FAMILIES if family & motif_names), GENERATED_DESIGN)
+    return {"complexity": complexity_level(analysis["complexityIndex"]), "algorithm": steps,
+            "culturalSignificance": significance}
@@ -0,0 +1,361 @@
+import argparse
+import asyncio
+import importlib.util
+import json
+import multiprocessing
+import os
+import sqlite3
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from urllib.request import pathname2url
+
+from analysis_cache import HAMMING_THRESHOLD, AnalysisCache, BKTree, design_signature, perceptual_hash
+from gemini_client import MAX_CONCURRENT_CALLS, UNSUPPORTED_REQUEST_ERRORS, CircuitOpen, generate_content
+from gemini_quota import BULK
+from json_fields import parse_model_text
+from kolam_analysis import analyze_image
+from kolam_preprocess import model_payload, prepare_upload
+from kolam_prompts import prompt_template
+
+# Bulk analysis of an archive of kolam images (a directory or a .zip).
+#
+# A job has two stages, both checkpointed to one SQLite file:
+#   local  every image is decoded, hashed, measured and shrunk to its model
+#          payload in a process pool. Images within HAMMING_THRESHOLD of one
+#          already seen (and measured alike, see design_signature) are marked
+#          duplicates of it and never sent to the model.
+#   model  the rest go to Gemini BATCH_SIZE images per call (one answer per
+#          image) at bulk priority, after a look in the shared analysis cache.
+#          Each batch is committed as soon as it is answered.
+# Running a job again with the same checkpoint skips whatever it already
+# holds, so an interrupted run resumes without paying twice for an image.
+# Results are written as JSON lines or Parquet (needs pyarrow).
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".webp", ".bmp", ".gif", ".tif", ".tiff")
+BATCH_SIZE = int(os.getenv("KOLAM_BATCH_SIZE", 8))
+OUTPUT_FORMATS = ("jsonl", "parquet")
+# Local results are committed in groups of this many
+COMMIT_EVERY = 50
+
+# Per worker process: open archives by path
+_archives = {}
+
+
+def output_format_available(output_format):
+    if output_format == "parquet":
+        return importlib.util.find_spec("pyarrow") is not None
+    return output_format in OUTPUT_FORMATS
+
+
+def output_format(path):
+    return "parquet" if path.lower().endswith(".parquet") else "jsonl"
+
+
+def list_sources(root):
+    # Image names relative to the archive root, in a stable order
+    if zipfile.is_zipfile(root):
+        with zipfile.ZipFile(root) as archive:
+            names = [info.filename for info in archive.infolist()
+                     if not info.is_dir() and not info.filename.startswith("__MACOSX/")]
+    else:
+        names = []
+        for directory, _, files in os.walk(root):
+            for name in files:
+                names.append(os.path.relpath(os.path.join(directory, name), root).replace(os.sep, "/"))
+    return sorted(name for name in names if name.lower().endswith(IMAGE_EXTENSIONS))
+
+
+def read_source(root, name):
+    if os.path.isdir(root):
+        with open(os.path.join(root, name), "rb") as f:
+            return f.read()
+    archive = _archives.get(root)
+    if archive is None:
+        archive = _archives[root] = zipfile.ZipFile(root)
+    return archive.read(name)
+
+
+def local_stage(root, name):
+    # Runs in a worker process: everything about one image that needs no model
+    try:
+        prepared = prepare_upload(read_source(root, name))
+        image = prepared["image"]
+        payload, mime_type, _ = model_payload(image)
+        return {
+            "source": name,
+            "phash": perceptual_hash(image),
+            "local": analyze_image(image, prepared["original_size"]),
+            "payload": payload,
+            "mime_type": mime_type,
+        }
+    except Exception as e:
+        return {"source": name, "error": f"{type(e).__name__}: {e}"}
+
+
+def process_pool(workers):
+    # Same start method as the render pool in app.py: forking a server that
+    # runs threads (the Gemini executor) is not safe
+    if "forkserver" in multiprocessing.get_all_start_methods():
+        context = multiprocessing.get_context("forkserver")
+        context.set_forkserver_preload(["kolam_batch"])
+    else:
+        context = multiprocessing.get_context("spawn")
+    return ProcessPoolExecutor(workers, mp_context=context)
+
+
+ITEM_STATUSES = ("local", "duplicate", "analysed", "failed")
+
+
+def _item_counts(db):
+    counts = dict(db.execute("SELECT status, COUNT(*) FROM items GROUP BY status").fetchall())
+    return {status: counts.get(status, 0) for status in ITEM_STATUSES}
+
+
+def checkpoint_counts(checkpoint):
+    # BatchJob.counts() of a job that isn't open in this process, through a
+    # read-only connection that is closed again
+    if not os.path.exists(checkpoint):
+        return dict.fromkeys(ITEM_STATUSES, 0)
+    db = sqlite3.connect(f"file:{pathname2url(os.path.abspath(checkpoint))}?mode=ro", uri=True)
+    try:
+        return _item_counts(db)
+    except sqlite3.OperationalError:
+        # Created but never written to
+        return dict.fromkeys(ITEM_STATUSES, 0)
+    finally:
+        db.close()
+
+
+class BatchJob:
+    # Status: pending -> local -> model -> writing -> done (or failed)
+    def __init__(self, root, checkpoint, batch_size=BATCH_SIZE, workers=None, cache=None):
+        self.root = root
+        self.batch_size = batch_size
+        self.workers = workers
+        self.cache = cache
+        self.status = "pending"
+        self.error = None
+        self.total = None
+        self.db = sqlite3.connect(checkpoint, check_same_thread=False)
+        # status: local (measured, awaiting the model), duplicate, analysed or
+        # failed (could not be decoded); error also holds the last model error
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS items ("
+            "source TEXT PRIMARY KEY, status TEXT NOT NULL, phash TEXT, duplicate_of TEXT, "
+            "local TEXT, analysis TEXT, payload BLOB, mime_type TEXT, error TEXT)"
+        )
+        self.db.commit()
+
+    def counts(self):
+        return _item_counts(self.db)
+
+    def close(self):
+        self.db.close()
+
+    def progress(self):
+        return {"status": self.status, "error": self.error, "total": self.total, **self.counts()}
+
+    def _record_local(self, item, tree, originals):
+        if "error" in item:
+            self.db.execute("INSERT OR REPLACE INTO items (source, status, error) VALUES (?, 'failed', ?)",
+                            (item["source"], item["error"]))
+            return
+        phash, duplicate_of = item["phash"], None
+        match = tree.nearest(phash, HAMMING_THRESHOLD)
+        if match is not None and originals[match[1]][1] == design_signature(item["local"]):
+            duplicate_of = originals[match[1]][0]
+        else:
+            tree.add(phash)
+            originals.setdefault(phash, (item["source"], design_signature(item["local"])))
+        self.db.execute(
+            "INSERT OR REPLACE INTO items (source, status, phash, duplicate_of, local, payload, mime_type) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (item["source"], "duplicate" if duplicate_of else "local", f"{phash:016x}", duplicate_of,
+             json.dumps(item["local"]), None if duplicate_of else item["payload"], item["mime_type"]),
+        )
+
+    async def analyse_locally(self):
+        sources = await asyncio.get_running_loop().run_in_executor(None, list_sources, self.root)
+        self.total = len(sources)
+        seen = {row[0] for row in self.db.execute("SELECT source FROM items")}
+        todo = [name for name in sources if name not in seen]
+        tree, originals = BKTree(), {}
+        for source, phash, local in self.db.execute("SELECT source, phash, local FROM items WHERE status IN ('local', 'analysed') ORDER BY source"):
+            tree.add(int(phash, 16))
+            originals.setdefault(int(phash, 16), (source, design_signature(json.loads(local))))
+        if not todo:
+            return
+        loop = asyncio.get_running_loop()
+        pool = process_pool(self.workers)
+        try:
+            futures = [loop.run_in_executor(pool, local_stage, self.root, name) for name in todo]
+            # In source order, so the same archive always keeps the same originals
+            for count, future in enumerate(futures, 1):
+                self._record_local(await future, tree, originals)
+                if count % COMMIT_EVERY == 0:
+                    self.db.commit()
+        finally:
+            self.db.commit()
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    async def _single_call(self, template, image_part):
+        try:
+            response = await generate_content([template["prompt"], image_part], template=template, priority=BULK)
+        except UNSUPPORTED_REQUEST_ERRORS:
+            if not template.get("fallback"):
+                raise
+            fallback = prompt_template(template["fallback"])
+            response = await generate_content([fallback["prompt"], image_part], template=fallback, priority=BULK)
+        answer = parse_model_text(response.text)
+        if not isinstance(answer, dict):
+            raise ValueError("Model response was not a JSON object")
+        return answer
+
+    async def _batch_call(self, template, image_parts):
+        # -> one answer (dict) or exception per image
+        if len(image_parts) > 1:
+            batch_template = prompt_template("kolam-analysis-batch")
+            contents = [batch_template["prompt"].format(count=len(image_parts))]
+            for index, image_part in enumerate(image_parts, 1):
+                contents += [f"Image {index}:", image_part]
+            try:
+                response = await generate_content(contents, template=batch_template, priority=BULK)
+                answers = parse_model_text(response.text)
+                if isinstance(answers, list) and len(answers) == len(image_parts) and all(isinstance(answer, dict) for answer in answers):
+                    return answers
+            except UNSUPPORTED_REQUEST_ERRORS:
+                pass
+        # Batching not accepted, or the answers don't line up: one call each
+        answers = []
+        for image_part in image_parts:
+            try:
+                answers.append(await self._single_call(template, image_part))
+            except CircuitOpen:
+                raise
+            except Exception as e:
+                answers.append(e)
+        return answers
+
+    def _record_analysis(self, source, answer):
+        if isinstance(answer, Exception):
+            self.db.execute("UPDATE items SET error = ? WHERE source = ?", (f"{type(answer).__name__}: {answer}", source))
+            return
+        self.db.execute("UPDATE items SET status = 'analysed', analysis = ?, payload = NULL, error = NULL WHERE source = ?",
+                        (json.dumps(answer), source))
+
+    async def analyse_with_model(self):
+        # Answers go into the analysis cache under the single-image template,
+        # so the API and later jobs reuse them (and this job reuses theirs)
+        template = prompt_template("kolam-analysis")
+        pending = []
+        signatures = {}
+        for source, phash, local in self.db.execute("SELECT source, phash, local FROM items WHERE status = 'local' ORDER BY source").fetchall():
+            signatures[source] = design_signature(json.loads(local))
+            cached = self.cache.get(int(phash, 16), signatures[source], template["id"]) if self.cache is not None else None
+            if cached is not None:
+                self._record_analysis(source, cached)
+            else:
+                pending.append(source)
+        self.db.commit()
+        batches = iter([pending[start:start + self.batch_size] for start in range(0, len(pending), self.batch_size)])
+
+        async def analyse_batches():
+            for batch in batches:
+                rows = [self.db.execute("SELECT phash, payload, mime_type FROM items WHERE source = ?", (source,)).fetchone() for source in batch]
+                try:
+                    answers = await self._batch_call(template, [{"mime_type": mime_type, "data": payload} for _, payload, mime_type in rows])
+                except CircuitOpen:
+                    raise
+                except Exception as e:
+                    answers = [e] * len(batch)
+                for source, (phash, _, _), answer in zip(batch, rows, answers):
+                    self._record_analysis(source, answer)
+                    if self.cache is not None and isinstance(answer, dict):
+                        self.cache.put(int(phash, 16), signatures[source], template["id"], answer)
+                self.db.commit()
+
+        # Calls are paced by the quota scheduler; this only keeps enough in flight
+        tasks = [asyncio.ensure_future(analyse_batches()) for _ in range(MAX_CONCURRENT_CALLS)]
+        try:
+            await asyncio.gather(*tasks)
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    def results(self):
+        model_answers = {}
+        for source, status, phash, duplicate_of, local, analysis, error in self.db.execute(
+                "SELECT source, status, phash, duplicate_of, local, analysis, error FROM items ORDER BY source"):
+            if duplicate_of is not None:
+                if duplicate_of not in model_answers:
+                    row = self.db.execute("SELECT analysis FROM items WHERE source = ?", (duplicate_of,)).fetchone()
+                    model_answers[duplicate_of] = row[0] if row else None
+                analysis = model_answers[duplicate_of]
+            merged = {**json.loads(analysis or "{}"), **json.loads(local or "{}")}
+            yield {"source": source, "status": status, "phash": phash, "duplicateOf": duplicate_of,
+                   "analysis": merged, "error": error}
+
+    def write_results(self, path, output_format="jsonl"):
+        if output_format == "parquet":
+            try:
+                import pyarrow as pa
+                import pyarrow.parquet as pq
+            except ImportError:
+                raise RuntimeError("Parquet output needs pyarrow (pip install pyarrow)")
+            # The analysis varies by image (and prompt version): kept as a JSON string column
+            records = [dict(record, analysis=json.dumps(record["analysis"])) for record in self.results()]
+            pq.write_table(pa.Table.from_pylist(records), path)
+            return
+        with open(path, "w", encoding="utf-8") as f:
+            for record in self.results():
+                f.write(json.dumps(record) + "\n")
+
+    async def run(self, output, output_format="jsonl", use_model=True):
+        try:
+            self.status = "local"
+            await self.analyse_locally()
+            if use_model:
+                self.status = "model"
+                await self.analyse_with_model()
+            self.status = "writing"
+            await asyncio.get_running_loop().run_in_executor(None, self.write_results, output, output_format)
+            self.status = "done"
+        except CircuitOpen:
+            self.status, self.error = "failed", "Gemini is unavailable; resume the job later"
+            raise
+        except Exception as e:
+            self.status, self.error = "failed", f"{type(e).__name__}: {e}"
+            raise
+        return self.counts()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Analyse a directory or .zip of kolam images in bulk")
+    parser.add_argument("archive", help="directory or .zip of images")
+    parser.add_argument("output", help="*.jsonl or *.parquet")
+    parser.add_argument("--checkpoint", help="progress file (default: <output>.checkpoint.sqlite3); rerun with it to resume")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE, help="images per model call")
+    parser.add_argument("--workers", type=int, default=None, help="processes for the local stage")
+    parser.add_argument("--local-only", action="store_true", help="measured fields only, no model calls")
+    args = parser.parse_args()
+    if not output_format_available(output_format(args.output)):
+        parser.error("Parquet output needs pyarrow (pip install pyarrow)")
+
+    cache = None
+    if not args.local_only:
+        from dotenv import load_dotenv
+        from gemini_client import configure
+        load_dotenv()
+        if not os.getenv("GEMINI_API_KEY"):
+            parser.error("GEMINI_API_KEY is not set (or pass --local-only)")
+        configure(os.getenv("GEMINI_API_KEY"))
+        cache = AnalysisCache()
+
+    job = BatchJob(args.archive, args.checkpoint or args.output + ".checkpoint.sqlite3", args.batch_size, args.workers, cache)
+    try:
+        counts = asyncio.run(job.run(args.output, output_format(args.output), use_model=not args.local_only))
+    except CircuitOpen:
+        parser.exit(1, f"{job.error}; progress is saved, rerun the same command to resume\n")
+    finally:
+        job.close()
+    print(f"Results written to {args.output} ({job.total} images: {counts['analysed']} analysed, "
+          f"{counts['duplicate']} duplicates, {counts['local']} measured only, {counts['failed']} failed)")
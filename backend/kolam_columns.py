@@ -0,0 +1,146 @@
+import os
+import tempfile
+import numpy as np
+
+# Appendable float columns for the geometry IR.
+#
+# A column stands in for the list of tuples it replaces (append, extend, len,
+# iteration, truthiness, np.asarray) but keeps its rows in one NumPy buffer.
+# Once that buffer would outgrow the RAM budget it moves to an np.memmap over
+# an anonymous scratch file, so iteration-9/10 designs page to disk instead of
+# raising MemoryError. Readers should walk big columns with chunks().
+
+RAM_BUDGET_BYTES = int(os.getenv("KOLAM_GEOMETRY_RAM_BUDGET", 256 << 20))
+# None -> the platform temp directory
+SCRATCH_DIR = os.getenv("KOLAM_SCRATCH_DIR") or None
+CHUNK_ROWS = 1 << 16
+
+# Rows appended one at a time are batched before they hit the buffer
+_PENDING_ROWS = 4096
+
+
+class PrimitiveColumns:
+    def __init__(self, width, rows=None, budget=None):
+        self.width = width
+        self.budget = RAM_BUDGET_BYTES if budget is None else budget
+        self.data = np.empty((0, width))
+        self.size = 0
+        self.pending = []
+        self.scratch = None
+        if rows is not None and len(rows):
+            self.extend(rows)
+
+    @property
+    def spilled(self):
+        # Pending rows count: flush them first so they are placed by the budget
+        self._flush()
+        return self.scratch is not None
+
+    def _reserve(self, rows):
+        needed = self.size + rows
+        if needed <= len(self.data):
+            return
+        capacity = max(needed, 2 * len(self.data), 64)
+        if self.scratch is None and capacity * self.width * 8 > self.budget:
+            self.scratch = tempfile.TemporaryFile(dir=SCRATCH_DIR, prefix="kolam-")
+        if self.scratch is None:
+            try:
+                grown = np.empty((capacity, self.width))
+            except MemoryError:
+                self.scratch = tempfile.TemporaryFile(dir=SCRATCH_DIR, prefix="kolam-")
+        if self.scratch is not None:
+            if isinstance(self.data, np.memmap):
+                # Extend the same file; rows already written stay where they are
+                self.data.flush()
+                self.data = np.memmap(self.scratch, dtype=float, mode="r+", shape=(capacity, self.width))
+                return
+            grown = np.memmap(self.scratch, dtype=float, mode="w+", shape=(capacity, self.width))
+        grown[:self.size] = self.data[:self.size]
+        self.data = grown
+
+    def _flush(self):
+        if self.pending:
+            pending, self.pending = self.pending, []
+            self._write(np.asarray(pending, dtype=float).reshape(-1, self.width))
+
+    def _write(self, rows):
+        self._reserve(len(rows))
+        self.data[self.size:self.size + len(rows)] = rows
+        self.size += len(rows)
+
+    def append(self, row):
+        self.pending.append(row)
+        if len(self.pending) >= _PENDING_ROWS:
+            self._flush()
+
+    def extend(self, rows):
+        self._flush()
+        self._write(np.asarray(rows, dtype=float).reshape(-1, self.width))
+
+    def array(self):
+        # (n, width) view; a memmap once spilled
+        self._flush()
+        return self.data[:self.size]
+
+    def chunks(self, rows=CHUNK_ROWS):
+        self._flush()
+        for start in range(0, self.size, rows):
+            yield self.data[start:min(start + rows, self.size)]
+
+    def __array__(self, dtype=None, copy=None):
+        array = self.array()
+        return array if dtype is None else array.astype(dtype, copy=False)
+
+    def __len__(self):
+        return self.size + len(self.pending)
+
+    def __bool__(self):
+        return len(self) > 0
+
+    def __iter__(self):
+        for chunk in self.chunks():
+            yield from map(tuple, chunk.tolist())
+
+
+class InstanceColumns(PrimitiveColumns):
+    # Placements (name, x, y, rotation) stored as (name_code, x, y, rotation)
+    def __init__(self, rows=None, budget=None):
+        self.names = []
+        self.codes = {}
+        super().__init__(4, None, budget)
+        for row in rows or ():
+            self.append(row)
+
+    def code(self, name):
+        if name not in self.codes:
+            self.codes[name] = len(self.names)
+            self.names.append(name)
+        return self.codes[name]
+
+    def append(self, row):
+        name, x, y, rotation = row
+        super().append((self.code(name), x, y, rotation))
+
+    def extend(self, rows):
+        for row in rows:
+            self.append(row)
+
+    def extend_coded(self, names, rows):
+        # Bulk-append (code, x, y, rotation) rows coded against another `names` list
+        self._flush()
+        remap = np.array([self.code(name) for name in names] or [0], dtype=float)
+        rows = np.array(rows, dtype=float).reshape(-1, 4)
+        rows[:, 0] = remap[rows[:, 0].astype(np.int64)]
+        self._write(rows)
+
+    def groups(self, rows=CHUNK_ROWS):
+        # (name, (n, 3) local poses) per name per chunk, in first-seen order
+        for chunk in self.chunks(rows):
+            codes = chunk[:, 0].astype(np.int64)
+            for code in dict.fromkeys(codes.tolist()):
+                yield self.names[code], chunk[codes == code, 1:]
+
+    def __iter__(self):
+        for chunk in self.chunks():
+            for code, x, y, rotation in chunk.tolist():
+                yield self.names[int(code)], x, y, rotation
@@ -0,0 +1,68 @@
+import argparse
+
+import numpy as np
+
+from kolam_geometry import ARC_TOLERANCE, flatten_arcs, iter_flatten_geometry, lsystem_geometry, \
+    lsystem_symmetric_geometry
+from kolam_lsystem import lsystem_expansion
+from kolam_svg import write_svg
+
+# Streaming coordinate dumps and SVG export for designs too big for RAM.
+#
+# Both writers walk the geometry chunk by chunk (see iter_flatten_geometry), so
+# an iteration-10 kolam whose primitives have spilled to memory-mapped scratch
+# files is written with only one chunk of rows resident at a time.
+
+
+def write_coordinates_csv(geometry, fp, tolerance=ARC_TOLERANCE):
+    # One row per vertex: kind,path,x,y. Lines give two vertices, arcs their
+    # tessellated polyline, polygons their corners and dots their centre.
+    fp.write("kind,path,x,y\n")
+    path = 0
+
+    def write_paths(kind, vertices):
+        # vertices: (n, k, 2) -> n paths of k points each
+        nonlocal path
+        count, points = vertices.shape[:2]
+        ids = np.repeat(np.arange(path, path + count), points)
+        np.savetxt(fp, np.column_stack([ids, vertices.reshape(-1, 2)]), fmt=kind + ",%d,%.3f,%.3f")
+        path += count
+
+    for chunk in iter_flatten_geometry(geometry):
+        if len(chunk["lines"]):
+            write_paths("line", chunk["lines"].reshape(-1, 2, 2))
+        if len(chunk["arcs"]):
+            for _, vertices in flatten_arcs(chunk["arcs"], tolerance):
+                write_paths("arc", vertices)
+        if len(chunk["dots"]):
+            write_paths("dot", chunk["dots"][:, None, :2])
+        for vertices in chunk["polygons"]:
+            write_paths("polygon", vertices)
+    return path
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Stream an L-system kolam to SVG or a CSV coordinate dump")
+    parser.add_argument("output", help="*.svg or *.csv")
+    parser.add_argument("--axiom", default="FBFBFBFB")
+    parser.add_argument("--iterations", type=int, default=9)
+    parser.add_argument("--dot-size", type=int, default=10)
+    parser.add_argument("--no-symmetry", action="store_true", help="interpret the whole string instead of one period")
+    parser.add_argument("--workers", type=int, default=None, help="processes for range-parallel interpretation")
+    args = parser.parse_args()
+
+    rules = {"A": "AFBFA", "B": "AFBFBFBFA"}
+    start_x, start_y = 300 - args.dot_size, 300 + args.dot_size
+    if args.no_symmetry:
+        lsystem_string = lsystem_expansion(args.axiom, rules, args.iterations)
+        geometry = lsystem_geometry(lsystem_string, args.dot_size, start_x, start_y, workers=args.workers)
+    else:
+        geometry = lsystem_symmetric_geometry(args.axiom, rules, args.iterations, args.dot_size, start_x, start_y)
+
+    with open(args.output, "w", newline="") as f:
+        if args.output.lower().endswith(".csv"):
+            paths = write_coordinates_csv(geometry, f)
+            print(f"Kolam coordinates written to {args.output} ({paths} paths)")
+        else:
+            write_svg(geometry, f)
+            print(f"Kolam written to {args.output}")
@@ -0,0 +1,419 @@
+import math
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+import numpy as np
+
+from kolam_columns import CHUNK_ROWS, InstanceColumns, PrimitiveColumns
+from kolam_lsystem import LSystemExpansion, lsystem_expansion
+
+# Geometry shared by the SVG and raster backends.
+#
+# Primitives are kept in plain tuples:
+#   line    (x1, y1, x2, y2)
+#   arc     (cx, cy, radius, start_degrees, sweep_degrees)
+#   dot     (cx, cy, radius)
+#   polygon [(x, y), ...]
+#
+# Repeated shapes are stored once as a motif (in its own local frame) and
+# placed with instances (motif_name, x, y, rotation_degrees), so writers can
+# emit one definition per unique motif instead of one per copy. Motifs may
+# themselves place other motifs (e.g. a symmetric kolam's fundamental domain).
+#
+# Lines, arcs, dots and instances live in kolam_columns stores, which spill to
+# memory-mapped scratch files for giant designs; the iter_* functions below
+# walk them chunk by chunk so writers never need the whole design in RAM.
+
+
+# Largest distance (in output pixels) a flattened arc may stray from the circle
+ARC_TOLERANCE = 0.25
+
+
+class KolamMotif:
+    def __init__(self, lines=None, arcs=None, dots=None, polygons=None, instances=None, end=(0.0, 0.0, 0.0)):
+        self.lines = PrimitiveColumns(4, lines)
+        self.arcs = PrimitiveColumns(5, arcs)
+        self.dots = PrimitiveColumns(3, dots)
+        self.polygons = polygons or []
+        self.instances = InstanceColumns(instances)
+        # Pose (x, y, heading) the turtle ends at, in the motif's local frame
+        self.end = end
+
+
+class KolamGeometry:
+    def __init__(self, width, height, stroke_width=2):
+        self.width = width
+        self.height = height
+        self.stroke_width = stroke_width
+        self.lines = PrimitiveColumns(4)
+        self.arcs = PrimitiveColumns(5)
+        self.dots = PrimitiveColumns(3)
+        self.polygons = []
+        self.motifs = {}
+        self.instances = InstanceColumns()
+        # Set by generators that know the design's symmetry, e.g.
+        # {"group": "C4", "order": 4, "center": (x, y), "domain": "D"}
+        self.symmetry = None
+
+    def add_motif(self, name, motif):
+        self.motifs[name] = motif
+
+    def place(self, name, x, y, rotation=0.0):
+        self.instances.append((name, x, y, rotation))
+
+
+def _compose(parent_poses, local_poses):
+    # Every (parent, local) pair of (x, y, heading) poses -> world poses, parent-major
+    parent_poses = parent_poses[:, None, :]
+    local_poses = local_poses[None, :, :]
+    heading = np.radians(parent_poses[..., 2])
+    cos_h, sin_h = np.cos(heading), np.sin(heading)
+    x = parent_poses[..., 0] + local_poses[..., 0] * cos_h - local_poses[..., 1] * sin_h
+    y = parent_poses[..., 1] + local_poses[..., 0] * sin_h + local_poses[..., 1] * cos_h
+    h = (parent_poses[..., 2] + local_poses[..., 2]) % 360
+    return np.stack([x, y, h], axis=-1).reshape(-1, 3)
+
+
+def _transform_points(points, poses):
+    # points (k, 2) in a motif frame, poses (n, 3) -> (n, k, 2) world points
+    heading = np.radians(poses[:, 2])[:, None]
+    cos_h, sin_h = np.cos(heading), np.sin(heading)
+    x = poses[:, 0:1] + points[None, :, 0] * cos_h - points[None, :, 1] * sin_h
+    y = poses[:, 1:2] + points[None, :, 0] * sin_h + points[None, :, 1] * cos_h
+    return np.stack([x, y], axis=-1)
+
+
+def geometry_spilled(geometry):
+    items = [geometry, *geometry.motifs.values()]
+    return any(store.spilled for item in items
+               for store in (item.lines, item.arcs, item.dots, item.instances))
+
+
+def _instance_groups(instances, chunk_rows):
+    # (name, (n, 3) local poses) groups from a column store or a plain list
+    if isinstance(instances, InstanceColumns):
+        yield from instances.groups(chunk_rows)
+        return
+    for start in range(0, len(instances), chunk_rows):
+        by_name = {}
+        for name, x, y, rotation in instances[start:start + chunk_rows]:
+            by_name.setdefault(name, []).append((x, y, rotation))
+        for name, local in by_name.items():
+            yield name, np.asarray(local, dtype=float)
+
+
+def iter_motif_poses(geometry, instances=None, parent_poses=None, chunk_rows=CHUNK_ROWS):
+    # (name, world poses) chunks for every placement of every motif, resolving
+    # nested motifs depth first; no chunk holds more than ~chunk_rows poses
+    instances = geometry.instances if instances is None else instances
+    parent_poses = np.zeros((1, 3)) if parent_poses is None else parent_poses
+    for name, local in _instance_groups(instances, chunk_rows):
+        step = max(1, chunk_rows // len(local))
+        for start in range(0, len(parent_poses), step):
+            world = _compose(parent_poses[start:start + step], local)
+            yield name, world
+            if geometry.motifs[name].instances:
+                yield from iter_motif_poses(geometry, geometry.motifs[name].instances, world, chunk_rows)
+
+
+def motif_poses(geometry, instances=None):
+    # World poses of every placement of every motif, resolving nested motifs
+    poses = {}
+    for name, world in iter_motif_poses(geometry, instances):
+        poses.setdefault(name, []).append(world)
+    return {name: np.concatenate(chunks) for name, chunks in poses.items()}
+
+
+def _local_chunks(store, poses, chunk_rows):
+    # Slices of a motif's primitive store sized so slice x poses stays ~chunk_rows
+    if isinstance(store, PrimitiveColumns):
+        return store.chunks(max(1, chunk_rows // len(poses)))
+    return [np.asarray(store, dtype=float)] if len(store) else []
+
+
+def _empty_primitives():
+    return {"lines": np.zeros((0, 4)), "arcs": np.zeros((0, 5)), "dots": np.zeros((0, 3)), "polygons": []}
+
+
+def iter_flatten_geometry(geometry, instances=None, chunk_rows=CHUNK_ROWS):
+    # flatten_geometry() one bounded chunk at a time; each chunk has every key
+    for kind, store in (("lines", geometry.lines), ("arcs", geometry.arcs), ("dots", geometry.dots)):
+        for chunk in _local_chunks(store, np.zeros((1, 3)), chunk_rows):
+            yield dict(_empty_primitives(), **{kind: np.array(chunk, dtype=float)})
+    if geometry.polygons:
+        yield dict(_empty_primitives(), polygons=[np.asarray(p, dtype=float)[None] for p in geometry.polygons])
+
+    for name, poses in iter_motif_poses(geometry, instances, chunk_rows=chunk_rows):
+        motif = geometry.motifs[name]
+        for local in _local_chunks(motif.lines, poses, chunk_rows):
+            world = _transform_points(local.reshape(-1, 2), poses)
+            yield dict(_empty_primitives(), lines=world.reshape(-1, 4))
+        for local in _local_chunks(motif.arcs, poses, chunk_rows):
+            centers = _transform_points(local[:, :2], poses).reshape(-1, 2)
+            starts = ((local[None, :, 3] + poses[:, 2:3]) % 360).reshape(-1, 1)
+            radii = np.broadcast_to(local[None, :, 2], (len(poses), len(local))).reshape(-1, 1)
+            sweeps = np.broadcast_to(local[None, :, 4], (len(poses), len(local))).reshape(-1, 1)
+            yield dict(_empty_primitives(), arcs=np.hstack([centers, radii, starts, sweeps]))
+        for local in _local_chunks(motif.dots, poses, chunk_rows):
+            centers = _transform_points(local[:, :2], poses).reshape(-1, 2)
+            radii = np.broadcast_to(local[None, :, 2], (len(poses), len(local))).reshape(-1, 1)
+            yield dict(_empty_primitives(), dots=np.hstack([centers, radii]))
+        if motif.polygons:
+            yield dict(_empty_primitives(), polygons=[_transform_points(np.asarray(points, dtype=float), poses)
+                                                      for points in motif.polygons])
+
+
+def flatten_geometry(geometry, instances=None):
+    # World-space primitive arrays with every motif placement applied in bulk:
+    #   lines (n, 4), arcs (n, 5), dots (n, 3), polygons [(n, k, 2), ...]
+    # Large results come back as memmaps (see kolam_columns).
+    columns = {"lines": PrimitiveColumns(4), "arcs": PrimitiveColumns(5), "dots": PrimitiveColumns(3)}
+    polygons = []
+    for chunk in iter_flatten_geometry(geometry, instances):
+        for kind, store in columns.items():
+            if len(chunk[kind]):
+                store.extend(chunk[kind])
+        polygons.extend(chunk["polygons"])
+    flat = {kind: store.array() for kind, store in columns.items()}
+    flat["polygons"] = [p for p in polygons if p.size]
+    return flat
+
+
+def arc_segment_count(radius, sweep, tolerance=ARC_TOLERANCE):
+    # A chord spanning angle t misses its arc by the sagitta r * (1 - cos(t / 2)),
+    # so the widest step that stays within tolerance is 2 * acos(1 - tolerance / r)
+    radius = abs(radius)
+    if radius <= tolerance:
+        return 1
+    step = 2 * math.acos(1 - tolerance / radius)
+    return max(1, math.ceil(math.radians(abs(sweep)) / step))
+
+
+@lru_cache(maxsize=512)
+def unit_arc(sweep, segments):
+    # (segments + 1, 2) points on the unit circle from 0 to `sweep` degrees
+    angles = np.radians(np.linspace(0.0, sweep, segments + 1))
+    table = np.stack([np.cos(angles), np.sin(angles)], axis=1)
+    table.setflags(write=False)
+    return table
+
+
+def flatten_arcs(arcs, tolerance=ARC_TOLERANCE):
+    # Polylines for many arcs (n, 5) at once. Arcs sharing a sweep and segment
+    # count reuse one cached unit table, scaled and rotated in bulk. Returns
+    # [(arc_indices, vertices (m, segments + 1, 2)), ...]
+    arcs = np.asarray(arcs, dtype=float).reshape(-1, 5)
+    radius = np.abs(arcs[:, 2])
+    ratio = np.clip(1 - tolerance / np.maximum(radius, tolerance), -1.0, 1.0)
+    step = 2 * np.arccos(ratio)
+    counts = np.where(radius <= tolerance, 1,
+                      np.ceil(np.radians(np.abs(arcs[:, 4])) / np.maximum(step, 1e-12)))
+    counts = np.maximum(counts, 1).astype(np.int64)
+
+    groups = []
+    keys = np.stack([np.round(arcs[:, 4], 6), counts], axis=1)
+    for sweep, segments in np.unique(keys, axis=0):
+        members = np.nonzero((keys[:, 0] == sweep) & (keys[:, 1] == segments))[0]
+        table = unit_arc(float(sweep), int(segments))
+        start = np.radians(arcs[members, 3])[:, None]
+        cos_s, sin_s = np.cos(start), np.sin(start)
+        r = arcs[members, 2][:, None]
+        x = arcs[members, 0][:, None] + r * (table[None, :, 0] * cos_s - table[None, :, 1] * sin_s)
+        y = arcs[members, 1][:, None] + r * (table[None, :, 0] * sin_s + table[None, :, 1] * cos_s)
+        groups.append((members, np.stack([x, y], axis=-1)))
+    return groups
+
+
+def flatten_arc(cx, cy, radius, start, sweep, tolerance=ARC_TOLERANCE):
+    # Single arc as a (segments + 1, 2) polyline
+    _, vertices = flatten_arcs([(cx, cy, radius, start, sweep)], tolerance)[0]
+    return vertices[0]
+
+
+# Function to expand the L-System string (from kolampython.py)
+def expand_lsystem_string(axiom, rules, iterations):
+    result = axiom
+    for _ in range(iterations):
+        result = "".join([rules.get(ch, ch) for ch in result])
+    return result
+
+
+def lsystem_motifs(dot_size):
+    # "A" is a quarter arc of radius dot_size; "B" is a short line followed by a
+    # 270 degree arc. Both start at the origin heading along +x, with the arc
+    # centre to the right of the heading as in the turtle version.
+    forward_units = 5 / (2 ** 0.5)
+    motif_a = KolamMotif(
+        arcs=[(0.0, dot_size, dot_size, -90.0, 90.0)],
+        end=(dot_size, dot_size, 90.0),
+    )
+    motif_b = KolamMotif(
+        lines=[(0.0, 0.0, forward_units, 0.0)],
+        arcs=[(forward_units, forward_units, forward_units, -90.0, 270.0)],
+        end=(0.0, forward_units, 270.0),
+    )
+    return {"A": motif_a, "B": motif_b}
+
+
+def advance_pose(x, y, heading, end):
+    # Move a turtle pose by a motif's end pose given in its local frame
+    end_x, end_y, turn = end
+    cos_h = math.cos(math.radians(heading))
+    sin_h = math.sin(math.radians(heading))
+    return x + end_x * cos_h - end_y * sin_h, y + end_x * sin_h + end_y * cos_h, (heading + turn) % 360
+
+
+# Below this many symbols a process pool costs more than it saves
+PARALLEL_MIN_SYMBOLS = 1 << 20
+
+
+def lsystem_range_poses(expansion, dot_size, motifs, boundaries, start=(0.0, 0.0, 0.0)):
+    # Turtle pose at each boundary of an LSystemExpansion, without interpreting
+    # the symbols in between: every node's net motion is folded once and reused
+    def leaf(symbol):
+        if symbol == "F":
+            return (dot_size, 0.0, 0.0)
+        return motifs[symbol].end if symbol in motifs else (0.0, 0.0, 0.0)
+
+    def combine(first, second):
+        return advance_pose(*first, second)
+
+    memo = {}
+    poses = [start]
+    for lo, hi in zip(boundaries[:-1], boundaries[1:]):
+        poses.append(combine(poses[-1], expansion.fold(lo, hi, leaf, combine, (0.0, 0.0, 0.0), memo)))
+    return poses
+
+
+def _interpret_range(expansion, start, stop, dot_size, pose):
+    lines, instances = PrimitiveColumns(4), InstanceColumns()
+    interpret_lsystem(expansion.chunks(start, stop), dot_size, lsystem_motifs(dot_size), lines, instances, *pose)
+    return lines.array(), instances.names, instances.array()
+
+
+def interpret_lsystem(lsystem_string, dot_size, motifs, lines, instances, x=0.0, y=0.0, heading=0.0):
+    # lsystem_string: a str, an LSystemExpansion, or an iterable of str chunks
+    chunks = [lsystem_string] if isinstance(lsystem_string, str) else \
+        lsystem_string.chunks() if isinstance(lsystem_string, LSystemExpansion) else lsystem_string
+    for chunk in chunks:
+        for symbol in chunk:
+            if symbol == "F":
+                new_x = x + dot_size * math.cos(math.radians(heading))
+                new_y = y + dot_size * math.sin(math.radians(heading))
+                lines.append((x, y, new_x, new_y))
+                x, y = new_x, new_y
+            elif symbol in motifs:
+                instances.append((symbol, x, y, heading))
+                x, y, heading = advance_pose(x, y, heading, motifs[symbol].end)
+    return x, y, heading
+
+
+def lsystem_geometry(lsystem_string, dot_size, start_x, start_y, width=600, height=600, workers=None):
+    geometry = KolamGeometry(width, height)
+    for name, motif in lsystem_motifs(dot_size).items():
+        geometry.add_motif(name, motif)
+
+    start = (start_x, start_y, 0.0)
+    if not (workers and workers > 1 and isinstance(lsystem_string, LSystemExpansion)
+            and len(lsystem_string) >= PARALLEL_MIN_SYMBOLS):
+        interpret_lsystem(lsystem_string, dot_size, geometry.motifs, geometry.lines, geometry.instances, *start)
+        return geometry
+
+    # Range-parallel: each worker interprets one slice from its folded start pose
+    boundaries = lsystem_string.split(workers)
+    poses = lsystem_range_poses(lsystem_string, dot_size, geometry.motifs, boundaries, start)
+    with ProcessPoolExecutor(workers) as executor:
+        ranges = executor.map(_interpret_range, [lsystem_string] * workers, boundaries[:-1], boundaries[1:],
+                              [dot_size] * workers, poses[:-1])
+        for lines, names, instances in ranges:
+            geometry.lines.extend(lines)
+            geometry.instances.extend_coded(names, instances)
+    return geometry
+
+
+def axiom_period(axiom):
+    # Length of the shortest block the axiom is a repetition of ("FB" for "FBFBFBFB")
+    for period in range(1, len(axiom) // 2 + 1):
+        if len(axiom) % period == 0 and axiom[:period] * (len(axiom) // period) == axiom:
+            return period
+    return len(axiom)
+
+
+def rotational_symmetry(start, domain_end, copies):
+    # Copy i of the fundamental domain is placed at start * T^i, where T is the
+    # domain's end pose. T is a rotation by its turn about a fixed point, so the
+    # design is invariant under C_n with n the order of that turn.
+    turn = round(domain_end[2], 6) % 360
+    # Smallest number of copies after which the turtle faces its start heading
+    order = next((n for n in range(1, copies + 1) if round(n * turn, 6) % 360 == 0), None)
+    if copies < 2 or turn == 0 or order is None:
+        return {"group": "C1", "order": 1, "center": None, "domain": None}
+
+    # Fixed point c of T in the domain frame: c = R c + t  =>  (I - R) c = t
+    end_x, end_y, _ = domain_end
+    cos_t, sin_t = math.cos(math.radians(turn)), math.sin(math.radians(turn))
+    a, b, c, d = 1 - cos_t, sin_t, -sin_t, 1 - cos_t
+    det = a * d - b * c
+    local_x = (d * end_x - b * end_y) / det
+    local_y = (-c * end_x + a * end_y) / det
+    center_x, center_y, _ = advance_pose(*start, (local_x, local_y, 0.0))
+    return {"group": f"C{order}", "order": order, "center": (center_x, center_y), "domain": "D"}
+
+
+def lsystem_symmetric_geometry(axiom, rules, iterations, dot_size, start_x, start_y, width=600, height=600):
+    # Rewriting is context free, so expand(u * k) == expand(u) * k: expand and
+    # interpret one period of the axiom, then place it k times.
+    period = axiom_period(axiom)
+    copies = len(axiom) // period
+
+    geometry = KolamGeometry(width, height)
+    for name, motif in lsystem_motifs(dot_size).items():
+        geometry.add_motif(name, motif)
+
+    domain = KolamMotif()
+    unit_string = lsystem_expansion(axiom[:period], rules, iterations)
+    domain.end = interpret_lsystem(unit_string, dot_size, geometry.motifs, domain.lines, domain.instances)
+    geometry.add_motif("D", domain)
+
+    # Nudge the start (by at most half a unit) so the centre of rotation lands
+    # on whole units: the raster renderer can then replicate the domain with
+    # exact array rotations (see kolam_raster.symmetry_frame)
+    symmetry = rotational_symmetry((start_x, start_y, 0.0), domain.end, copies)
+    if symmetry["center"] is not None:
+        center_x, center_y = symmetry["center"]
+        start_x += round(center_x) - center_x
+        start_y += round(center_y) - center_y
+        symmetry = rotational_symmetry((start_x, start_y, 0.0), domain.end, copies)
+
+    pose = (start_x, start_y, 0.0)
+    for _ in range(copies):
+        geometry.place("D", *pose)
+        pose = advance_pose(*pose, domain.end)
+
+    geometry.symmetry = symmetry
+    return geometry
+
+
+def polygon_points(sides, radius):
+    angle_step = 2 * math.pi / sides
+    return [(radius * math.cos(i * angle_step), radius * math.sin(i * angle_step)) for i in range(sides)]
+
+
+def grouptheory_geometry(grid_size, polygon1_sides, polygon1_radius, polygon2_sides, polygon2_radius,
+                         width=800, height=800, scale_factor=40):
+    geometry = KolamGeometry(width, height, stroke_width=1)
+    center_x, center_y = width / 2, height / 2
+
+    # The two polygons only differ by position across the grid
+    for name, sides, radius in (("P1", polygon1_sides, polygon1_radius), ("P2", polygon2_sides, polygon2_radius)):
+        points = [(px * scale_factor / 3, py * scale_factor / 3) for px, py in polygon_points(sides, radius)]
+        geometry.add_motif(name, KolamMotif(polygons=[points] if points else []))
+
+    grid_offset_x = center_x - (grid_size - 1) * scale_factor / 2
+    grid_offset_y = center_y - (grid_size - 1) * scale_factor / 2
+
+    for r_idx in range(grid_size):
+        for c_idx in range(grid_size):
+            name = "P1" if (r_idx + c_idx) % 2 == 0 else "P2"
+            geometry.place(name, grid_offset_x + c_idx * scale_factor, grid_offset_y + r_idx * scale_factor)
+
+    return geometry
@@ -0,0 +1,187 @@
+import bisect
+from functools import lru_cache
+from itertools import chain, groupby
+
+# Grammar-compressed L-system expansions.
+#
+# The rules already are a straight-line program for the expanded string: the
+# expansion of symbol s after d rewrites, node (s, d), is the concatenation of
+# the nodes (c, d - 1) for each c in rules[s]. Storing only those nodes and
+# their cached lengths makes an expansion of any iteration count a few small
+# dicts, while still allowing:
+#   - the symbol at index i in O(depth) bisections,
+#   - slicing and in-order iteration of any range,
+#   - run-length iteration,
+#   - splitting into ranges whose start state is a fold over O(depth) nodes,
+#     so ranges can be interpreted independently.
+
+# Nodes at most this long are expanded once and kept as plain strings
+LEAF_CACHE_LENGTH = 4096
+
+
+class LSystemGrammar:
+    def __init__(self, rules):
+        self.rules = dict(rules)
+        self._lengths = {}
+        self._offsets = {}
+        self._texts = {}
+
+    def is_terminal(self, symbol, depth):
+        return depth == 0 or symbol not in self.rules
+
+    def length(self, symbol, depth):
+        if self.is_terminal(symbol, depth):
+            return 1
+        key = (symbol, depth)
+        if key not in self._lengths:
+            self._lengths[key] = self.offsets(symbol, depth)[-1]
+        return self._lengths[key]
+
+    def offsets(self, symbol, depth):
+        # Prefix lengths of the node's children: child k spans offsets[k]:offsets[k + 1]
+        key = (symbol, depth)
+        if key not in self._offsets:
+            self._offsets[key] = self.sequence_offsets(self.rules[symbol], depth - 1)
+        return self._offsets[key]
+
+    def sequence_offsets(self, symbols, depth):
+        offsets = [0]
+        for child in symbols:
+            offsets.append(offsets[-1] + self.length(child, depth))
+        return offsets
+
+    def text(self, symbol, depth):
+        # Full expansion of a node; only call for nodes up to LEAF_CACHE_LENGTH
+        if self.is_terminal(symbol, depth):
+            return symbol
+        key = (symbol, depth)
+        if key not in self._texts:
+            self._texts[key] = "".join(self.text(child, depth - 1) for child in self.rules[symbol])
+        return self._texts[key]
+
+    def fold(self, symbol, depth, leaf, combine, identity, memo):
+        # Value of a whole node under an associative combine with `identity`
+        # as its neutral element (the value of an empty rule), memoised per node
+        if self.is_terminal(symbol, depth):
+            return leaf(symbol)
+        key = (symbol, depth)
+        if key not in memo:
+            value = identity
+            for child in self.rules[symbol]:
+                value = combine(value, self.fold(child, depth - 1, leaf, combine, identity, memo))
+            memo[key] = value
+        return memo[key]
+
+
+@lru_cache(maxsize=32)
+def _grammar(rule_items):
+    return LSystemGrammar(rule_items)
+
+
+class LSystemExpansion:
+    def __init__(self, grammar, axiom, iterations):
+        self.grammar = grammar
+        self.axiom = axiom
+        self.iterations = iterations
+        self.offsets = grammar.sequence_offsets(axiom, iterations)
+
+    def __len__(self):
+        return self.offsets[-1]
+
+    def _range(self, start, stop):
+        length = len(self)
+        start = 0 if start is None else min(max(start + length if start < 0 else start, 0), length)
+        stop = length if stop is None else min(max(stop + length if stop < 0 else stop, 0), length)
+        return start, max(start, stop)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            if index.step not in (None, 1):
+                return str(self)[index]
+            return "".join(self.chunks(index.start, index.stop))
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("expansion index out of range")
+        symbols, offsets, depth = self.axiom, self.offsets, self.iterations
+        while True:
+            k = bisect.bisect_right(offsets, index) - 1
+            symbol, index = symbols[k], index - offsets[k]
+            if self.grammar.is_terminal(symbol, depth):
+                return symbol
+            symbols, offsets, depth = self.grammar.rules[symbol], self.grammar.offsets(symbol, depth), depth - 1
+
+    def nodes(self, start=None, stop=None):
+        # Fewest whole (symbol, depth) nodes that tile [start, stop), in order
+        start, stop = self._range(start, stop)
+        pending = [(self.axiom, self.offsets, self.iterations, 0)]
+        while pending:
+            symbols, offsets, depth, base = pending.pop()
+            covered = []
+            first = max(bisect.bisect_right(offsets, start - base) - 1, 0)
+            for k in range(first, len(symbols)):
+                lo, hi = base + offsets[k], base + offsets[k + 1]
+                if lo >= stop:
+                    break
+                if start <= lo and hi <= stop:
+                    covered.append((symbols[k], depth))
+                elif hi > start:
+                    covered.append((symbols[k], depth, lo))
+            # Expand partially covered nodes in place, keeping the output ordered
+            for item in reversed(covered):
+                if len(item) == 3:
+                    symbol, depth_, lo = item
+                    pending.append((self.grammar.rules[symbol], self.grammar.offsets(symbol, depth_), depth_ - 1, lo))
+                else:
+                    pending.append(item)
+            while pending and len(pending[-1]) == 2:
+                yield pending.pop()
+
+    def chunks(self, start=None, stop=None):
+        # The range as consecutive strings of at most ~LEAF_CACHE_LENGTH symbols
+        grammar = self.grammar
+        for symbol, depth in self.nodes(start, stop):
+            stack = [(symbol, depth)]
+            while stack:
+                symbol, depth = stack.pop()
+                if grammar.length(symbol, depth) <= LEAF_CACHE_LENGTH:
+                    yield grammar.text(symbol, depth)
+                else:
+                    stack.extend((child, depth - 1) for child in reversed(grammar.rules[symbol]))
+
+    def runs(self, start=None, stop=None):
+        # (symbol, count) for each run of equal symbols, merged across chunks
+        current, count = None, 0
+        for symbol, group in groupby(chain.from_iterable(self.chunks(start, stop))):
+            size = sum(1 for _ in group)
+            if symbol == current:
+                count += size
+            else:
+                if current is not None:
+                    yield current, count
+                current, count = symbol, size
+        if current is not None:
+            yield current, count
+
+    def fold(self, start, stop, leaf, combine, identity, memo):
+        # Reduce a range with an associative combine in O(depth) node values
+        value = identity
+        for symbol, depth in self.nodes(start, stop):
+            value = combine(value, self.grammar.fold(symbol, depth, leaf, combine, identity, memo))
+        return value
+
+    def split(self, parts):
+        # Boundaries of `parts` near-equal ranges
+        return [len(self) * i // parts for i in range(parts + 1)]
+
+    def __iter__(self):
+        return chain.from_iterable(self.chunks())
+
+    def __str__(self):
+        return "".join(self.chunks())
+
+
+def lsystem_expansion(axiom, rules, iterations):
+    # Expansions of one rule set share a grammar, so its node lengths and small
+    # node texts are computed once for every axiom and iteration count
+    return LSystemExpansion(_grammar(tuple(sorted(rules.items()))), axiom, iterations)
@@ -0,0 +1,139 @@
+import io
+
+import cv2
+import numpy as np
+from PIL import Image
+
+from kolam_analysis import ANALYSIS_SIZE, EXIF_ORIENTATION, color_metrics, ink_mask, load_image, open_image, \
+    structural_metrics
+from kolam_raster import raster_format_available
+
+# One decode per upload.
+#
+# prepare_upload decodes the upload once (see load_image) and hands back both
+# the upright RGB image every local stage works from (analysis, perceptual
+# hash, model_payload) and a model-ready copy of the upload. Uploads that
+# already fit the payload limits are kept untouched; only oversized, rotated
+# or unusual formats are re-encoded, and then from the already-decoded image.
+#
+# model_payload then builds the compact image actually sent to the model.
+
+# Formats the model accepts as-is
+PASSTHROUGH_FORMATS = {"JPEG": "image/jpeg", "PNG": "image/png", "WEBP": "image/webp"}
+MAX_PASSTHROUGH_BYTES = 4 << 20
+JPEG_QUALITY = 90
+
+# Model payload sides to try, smallest first. Gemini bills an image of at most
+# 384 px a side as one 258-token tile and larger ones per 768 px tile, so each
+# step down saves input tokens as well as upload bytes.
+PAYLOAD_SIDES = (384, 768)
+# A smaller payload must keep the dot count and grid and this much of the
+# full-resolution line length, with strokes still this many pixels wide
+LINE_LENGTH_TOLERANCE = 0.1
+MIN_PAYLOAD_STROKE = 1.5
+# Chroma spread (see color_metrics) above which colour is kept (rangoli);
+# below it the drawing is sent as black-on-white line art
+COLOR_PAYLOAD_VARIANCE = 0.15
+PAYLOAD_JPEG_QUALITY = 85
+
+
+def encode_payload(image, photographic):
+    # Photos as JPEG, drawings and screenshots as fast (not optimised) PNG
+    out = io.BytesIO()
+    if photographic:
+        image.save(out, format="JPEG", quality=JPEG_QUALITY)
+        return out.getvalue(), "image/jpeg"
+    image.save(out, format="PNG", compress_level=1)
+    return out.getvalue(), "image/png"
+
+
+def upload_size(image_bytes):
+    if isinstance(image_bytes, (bytes, bytearray, memoryview)):
+        return len(image_bytes)
+    image_bytes.seek(0, io.SEEK_END)
+    return image_bytes.tell()
+
+
+def prepare_upload(image_bytes, max_side=ANALYSIS_SIZE):
+    # -> {"image", "original_size", "data", "mime_type"}. `image_bytes` may
+    # also be a seekable binary file; it is only read whole when passed through.
+    header = open_image(image_bytes)
+    passthrough = (
+        header.format in PASSTHROUGH_FORMATS
+        and max(header.size) <= max_side
+        and upload_size(image_bytes) <= MAX_PASSTHROUGH_BYTES
+        and header.getexif().get(EXIF_ORIENTATION, 1) == 1
+    )
+    source_format = header.format
+    image, original_size = load_image(image_bytes, max_side)
+    if passthrough:
+        if not isinstance(image_bytes, (bytes, bytearray, memoryview)):
+            image_bytes.seek(0)
+            image_bytes = image_bytes.read()
+        data, mime_type = bytes(image_bytes), PASSTHROUGH_FORMATS[source_format]
+    else:
+        data, mime_type = encode_payload(image, source_format == "JPEG")
+    return {"image": image, "original_size": original_size, "data": data, "mime_type": mime_type}
+
+
+def _ink_box(mask, margin):
+    rows, cols = np.nonzero(mask.any(axis=1))[0], np.nonzero(mask.any(axis=0))[0]
+    if not len(rows):
+        return 0, 0, mask.shape[1], mask.shape[0]
+    return (max(cols[0] - margin, 0), max(rows[0] - margin, 0),
+            min(cols[-1] + 1 + margin, mask.shape[1]), min(rows[-1] + 1 + margin, mask.shape[0]))
+
+
+def _metrics_match(reference, candidate):
+    dots, candidate_dots = len(reference["dots"]), len(candidate["dots"])
+    if abs(dots - candidate_dots) > int(0.02 * dots):
+        return False
+    if reference["grid"]["type"] != candidate["grid"]["type"]:
+        return False
+    if reference["line_length"] and abs(candidate["line_length"] - reference["line_length"]) > LINE_LENGTH_TOLERANCE * reference["line_length"]:
+        return False
+    return True
+
+
+def model_payload(image):
+    # -> (bytes, mime_type, side): the drawing cropped to its ink, at the
+    # smallest PAYLOAD_SIDES size whose structural metrics (dots, grid, line
+    # length) still match the full image, as black-on-white line art
+    # (lossless WebP, PNG without WebP support) or, for colourful designs, JPEG
+    mask = ink_mask(image)
+    reference = structural_metrics(mask)
+    margin = max(4, int(np.ceil(reference["stroke_width"])))
+    left, top, right, bottom = _ink_box(mask, margin)
+    mask = mask[top:bottom, left:right]
+    full_side = max(mask.shape)
+    coverage = mask.astype(np.float32)
+
+    side = full_side
+    for candidate_side in PAYLOAD_SIDES:
+        if candidate_side >= full_side:
+            break
+        scale = full_side / candidate_side
+        if reference["stroke_width"] / scale < MIN_PAYLOAD_STROKE:
+            continue
+        size = (max(1, round(mask.shape[1] / scale)), max(1, round(mask.shape[0] / scale)))
+        small = cv2.resize(coverage, size, interpolation=cv2.INTER_AREA) >= 0.5
+        if _metrics_match(reference, structural_metrics(small, mask.shape[1] / size[0])):
+            side = candidate_side
+            break
+
+    out = io.BytesIO()
+    cropped = image.crop((left, top, right, bottom))
+    size = (max(1, round(mask.shape[1] * side / full_side)), max(1, round(mask.shape[0] * side / full_side)))
+    if color_metrics(cropped)["variance"] > COLOR_PAYLOAD_VARIANCE:
+        cropped.resize(size, Image.BOX).save(out, format="JPEG", quality=PAYLOAD_JPEG_QUALITY)
+        return out.getvalue(), "image/jpeg", side
+    # Ink black on white whatever the original polarity (chalk on a dark floor)
+    if size != (mask.shape[1], mask.shape[0]):
+        mask = cv2.resize(coverage, size, interpolation=cv2.INTER_AREA) >= 0.5
+    line_art = Image.fromarray(~mask)
+    if raster_format_available("webp"):
+        # Lossless WebP packs bilevel drawings ~20-45% tighter than 1-bit PNG
+        line_art.convert("L").save(out, format="WEBP", lossless=True)
+        return out.getvalue(), "image/webp", side
+    line_art.save(out, format="PNG")
+    return out.getvalue(), "image/png", side
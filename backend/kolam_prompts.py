@@ -0,0 +1,72 @@
+# Versioned prompt templates for the Gemini calls.
+#
+# A template is addressed by id ("<name>/v<n>") and never edited once in use:
+# changing a prompt means adding a version and pointing CURRENT_PROMPTS at it.
+# The id is part of the analysis cache key, so answers to an old prompt are
+# not served for a new one.
+#
+# Current templates keep the fixed instruction block in `system_instruction`
+# (cacheable server-side, see gemini_client.template_model) and describe the
+# answer with a structured-output `response_schema` instead of a prose JSON
+# skeleton; `prompt` is the short per-image part. `fallback` names the prose
+# version to use where structured output isn't accepted.
+
+KOLAM_ANALYSIS_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "complexity": {"type": "string", "enum": ["Beginner", "Intermediate", "Advanced"]},
+        "algorithm": {"type": "array", "items": {"type": "string"}},
+        "culturalSignificance": {"type": "string"},
+    },
+    "required": ["complexity", "algorithm", "culturalSignificance"],
+}
+
+KOLAM_ANALYSIS_INSTRUCTION = (
+    "You analyse images of Kolam designs. Symmetry, grid, dots and measurements are measured separately; "
+    "give only: complexity (level of intricacy), algorithm (the likely construction method as ordered, "
+    "detailed steps) and culturalSignificance (a comprehensive account of the design's symbolism, "
+    "elements and cultural context)."
+)
+
+PROMPT_TEMPLATES = {
+    # The user's requested hardcoded prompt for Kambi Kolam
+    "kolam-analysis/v1": {
+        "system_instruction": None,
+        "prompt": '''
+Analyze the provided Kolam design image. Generate a detailed mathematical and cultural analysis in JSON format. The JSON must adhere to the following structure and content guidelines, inferring all details from the image:
+
+{
+  "complexity": "<Inferred complexity level: e.g., Beginner, Intermediate, Advanced>",
+  "algorithm": [
+    "<Step-by-step description of how the Kolam appears to be constructed>",
+    "<Add more steps as detailed as possible>"
+  ],
+  "culturalSignificance": "<Detailed explanation of the cultural significance and symbolism of the Kolam design, its elements, and its context>"
+}
+
+For `complexity`, assign a level based on intricacy. For `algorithm`, describe the likely construction method. For `culturalSignificance`, give a comprehensive cultural context. Ensure all arrays are populated with relevant information or a single 'N/A' entry if no patterns are found. Do not include any additional text outside the JSON object.
+''',
+        "response_schema": None,
+    },
+    "kolam-analysis/v2": {
+        "system_instruction": KOLAM_ANALYSIS_INSTRUCTION,
+        "prompt": "Analyze this Kolam.",
+        "response_schema": KOLAM_ANALYSIS_SCHEMA,
+        "fallback": "kolam-analysis/v1",
+    },
+    # Several images per call (bulk jobs): `prompt` is formatted with the
+    # image count and followed by "Image <n>:" labels and the images
+    "kolam-analysis-batch/v1": {
+        "system_instruction": KOLAM_ANALYSIS_INSTRUCTION,
+        "prompt": "Analyze each of these {count} Kolam images separately. Answer with one analysis per image, in the order given.",
+        "response_schema": {"type": "array", "items": KOLAM_ANALYSIS_SCHEMA},
+    },
+}
+
+CURRENT_PROMPTS = {"kolam-analysis": "kolam-analysis/v2", "kolam-analysis-batch": "kolam-analysis-batch/v1"}
+
+
+def prompt_template(name_or_id):
+    # A template by name (current version) or by explicit id
+    template_id = CURRENT_PROMPTS.get(name_or_id, name_or_id)
+    return dict(PROMPT_TEMPLATES[template_id], id=template_id)
@@ -0,0 +1,282 @@
+import io
+import numpy as np
+from PIL import Image
+
+from kolam_geometry import iter_flatten_geometry
+
+# Headless anti-aliased rasterizer for kolam geometry.
+#
+# Every primitive is drawn from its exact distance field: a pixel's ink
+# coverage is how far its centre lies inside the stroke, clipped to [0, 1].
+# Primitives are stamped in batches of equally sized patches so the work is a
+# handful of NumPy operations per batch rather than per pixel or per segment.
+# Nothing here touches global state, so it is safe to call from worker threads.
+
+# Upper bound on patch pixels evaluated per batch (keeps temporaries to a few MB)
+BATCH_PIXELS = 1 << 19
+
+
+def _segment_distance(px, py, x1, y1, x2, y2):
+    dx, dy = x2 - x1, y2 - y1
+    length_sq = np.maximum(dx * dx + dy * dy, 1e-12)
+    t = np.clip(((px - x1) * dx + (py - y1) * dy) / length_sq, 0.0, 1.0)
+    return np.hypot(px - (x1 + t * dx), py - (y1 + t * dy))
+
+
+def _arc_distance(px, py, cx, cy, radius, start, sweep):
+    # Normalise to a counter-clockwise (in degrees) sweep from `start`
+    start = np.where(sweep < 0, start + sweep, start)
+    sweep = np.abs(sweep)
+    dx, dy = px - cx, py - cy
+    relative = (np.degrees(np.arctan2(dy, dx)) - start) % 360
+    on_arc = np.abs(np.hypot(dx, dy) - radius)
+
+    start_rad, end_rad = np.radians(start), np.radians(start + sweep)
+    to_start = np.hypot(px - (cx + radius * np.cos(start_rad)), py - (cy + radius * np.sin(start_rad)))
+    to_end = np.hypot(px - (cx + radius * np.cos(end_rad)), py - (cy + radius * np.sin(end_rad)))
+    return np.where(relative <= sweep, on_arc, np.minimum(to_start, to_end))
+
+
+def _stamp(coverage, boxes, params, coverage_fn, origin=(0, 0)):
+    # boxes: (n, 4) pixel-space x0, y0, x1, y1 per primitive; params: (n, k)
+    # columns handed to coverage_fn(px, py, *columns) broadcast per patch.
+    # `origin` is the canvas' top-left pixel when rendering a tile.
+    height, width = coverage.shape
+    if not len(boxes):
+        return
+    # Clip each box to the canvas first so a big primitive crossing a small
+    # tile only costs the pixels it can actually touch
+    left = np.maximum(np.floor(boxes[:, 0]).astype(np.int64) - origin[0], 0)
+    top = np.maximum(np.floor(boxes[:, 1]).astype(np.int64) - origin[1], 0)
+    right = np.minimum(np.ceil(boxes[:, 2]).astype(np.int64) - origin[0], width - 1)
+    bottom = np.minimum(np.ceil(boxes[:, 3]).astype(np.int64) - origin[1], height - 1)
+    visible = (right >= left) & (bottom >= top)
+    size = np.maximum(right - left, bottom - top) + 1
+
+    # Bucket patch sizes to powers of two so each batch shares one patch shape
+    buckets = np.left_shift(1, np.ceil(np.log2(np.maximum(size, 1))).astype(np.int64))
+    flat = coverage.reshape(-1)
+
+    for bucket in np.unique(buckets[visible]):
+        members = np.nonzero(visible & (buckets == bucket))[0]
+        per_batch = max(1, BATCH_PIXELS // int(bucket * bucket))
+        offsets = np.arange(bucket)
+        for start in range(0, len(members), per_batch):
+            batch = members[start:start + per_batch]
+            cols = left[batch, None, None] + offsets[None, None, :]
+            rows = top[batch, None, None] + offsets[None, :, None]
+            px = cols + origin[0] + 0.5
+            py = rows + origin[1] + 0.5
+            columns = [params[batch, i, None, None] for i in range(params.shape[1])]
+            values = coverage_fn(px, py, *columns)
+
+            inside = (cols >= 0) & (cols < width) & (rows >= 0) & (rows < height) & (values > 0)
+            index = (rows * width + cols)[inside]
+            np.maximum.at(flat, index, values[inside].astype(coverage.dtype))
+
+
+def _polygon_segments(polygons):
+    segments = []
+    for points in polygons:
+        closed = np.concatenate([points, points[:, :1]], axis=1)
+        segments.append(np.concatenate([closed[:, :-1], closed[:, 1:]], axis=2).reshape(-1, 4))
+    return np.concatenate(segments) if segments else np.zeros((0, 4))
+
+
+def scale_rows(kind, rows, scale, offset=(0.0, 0.0)):
+    # Geometry units -> output pixels for rows of one kind ("lines", "arcs" or
+    # "dots"); a new in-memory array, so pass a chunk of a big mapped column
+    ox, oy = offset
+    rows = np.array(rows, dtype=float)
+    if kind == "lines":
+        rows *= scale
+        rows[:, [0, 2]] += ox
+        rows[:, [1, 3]] += oy
+    else:
+        # Arcs and dots: centre and radius scale, angles don't
+        rows[:, :3] *= scale
+        rows[:, 0] += ox
+        rows[:, 1] += oy
+    return rows
+
+
+def scale_primitives(primitives, scale, offset=(0.0, 0.0)):
+    # A flatten_geometry result in output pixels, polygon outlines as lines
+    lines = np.concatenate([np.asarray(primitives["lines"]), _polygon_segments(primitives["polygons"])])
+    return {"lines": scale_rows("lines", lines, scale, offset),
+            "arcs": scale_rows("arcs", primitives["arcs"], scale, offset),
+            "dots": scale_rows("dots", primitives["dots"], scale, offset)}
+
+
+def arc_extents(arcs):
+    # Tight box of each arc: its end points plus any axis extreme it sweeps over
+    cx, cy, radius, start, sweep = (arcs[:, i] for i in range(5))
+    start = np.where(sweep < 0, start + sweep, start)
+    sweep = np.abs(sweep)
+    ends = [np.radians(start), np.radians(start + sweep)]
+    xs = [cx + radius * np.cos(angle) for angle in ends]
+    ys = [cy + radius * np.sin(angle) for angle in ends]
+    for axis_angle, dx, dy in ((0, 1, 0), (90, 0, 1), (180, -1, 0), (270, 0, -1)):
+        covered = (axis_angle - start) % 360 <= sweep
+        xs.append(np.where(covered, cx + dx * radius, xs[0]))
+        ys.append(np.where(covered, cy + dy * radius, ys[0]))
+    xs, ys = np.stack(xs), np.stack(ys)
+    return np.stack([xs.min(axis=0), ys.min(axis=0), xs.max(axis=0), ys.max(axis=0)], axis=1)
+
+
+def kind_boxes(kind, rows, half_width):
+    # Pixel bounding boxes (x0, y0, x1, y1) of the inked area of each scaled row
+    pad = half_width + 1
+    if kind == "lines":
+        return np.stack([
+            np.minimum(rows[:, 0], rows[:, 2]) - pad, np.minimum(rows[:, 1], rows[:, 3]) - pad,
+            np.maximum(rows[:, 0], rows[:, 2]) + pad, np.maximum(rows[:, 1], rows[:, 3]) + pad,
+        ], axis=1)
+    if kind == "arcs":
+        return arc_extents(rows) + np.array([-pad, -pad, pad, pad])
+    return np.stack([
+        rows[:, 0] - rows[:, 2] - 1, rows[:, 1] - rows[:, 2] - 1,
+        rows[:, 0] + rows[:, 2] + 1, rows[:, 1] + rows[:, 2] + 1,
+    ], axis=1)
+
+
+def primitive_boxes(scaled, half_width):
+    return tuple(kind_boxes(kind, scaled[kind], half_width) for kind in ("lines", "arcs", "dots"))
+
+
+def rasterize_primitives(coverage, scaled, half_width, origin=(0, 0), boxes=None):
+    line_boxes, arc_boxes, dot_boxes = boxes or primitive_boxes(scaled, half_width)
+
+    def stroke(distance):
+        return np.clip(half_width + 0.5 - distance, 0.0, 1.0)
+
+    _stamp(coverage, line_boxes, scaled["lines"],
+           lambda px, py, *p: stroke(_segment_distance(px, py, *p)), origin)
+    _stamp(coverage, arc_boxes, scaled["arcs"],
+           lambda px, py, *p: stroke(_arc_distance(px, py, *p)), origin)
+    _stamp(coverage, dot_boxes, scaled["dots"],
+           lambda px, py, cx, cy, r: np.clip(r + 0.5 - np.hypot(px - cx, py - cy), 0.0, 1.0), origin)
+
+
+def rasterize_geometry(coverage, geometry, scale, half_width, instances=None, origin=(0, 0)):
+    # One flattened chunk at a time (coverage only ever grows, so the order
+    # doesn't matter): memory stays bounded by a chunk of primitives, however
+    # big the design or its spilled columns
+    for chunk in iter_flatten_geometry(geometry, instances):
+        rasterize_primitives(coverage, scale_primitives(chunk, scale), half_width, origin)
+
+
+def composite(coverage, color=(0, 0, 0), background=(255, 255, 255)):
+    color = np.asarray(color, dtype=np.float32)
+    background = np.asarray(background, dtype=np.float32)
+    pixels = background + (color - background) * coverage[..., None]
+    return np.rint(pixels).astype(np.uint8)
+
+
+def symmetry_frame(geometry, scale=1.0):
+    # Canvas around a C2/C4 design's centre of rotation on which the quarter or
+    # half turns of np.rot90 are the design's own: (left, top, width, height)
+    # in output pixels, or None when the centre does not sit on the pixel
+    # lattice (rotating the raster would then resample it).
+    symmetry = geometry.symmetry or {}
+    order = symmetry.get("order", 1)
+    if order not in (2, 4) or not symmetry.get("domain") or symmetry.get("center") is None \
+            or geometry.lines or geometry.arcs or geometry.dots or geometry.polygons:
+        return None
+    width = int(np.ceil(geometry.width * scale))
+    height = int(np.ceil(geometry.height * scale))
+    cx, cy = symmetry["center"][0] * scale, symmetry["center"][1] * scale
+    # Pixel centres map to pixel centres when 2c is whole (and, for quarter
+    # turns, cx - cy is whole too)
+    whole = [2 * cx, 2 * cy] + ([cx - cy] if order == 4 else [])
+    if any(abs(value - round(value)) > 1e-6 for value in whole):
+        return None
+    cx, cy = round(2 * cx) / 2, round(2 * cy) / 2
+    # Half extents reaching every canvas edge, with the frame's corner on a pixel
+    half_x = np.ceil(max(cx, width - cx) - cx % 1) + cx % 1
+    half_y = np.ceil(max(cy, height - cy) - cy % 1) + cy % 1
+    if order == 4:
+        half_x = half_y = max(half_x, half_y)
+    return int(cx - half_x), int(cy - half_y), int(2 * half_x), int(2 * half_y)
+
+
+def render_coverage(geometry, scale=1.0, use_symmetry=True):
+    width = int(np.ceil(geometry.width * scale))
+    height = int(np.ceil(geometry.height * scale))
+    coverage = np.zeros((height, width), dtype=np.float32)
+    half_width = geometry.stroke_width * scale / 2
+
+    frame = symmetry_frame(geometry, scale) if use_symmetry else None
+    if frame is not None:
+        # C2/C4: rasterize one copy of the fundamental domain on a frame
+        # centred on the centre of rotation, fill in the rest with 180/90
+        # degree array rotations, then crop the canvas out of the frame
+        left, top, frame_width, frame_height = frame
+        symmetry = geometry.symmetry
+        domain = [instance for instance in geometry.instances if instance[0] == symmetry["domain"]][:1]
+        canvas = np.zeros((frame_height, frame_width), dtype=np.float32)
+        rasterize_geometry(canvas, geometry, scale, half_width, domain, (left, top))
+        quarter_turns = (1, 2, 3) if symmetry["order"] == 4 else (2,)
+        rotated = [np.rot90(canvas, k).copy() for k in quarter_turns]
+        for copy in rotated:
+            np.maximum(canvas, copy, out=canvas)
+        coverage[:] = canvas[-top:height - top, -left:width - left]
+        return coverage
+
+    rasterize_geometry(coverage, geometry, scale, half_width)
+    return coverage
+
+
+def render_geometry(geometry, scale=1.0, color=(0, 0, 0), background=(255, 255, 255), use_symmetry=True):
+    return Image.fromarray(composite(render_coverage(geometry, scale, use_symmetry), color, background))
+
+
+def render_png(geometry, dpi=96, color=(0, 0, 0), background=(255, 255, 255)):
+    # Geometry units are CSS pixels (96 per inch), so dpi only sets the scale
+    image = render_geometry(geometry, dpi / 96, color, background)
+    buffer = io.BytesIO()
+    image.save(buffer, format="PNG", dpi=(dpi, dpi))
+    return buffer.getvalue()
+
+
+# Encoded raster formats: name -> (Pillow format, media type)
+RASTER_FORMATS = {
+    "png": ("PNG", "image/png"),
+    "webp": ("WEBP", "image/webp"),
+    "avif": ("AVIF", "image/avif"),
+}
+
+
+def raster_format_available(output_format):
+    if output_format not in RASTER_FORMATS:
+        return False
+    from PIL import features
+    return output_format == "png" or bool(features.check(output_format))
+
+
+def encode_image(image, output_format, dpi=None):
+    pil_format, _ = RASTER_FORMATS[output_format]
+    options = {}
+    if output_format == "webp":
+        options = {"quality": 90, "method": 4}
+    elif output_format == "avif":
+        options = {"quality": 75}
+    if dpi and output_format == "png":
+        options["dpi"] = (dpi, dpi)
+    buffer = io.BytesIO()
+    image.save(buffer, format=pil_format, **options)
+    return buffer.getvalue()
+
+
+def thumbnail_pyramid(image, sizes):
+    # Longest-side sizes from one render: halve with box reduction while the
+    # image is at least twice the target, then finish with a Lanczos resize
+    thumbnails = {}
+    current = image
+    for size in sorted(set(sizes), reverse=True):
+        while max(current.size) >= 2 * size:
+            current = current.reduce(2)
+        ratio = size / max(current.size)
+        target = (max(1, round(current.size[0] * ratio)), max(1, round(current.size[1] * ratio)))
+        thumbnails[size] = current if target == current.size else current.resize(target, Image.LANCZOS)
+    return thumbnails
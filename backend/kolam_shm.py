@@ -0,0 +1,91 @@
+import secrets
+from multiprocessing import shared_memory
+
+import numpy as np
+
+# Shared-memory transport for arrays crossing the worker/parent boundary.
+#
+# The producer packs named arrays into one segment and returns a small handle
+# (segment name + dtype/shape/offset per field) that pickles in microseconds.
+# The consumer takes a lease on the handle: the arrays are NumPy views straight
+# onto the segment, and releasing the lease unlinks it. Segments are named from
+# a token chosen by the consumer, so a result nobody collected (worker timed out
+# or was killed) can still be found and unlinked.
+
+SEGMENT_PREFIX = "kolam_"
+# Field alignment inside a segment, enough for any dtype and for SIMD loads
+ALIGNMENT = 64
+
+
+def new_token():
+    return secrets.token_hex(8)
+
+
+def segment_name(token):
+    return SEGMENT_PREFIX + token
+
+
+def _layout(arrays):
+    fields, offset = {}, 0
+    for key, array in arrays.items():
+        offset = -(-offset // ALIGNMENT) * ALIGNMENT
+        fields[key] = (array.dtype.str, array.shape, offset)
+        offset += array.nbytes
+    return fields, offset
+
+
+def publish_arrays(arrays, token=None):
+    # arrays: {name: ndarray (or bytes)}; returns the handle to send back
+    arrays = {key: np.frombuffer(value, dtype=np.uint8) if isinstance(value, (bytes, bytearray, memoryview))
+              else np.asarray(value) for key, value in arrays.items()}
+    fields, size = _layout(arrays)
+    segment = shared_memory.SharedMemory(name=segment_name(token or new_token()), create=True, size=max(size, 1))
+    try:
+        for key, array in arrays.items():
+            dtype, shape, offset = fields[key]
+            view = np.ndarray(shape, dtype=dtype, buffer=segment.buf, offset=offset)
+            view[...] = array
+            del view
+    except BaseException:
+        segment.close()
+        segment.unlink()
+        raise
+    segment.close()
+    return {"segment": segment.name, "fields": fields}
+
+
+def discard(token):
+    # Unlink a segment whose handle never reached the consumer; no-op if absent
+    try:
+        segment = shared_memory.SharedMemory(name=segment_name(token))
+    except FileNotFoundError:
+        return False
+    segment.close()
+    segment.unlink()
+    return True
+
+
+class SharedLease:
+    def __init__(self, handle):
+        self.segment = shared_memory.SharedMemory(name=handle["segment"])
+        self.arrays = {key: np.ndarray(shape, dtype=dtype, buffer=self.segment.buf, offset=offset)
+                       for key, (dtype, shape, offset) in handle["fields"].items()}
+
+    def __enter__(self):
+        return self.arrays
+
+    def __exit__(self, *exc_info):
+        self.release()
+
+    def release(self):
+        if self.segment is None:
+            return
+        segment, self.segment = self.segment, None
+        self.arrays = {}
+        # Unlink first: the name is gone (and the memory freed once the last
+        # mapping drops) even if a caller still holds a view and close() fails
+        segment.unlink()
+        try:
+            segment.close()
+        except BufferError:
+            pass
@@ -0,0 +1,366 @@
+import io
+import math
+import re
+import zlib
+from collections import Counter
+from xml.etree import ElementTree
+
+from kolam_geometry import KolamGeometry, KolamMotif
+
+
+def _fmt(value):
+    # Three decimals is well below a pixel and keeps the markup short
+    text = f"{value:.3f}".rstrip("0").rstrip(".")
+    return "0" if text == "-0" else text
+
+
+def arc_path_data(cx, cy, radius, start, sweep):
+    start_rad = math.radians(start)
+    end_rad = math.radians(start + sweep)
+    start_x = cx + radius * math.cos(start_rad)
+    start_y = cy + radius * math.sin(start_rad)
+    end_x = cx + radius * math.cos(end_rad)
+    end_y = cy + radius * math.sin(end_rad)
+    large_arc_flag = 1 if abs(sweep) > 180 else 0
+    sweep_flag = 1 if sweep > 0 else 0
+    return (f"M {_fmt(start_x)},{_fmt(start_y)} A {_fmt(radius)},{_fmt(radius)} 0 "
+            f"{large_arc_flag} {sweep_flag} {_fmt(end_x)},{_fmt(end_y)}")
+
+
+def _transform(x, y, rotation):
+    transform = f"translate({_fmt(x)} {_fmt(y)})"
+    if rotation:
+        transform += f" rotate({_fmt(rotation)})"
+    return transform
+
+
+def _rows(store):
+    # Column stores are read a chunk at a time; plain lists as they are
+    if hasattr(store, "chunks"):
+        for chunk in store.chunks():
+            yield chunk.tolist()
+    elif store:
+        yield store
+
+
+def _iter_content(item, stroke_width, motif_ids):
+    # Markup matches what svgwrite emits (attributes sorted by name), built by
+    # hand so giant designs can be written one chunk of primitives at a time
+    stroke = f'stroke="black" stroke-width="{stroke_width}"'
+    for rows in _rows(item.lines):
+        yield "".join(f'<line {stroke} x1="{_fmt(x1)}" x2="{_fmt(x2)}" y1="{_fmt(y1)}" y2="{_fmt(y2)}" />'
+                      for x1, y1, x2, y2 in rows)
+    for rows in _rows(item.arcs):
+        yield "".join(f'<path d="{arc_path_data(*arc)}" fill="none" {stroke} />' for arc in rows)
+    for rows in _rows(item.dots):
+        yield "".join(f'<circle cx="{_fmt(cx)}" cy="{_fmt(cy)}" fill="black" r="{_fmt(radius)}" />'
+                      for cx, cy, radius in rows)
+    for points in item.polygons:
+        point_data = " ".join(f"{_fmt(px)},{_fmt(py)}" for px, py in points)
+        yield f'<polygon fill="none" points="{point_data}" {stroke} />'
+    instances = item.instances
+    if hasattr(instances, "names"):
+        # Column-stored placements: rows hold a name code
+        for rows in _rows(instances):
+            yield "".join(f'<use transform="{_transform(x, y, rotation)}" '
+                          f'xlink:href="#{motif_ids[instances.names[int(code)]]}" />'
+                          for code, x, y, rotation in rows)
+    else:
+        for name, x, y, rotation in instances:
+            yield f'<use transform="{_transform(x, y, rotation)}" xlink:href="#{motif_ids[name]}" />'
+
+
+def _motif_id(name, motif):
+    # Derive the id from the motif's shape so two kolams inlined on the same
+    # page never resolve each other's <use> references to a different shape
+    key = zlib.crc32(repr((motif.polygons, getattr(motif.instances, "names", None))).encode())
+    for store in (motif.lines, motif.arcs, motif.dots, motif.instances):
+        for rows in _rows(store):
+            key = zlib.crc32(repr(rows).encode(), key)
+    return f"kolam-{name}-{key:08x}"
+
+
+def _placed_names(instances):
+    if hasattr(instances, "names"):
+        return list(instances.names)
+    return [name for name, _, _, _ in instances]
+
+
+def iter_svg(geometry):
+    # The document as a sequence of text chunks (see write_svg)
+    yield (f'<svg baseProfile="full" height="{geometry.height}px" version="1.1" width="{geometry.width}px" '
+           'xmlns="http://www.w3.org/2000/svg" xmlns:ev="http://www.w3.org/2001/xml-events" '
+           'xmlns:xlink="http://www.w3.org/1999/xlink"><defs>')
+
+    # Each unique motif is written once as a <symbol>; copies are <use> elements
+    motif_ids = {}
+
+    def symbols(name):
+        if name in motif_ids:
+            return
+        motif = geometry.motifs[name]
+        for nested_name in _placed_names(motif.instances):
+            yield from symbols(nested_name)
+        motif_ids[name] = _motif_id(name, motif)
+        yield f'<symbol id="{motif_ids[name]}" overflow="visible">'
+        yield from _iter_content(motif, geometry.stroke_width, motif_ids)
+        yield '</symbol>'
+
+    for name in _placed_names(geometry.instances):
+        yield from symbols(name)
+
+    yield '</defs><rect fill="white" height="100%" width="100%" x="0" y="0" />'
+    yield from _iter_content(geometry, geometry.stroke_width, motif_ids)
+    yield '</svg>'
+
+
+def write_svg(geometry, fp):
+    # Streams to a text file object; memory stays bounded by one chunk of primitives
+    for text in iter_svg(geometry):
+        fp.write(text)
+
+
+def geometry_to_svg(geometry):
+    return "".join(iter_svg(geometry))
+
+
+# Reading SVG back into geometry.
+#
+# read_svg parses the subset written above (line, circle, polygon, polyline,
+# path with M/L/H/V/A/Z, <symbol> copies placed by <use> with translate and
+# rotate) straight into a KolamGeometry, so a vector upload is measured from
+# its primitives instead of a rasterized copy. Anything outside the subset
+# (text, images, curves, CSS, nested transforms, filled shapes) raises
+# UnsupportedSVG and the caller rasterizes as before.
+
+class UnsupportedSVG(ValueError):
+    pass
+
+
+SVG_NAMESPACE = "{http://www.w3.org/2000/svg}"
+XLINK_HREF = "{http://www.w3.org/1999/xlink}href"
+MOTIF_ID = re.compile(r"kolam-(.+)-[0-9a-f]{8}$")
+_NUMBER = r"[-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?"
+_PATH_TOKEN = re.compile(r"[MmLlHhVvAaZz]|" + _NUMBER)
+_PATH_ARGUMENTS = {"M": 2, "L": 2, "H": 1, "V": 1, "A": 7, "Z": 0}
+_TRANSFORM = re.compile(rf"\s*(?:translate\(\s*({_NUMBER})(?:[\s,]+({_NUMBER}))?\s*\))?"
+                        rf"\s*(?:rotate\(\s*({_NUMBER})\s*\))?\s*$")
+# Elements that carry no drawing
+_IGNORED = {"title", "desc", "metadata"}
+
+
+def _number(value, default=None):
+    if value is None:
+        if default is None:
+            raise UnsupportedSVG("Missing coordinate")
+        return default
+    text = value.strip()
+    if text.endswith("px"):
+        text = text[:-2]
+    try:
+        return float(text)
+    except ValueError:
+        raise UnsupportedSVG(f"Unsupported length {value!r}") from None
+
+
+def _points(value):
+    numbers = [float(n) for n in re.findall(_NUMBER, value or "")]
+    if len(numbers) % 2:
+        raise UnsupportedSVG("Odd number of point coordinates")
+    return list(zip(numbers[::2], numbers[1::2]))
+
+
+def _painted(value):
+    return value is not None and value.strip() not in ("none", "transparent")
+
+
+def _endpoint_arc(x1, y1, radius, large, sweep, x2, y2):
+    # SVG endpoint parameterisation of a circular arc -> (cx, cy, r, start, sweep)
+    # (SVG 1.1 implementation notes F.6.5, with rx = ry and no rotation)
+    mx, my = (x1 - x2) / 2, (y1 - y2) / 2
+    half_sq = mx * mx + my * my
+    if half_sq == 0:
+        return None
+    # A radius too small to reach the end point is scaled up until it does
+    radius = max(radius, math.sqrt(half_sq))
+    factor = math.sqrt(max(radius * radius - half_sq, 0.0) / half_sq)
+    if bool(large) == bool(sweep):
+        factor = -factor
+    cx, cy = factor * my + (x1 + x2) / 2, -factor * mx + (y1 + y2) / 2
+    start = math.degrees(math.atan2(y1 - cy, x1 - cx))
+    extent = (math.degrees(math.atan2(y2 - cy, x2 - cx)) - start) % 360
+    return cx, cy, radius, start, extent if sweep else extent - 360
+
+
+def _path_primitives(data):
+    # -> (lines, arcs) drawn by a path's d attribute
+    if _PATH_TOKEN.sub("", data).strip(" ,\t\r\n"):
+        raise UnsupportedSVG("Path uses commands outside M/L/H/V/A/Z")
+    tokens = _PATH_TOKEN.findall(data)
+    lines, arcs = [], []
+    x = y = start_x = start_y = 0.0
+    command, index = None, 0
+    while index < len(tokens):
+        if tokens[index].isalpha():
+            command = tokens[index]
+            index += 1
+        elif command is None or command in "Zz":
+            raise UnsupportedSVG("Malformed path data")
+        name = command.upper()
+        count = _PATH_ARGUMENTS[name]
+        args = tokens[index:index + count]
+        if len(args) < count or any(arg.isalpha() for arg in args):
+            raise UnsupportedSVG("Malformed path data")
+        args = [float(arg) for arg in args]
+        index += count
+        dx, dy = (x, y) if command.islower() else (0.0, 0.0)
+        if name == "M":
+            x, y = start_x, start_y = args[0] + dx, args[1] + dy
+            # Further coordinate pairs after a moveto are linetos
+            command = "l" if command == "m" else "L"
+        elif name in "LHV":
+            end_x = args[0] + dx if name in "LH" else x
+            end_y = args[-1] + dy if name in "LV" else y
+            lines.append((x, y, end_x, end_y))
+            x, y = end_x, end_y
+        elif name == "A":
+            rx, ry, _, large, sweep, end_x, end_y = args
+            if abs(abs(rx) - abs(ry)) > 1e-6 * max(abs(rx), 1.0):
+                raise UnsupportedSVG("Elliptical arcs are not supported")
+            end_x, end_y = end_x + dx, end_y + dy
+            if rx == 0:
+                lines.append((x, y, end_x, end_y))
+            else:
+                arc = _endpoint_arc(x, y, abs(rx), large, sweep, end_x, end_y)
+                if arc is not None:
+                    arcs.append(arc)
+            x, y = end_x, end_y
+        else:
+            if (x, y) != (start_x, start_y):
+                lines.append((x, y, start_x, start_y))
+            x, y = start_x, start_y
+    return lines, arcs
+
+
+def _use_pose(element):
+    # (x, y, rotation) of a <use> written as translate(x y) rotate(deg)
+    if _number(element.get("x"), 0.0) or _number(element.get("y"), 0.0):
+        raise UnsupportedSVG("<use> offsets are not supported")
+    match = _TRANSFORM.match(element.get("transform", ""))
+    if not match:
+        raise UnsupportedSVG(f"Unsupported transform {element.get('transform')!r}")
+    x, y, rotation = (float(value) if value else 0.0 for value in match.groups())
+    return x, y, rotation
+
+
+def read_svg(data):
+    # SVG bytes -> {"geometry", "width", "height", "background", "colors",
+    # "motif_names", "generated"}. colors counts primitives per ink colour;
+    # motif_names maps symbol ids written by iter_svg back to motif names;
+    # generated is True when the markup is exactly what iter_svg writes.
+    events = ElementTree.iterparse(io.BytesIO(data), events=("start", "end"))
+    geometry, background = None, None
+    colors, stroke_widths, motif_names = Counter(), Counter(), {}
+    # Where primitives go: the geometry, or the motif of an open <symbol>
+    targets, skipped, generated = [], 0, True
+    try:
+        for event, element in events:
+            tag = element.tag[len(SVG_NAMESPACE):] if element.tag.startswith(SVG_NAMESPACE) else element.tag
+            if skipped or tag in _IGNORED:
+                skipped += 1 if event == "start" else -1
+                continue
+            if event == "end":
+                if tag == "symbol":
+                    geometry.add_motif(element.get("id"), targets.pop())
+                if tag in ("line", "path", "circle", "polygon", "polyline", "use", "rect"):
+                    element.clear()
+                continue
+
+            if geometry is None:
+                if tag != "svg":
+                    raise UnsupportedSVG("Not an SVG document")
+                width, height = element.get("width"), element.get("height")
+                view_box = [float(n) for n in re.findall(_NUMBER, element.get("viewBox", ""))]
+                if view_box:
+                    # Only a viewBox in the document's own pixels
+                    if len(view_box) != 4 or view_box[:2] != [0, 0] or \
+                            (width and _number(width) != view_box[2]) or (height and _number(height) != view_box[3]):
+                        raise UnsupportedSVG("Scaled viewBox")
+                    width, height = width or str(view_box[2]), height or str(view_box[3])
+                width, height = _number(width), _number(height)
+                geometry = KolamGeometry(int(width) if width.is_integer() else width,
+                                         int(height) if height.is_integer() else height)
+                generated = (element.get("baseProfile") == "full" and element.get("version") == "1.1"
+                             and element.get("width", "").endswith("px") and not view_box)
+                targets.append(geometry)
+                continue
+            if "style" in element.attrib or "class" in element.attrib or \
+                    ("transform" in element.attrib and tag != "use"):
+                raise UnsupportedSVG(f"Styled or transformed <{tag}>")
+            if tag in ("defs", "g"):
+                if set(element.attrib) - {"id"}:
+                    raise UnsupportedSVG(f"Attributes on <{tag}>")
+                continue
+            if tag == "symbol":
+                symbol_id = element.get("id")
+                match = MOTIF_ID.match(symbol_id or "")
+                if match:
+                    motif_names[symbol_id] = match.group(1)
+                generated = generated and bool(match)
+                targets.append(KolamMotif())
+                continue
+
+            target = targets[-1]
+            stroke, fill = element.get("stroke"), element.get("fill")
+            if tag == "rect":
+                if _painted(stroke) or target is not geometry or geometry.lines or geometry.arcs \
+                        or geometry.dots or geometry.polygons or geometry.instances:
+                    raise UnsupportedSVG("<rect> other than a background")
+                background = fill or "black"
+                continue
+            if tag == "use":
+                href = element.get(XLINK_HREF) or element.get("href") or ""
+                if href[1:] not in geometry.motifs:
+                    raise UnsupportedSVG(f"<use> of an unknown element {href!r}")
+                target.instances.append((href[1:], *_use_pose(element)))
+                continue
+            if tag == "circle":
+                cx, cy, radius = _number(element.get("cx"), 0.0), _number(element.get("cy"), 0.0), _number(element.get("r"))
+                if fill is None or _painted(fill):
+                    target.dots.append((cx, cy, radius))
+                    colors[fill or "black"] += 1
+                elif _painted(stroke):
+                    target.arcs.append((cx, cy, radius, 0.0, 360.0))
+                    colors[stroke] += 1
+                    stroke_widths[_number(element.get("stroke-width"), 1.0)] += 1
+                continue
+            if tag not in ("line", "path", "polygon", "polyline"):
+                raise UnsupportedSVG(f"Unsupported element <{tag}>")
+            if tag != "line" and (fill is None or _painted(fill)):
+                raise UnsupportedSVG(f"Filled <{tag}>")
+            if not _painted(stroke):
+                continue
+            colors[stroke] += 1
+            stroke_widths[_number(element.get("stroke-width"), 1.0)] += 1
+            if tag == "line":
+                target.lines.append(tuple(_number(element.get(name), 0.0) for name in ("x1", "y1", "x2", "y2")))
+            elif tag == "path":
+                lines, arcs = _path_primitives(element.get("d", ""))
+                target.lines.extend(lines)
+                target.arcs.extend(arcs)
+            elif tag == "polygon":
+                target.polygons.append(_points(element.get("points")))
+            else:
+                points = _points(element.get("points"))
+                target.lines.extend([(*a, *b) for a, b in zip(points, points[1:])])
+    except ElementTree.ParseError as e:
+        raise UnsupportedSVG(f"Malformed SVG: {e}") from None
+    if geometry is None:
+        raise UnsupportedSVG("Empty document")
+
+    if stroke_widths:
+        common = stroke_widths.most_common(1)[0][0]
+        geometry.stroke_width = int(common) if common.is_integer() else common
+    generated = (generated and background == "white" and set(colors) <= {"black"} and len(stroke_widths) <= 1)
+    return {"geometry": geometry, "width": geometry.width, "height": geometry.height, "background": background,
+            "colors": colors, "motif_names": motif_names, "generated": generated}
@@ -0,0 +1,298 @@
+import argparse
+import struct
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from kolam_columns import PrimitiveColumns
+from kolam_geometry import iter_flatten_geometry, lsystem_geometry
+from kolam_lsystem import lsystem_expansion
+from kolam_raster import composite, kind_boxes, primitive_boxes, rasterize_primitives, scale_primitives, scale_rows
+
+# Tiled raster export for poster-size kolams.
+#
+# Primitives are binned into a uniform grid of tiles (the spatial index), the
+# tiles of one row band are rendered in parallel, and finished bands are
+# streamed straight into a PNG or TIFF encoder. Only the band being encoded and
+# the one being rendered are ever held in memory, whatever the image size.
+#
+# The scaled primitives themselves sit in kolam_columns stores (spilling to
+# disk past the RAM budget) and are walked a chunk at a time; each band reads
+# back only the rows whose boxes reach it.
+
+PRIMITIVE_KINDS = ("lines", "arcs", "dots")
+
+
+def content_bounds(boxes, bounds=None):
+    # (left, top, right, bottom) over every primitive box, in output pixels,
+    # merged into `bounds` from earlier chunks when given
+    stacked = [kind_boxes for kind_boxes in boxes if len(kind_boxes)]
+    if not stacked:
+        return bounds or (0.0, 0.0, 0.0, 0.0)
+    stacked = np.concatenate(stacked)
+    found = stacked[:, 0].min(), stacked[:, 1].min(), stacked[:, 2].max(), stacked[:, 3].max()
+    if bounds is None:
+        return found
+    return min(bounds[0], found[0]), min(bounds[1], found[1]), max(bounds[2], found[2]), max(bounds[3], found[3])
+
+
+def scaled_columns(geometry, scale, half_width):
+    # Every primitive in output pixels (polygon outlines as lines) in column
+    # stores, plus their content bounds; built one flattened chunk at a time
+    columns = {"lines": PrimitiveColumns(4), "arcs": PrimitiveColumns(5), "dots": PrimitiveColumns(3)}
+    bounds = None
+    for chunk in iter_flatten_geometry(geometry):
+        scaled = scale_primitives(chunk, scale)
+        bounds = content_bounds(primitive_boxes(scaled, half_width), bounds)
+        for kind, store in columns.items():
+            if len(scaled[kind]):
+                store.extend(scaled[kind])
+    return columns, bounds
+
+
+def bin_boxes(boxes, tile_size, tiles_x, tiles_y):
+    # CSR-style index: primitive ids touching tile t are ids[offsets[t]:offsets[t + 1]]
+    tile_count = tiles_x * tiles_y
+    if not len(boxes):
+        return np.zeros(0, dtype=np.int64), np.zeros(tile_count + 1, dtype=np.int64)
+    tx0 = np.floor(boxes[:, 0] / tile_size).astype(np.int64)
+    ty0 = np.floor(boxes[:, 1] / tile_size).astype(np.int64)
+    tx1 = np.floor(boxes[:, 2] / tile_size).astype(np.int64)
+    ty1 = np.floor(boxes[:, 3] / tile_size).astype(np.int64)
+    visible = (tx1 >= 0) & (ty1 >= 0) & (tx0 < tiles_x) & (ty0 < tiles_y)
+    tx0, tx1 = np.clip(tx0, 0, tiles_x - 1), np.clip(tx1, 0, tiles_x - 1)
+    ty0, ty1 = np.clip(ty0, 0, tiles_y - 1), np.clip(ty1, 0, tiles_y - 1)
+
+    span_x = tx1 - tx0 + 1
+    counts = np.where(visible, span_x * (ty1 - ty0 + 1), 0)
+    ids = np.repeat(np.arange(len(boxes)), counts)
+    local = np.arange(len(ids)) - np.repeat(np.cumsum(counts) - counts, counts)
+    tiles = (ty0[ids] + local // span_x[ids]) * tiles_x + tx0[ids] + local % span_x[ids]
+
+    order = np.argsort(tiles, kind="stable")
+    offsets = np.searchsorted(tiles[order], np.arange(tile_count + 1))
+    return ids[order], offsets
+
+
+class PngStreamWriter:
+    def __init__(self, fp, width, height, dpi=None, level=6):
+        self.fp = fp
+        self.width = width
+        # Run-length deflate: ~3x faster than the default strategy on line art
+        # for only slightly larger output
+        self.compressor = zlib.compressobj(level, zlib.DEFLATED, 15, 8, zlib.Z_RLE)
+        self.pending = []
+        self.pending_size = 0
+        fp.write(b"\x89PNG\r\n\x1a\n")
+        # 8-bit RGB, deflate, adaptive filtering, no interlace
+        self._chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0))
+        if dpi:
+            pixels_per_metre = int(round(dpi / 0.0254))
+            self._chunk(b"pHYs", struct.pack(">IIB", pixels_per_metre, pixels_per_metre, 1))
+
+    def _chunk(self, kind, data):
+        self.fp.write(struct.pack(">I", len(data)) + kind + data)
+        self.fp.write(struct.pack(">I", zlib.crc32(data, zlib.crc32(kind)) & 0xFFFFFFFF))
+
+    def _flush_idat(self, force=False):
+        if self.pending and (force or self.pending_size >= 1 << 20):
+            self._chunk(b"IDAT", b"".join(self.pending))
+            self.pending, self.pending_size = [], 0
+
+    def write_rows(self, rows):
+        # Filter type 0 per scanline; zlib handles the long white runs well
+        scanlines = np.zeros((rows.shape[0], 1 + self.width * 3), dtype=np.uint8)
+        scanlines[:, 1:] = rows.reshape(rows.shape[0], -1)
+        data = self.compressor.compress(scanlines.tobytes())
+        if data:
+            self.pending.append(data)
+            self.pending_size += len(data)
+        self._flush_idat()
+
+    def close(self):
+        self.pending.append(self.compressor.flush())
+        self._flush_idat(force=True)
+        self._chunk(b"IEND", b"")
+
+
+class TiffStreamWriter:
+    # Baseline RGB TIFF with one deflate-compressed strip per band. The IFD is
+    # written after the strips, so the file object must be seekable.
+
+    def __init__(self, fp, width, height, rows_per_strip, dpi=None):
+        self.fp = fp
+        self.width = width
+        self.height = height
+        self.rows_per_strip = rows_per_strip
+        self.dpi = dpi or 72
+        self.strip_offsets = []
+        self.strip_counts = []
+        self.start = fp.tell()
+        fp.write(b"II*\x00" + struct.pack("<I", 0))
+
+    def write_rows(self, rows):
+        compressor = zlib.compressobj(6, zlib.DEFLATED, 15, 8, zlib.Z_RLE)
+        data = compressor.compress(np.ascontiguousarray(rows).tobytes()) + compressor.flush()
+        self.strip_offsets.append(self.fp.tell() - self.start)
+        self.strip_counts.append(len(data))
+        self.fp.write(data)
+        if self.fp.tell() % 2:
+            self.fp.write(b"\x00")
+
+    def close(self):
+        strips = len(self.strip_offsets)
+        # (tag, type, count, values); type 3 = SHORT, 4 = LONG, 5 = RATIONAL
+        entries = [
+            (256, 4, 1, [self.width]),
+            (257, 4, 1, [self.height]),
+            (258, 3, 3, [8, 8, 8]),
+            (259, 3, 1, [8]),
+            (262, 3, 1, [2]),
+            (273, 4, strips, self.strip_offsets),
+            (277, 3, 1, [3]),
+            (278, 4, 1, [self.rows_per_strip]),
+            (279, 4, strips, self.strip_counts),
+            (282, 5, 1, [int(self.dpi), 1]),
+            (283, 5, 1, [int(self.dpi), 1]),
+            (284, 3, 1, [1]),
+            (296, 3, 1, [2]),
+        ]
+        ifd_offset = self.fp.tell() - self.start
+        extra_offset = ifd_offset + 2 + 12 * len(entries) + 4
+        ifd, extra = [struct.pack("<H", len(entries))], []
+        for tag, kind, count, values in entries:
+            packed = struct.pack("<%d%s" % (len(values), "H" if kind == 3 else "I"), *values)
+            if len(packed) <= 4:
+                ifd.append(struct.pack("<HHI", tag, kind, count) + packed.ljust(4, b"\x00"))
+            else:
+                ifd.append(struct.pack("<HHII", tag, kind, count, extra_offset + sum(map(len, extra))))
+                extra.append(packed)
+        ifd.append(struct.pack("<I", 0))
+        self.fp.write(b"".join(ifd) + b"".join(extra))
+        end = self.fp.tell()
+        self.fp.seek(self.start + 4)
+        self.fp.write(struct.pack("<I", ifd_offset))
+        self.fp.seek(end)
+
+
+def band_ids(columns, offset, half_width, tile_size, tiles_x, tiles_y):
+    # Per kind, per row band: ids of the rows whose boxes reach that band
+    bands = {kind: [PrimitiveColumns(1) for _ in range(tiles_y)] for kind in PRIMITIVE_KINDS}
+    for kind in PRIMITIVE_KINDS:
+        start = 0
+        for chunk in columns[kind].chunks():
+            boxes = kind_boxes(kind, scale_rows(kind, chunk, 1.0, offset), half_width)
+            ty0 = np.floor(boxes[:, 1] / tile_size)
+            ty1 = np.floor(boxes[:, 3] / tile_size)
+            visible = (boxes[:, 2] >= 0) & (boxes[:, 0] < tiles_x * tile_size)
+            for ty in range(tiles_y):
+                members = np.nonzero(visible & (ty0 <= ty) & (ty1 >= ty))[0]
+                if len(members):
+                    bands[kind][ty].extend(start + members)
+            start += len(chunk)
+    return bands
+
+
+def _band_primitives(columns, bands, ty, offset, half_width, tile_size, tiles_x):
+    # The band's rows read back from the (possibly mapped) columns, their boxes
+    # and their tile index within the band
+    scaled, boxes, index = {}, [], {}
+    for kind in PRIMITIVE_KINDS:
+        ids = bands[kind][ty].array()[:, 0].astype(np.int64)
+        rows = columns[kind].array()[ids] if len(ids) else np.zeros((0, columns[kind].width))
+        scaled[kind] = scale_rows(kind, rows, 1.0, offset)
+        row_boxes = kind_boxes(kind, scaled[kind], half_width)
+        boxes.append(row_boxes)
+        index[kind] = bin_boxes(row_boxes - np.array([0, ty * tile_size, 0, ty * tile_size]), tile_size, tiles_x, 1)
+    return scaled, tuple(boxes), index
+
+
+def _render_tile(scaled, boxes, index, tile, tile_size, size, half_width, color, background):
+    # `scaled`, `boxes` and `index` cover tile row ty only (see _band_primitives)
+    tx, ty = tile
+    width, height = size
+    origin = (tx * tile_size, ty * tile_size)
+    tile_w, tile_h = min(tile_size, width - origin[0]), min(tile_size, height - origin[1])
+    coverage = np.zeros((tile_h, tile_w), dtype=np.float32)
+
+    subset, subset_boxes = {}, []
+    for kind, kind_boxes in zip(PRIMITIVE_KINDS, boxes):
+        ids, offsets = index[kind]
+        members = ids[offsets[tx]:offsets[tx + 1]]
+        subset[kind] = scaled[kind][members]
+        subset_boxes.append(kind_boxes[members])
+    rasterize_primitives(coverage, subset, half_width, origin, tuple(subset_boxes))
+    return composite(coverage, color, background)
+
+
+def export_tiled(geometry, fp, scale=1.0, format="png", tile_size=1024, workers=None,
+                 color=(0, 0, 0), background=(255, 255, 255), dpi=None, fit=False, margin=20):
+    half_width = geometry.stroke_width * scale / 2
+    columns, bounds = scaled_columns(geometry, scale, half_width)
+
+    width = int(np.ceil(geometry.width * scale))
+    height = int(np.ceil(geometry.height * scale))
+    offset = (0.0, 0.0)
+    if fit:
+        # Crop the canvas to the drawing plus a margin (in output pixels)
+        left, top, right, bottom = bounds
+        left, top = left - margin, top - margin
+        width = int(np.ceil(right + margin - left))
+        height = int(np.ceil(bottom + margin - top))
+        offset = (-left, -top)
+
+    tiles_x, tiles_y = -(-width // tile_size), -(-height // tile_size)
+    bands = band_ids(columns, offset, half_width, tile_size, tiles_x, tiles_y)
+
+    if format == "png":
+        writer = PngStreamWriter(fp, width, height, dpi)
+    elif format == "tiff":
+        writer = TiffStreamWriter(fp, width, height, tile_size, dpi)
+    else:
+        raise ValueError(f"Unsupported tiled export format: {format}")
+
+    def submit_band(executor, ty):
+        scaled, boxes, index = _band_primitives(columns, bands, ty, offset, half_width, tile_size, tiles_x)
+        return [executor.submit(_render_tile, scaled, boxes, index, (tx, ty), tile_size,
+                                (width, height), half_width, color, background) for tx in range(tiles_x)]
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        # Render band n + 1 while band n is being encoded
+        pending = submit_band(executor, 0)
+        for ty in range(tiles_y):
+            band = np.concatenate([future.result() for future in pending], axis=1)
+            pending = submit_band(executor, ty + 1) if ty + 1 < tiles_y else []
+            writer.write_rows(band)
+            del band
+    writer.close()
+    return width, height
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Export a poster-size L-system kolam as a tiled PNG/TIFF")
+    parser.add_argument("output")
+    parser.add_argument("--axiom", default="FBFBFBFB")
+    parser.add_argument("--iterations", type=int, default=4)
+    parser.add_argument("--dot-size", type=int, default=10)
+    parser.add_argument("--size", type=int, default=10000, help="longest side of the output in pixels")
+    parser.add_argument("--tile-size", type=int, default=1024)
+    parser.add_argument("--dpi", type=int, default=300)
+    args = parser.parse_args()
+
+    rules = {"A": "AFBFA", "B": "AFBFBFBFA"}
+    lsystem_string = lsystem_expansion(args.axiom, rules, args.iterations)
+    geometry = lsystem_geometry(lsystem_string, args.dot_size, 0, 0)
+
+    # Size the canvas from the drawing's own extent, then scale it to --size
+    bounds = None
+    for chunk in iter_flatten_geometry(geometry):
+        bounds = content_bounds(primitive_boxes(scale_primitives(chunk, 1.0), geometry.stroke_width / 2), bounds)
+    left, top, right, bottom = bounds
+    extent = max(right - left, bottom - top)
+
+    output_format = "tiff" if args.output.lower().endswith((".tif", ".tiff")) else "png"
+    with open(args.output, "wb") as f:
+        size = export_tiled(geometry, f, scale=args.size / extent, format=output_format,
+                            tile_size=args.tile_size, dpi=args.dpi, fit=True, margin=args.size // 50)
+    print(f"Kolam exported to {args.output} ({size[0]} x {size[1]} pixels)")
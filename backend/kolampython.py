@@ -1,6 +1,7 @@
-import turtle
 from PIL import Image
 import io
+from kolam_geometry import arc_segment_count, lsystem_symmetric_geometry
+from kolam_raster import render_geometry
 
 # L-System parameters
 axiom = "FBFBFBFB"  # Initiator
@@ -40,35 +41,23 @@ def draw_line(length, turtle_obj):
     turtle_obj.forward(length)
 
 def draw_arc(radius, angle, turtle_obj):
-    turtle_obj.circle(radius, angle)
+    turtle_obj.circle(radius, angle, arc_segment_count(radius, angle))
 
-def generate_kolam_image(axiom, rules, angle, dot_size, iterations):
-    screen = turtle.Screen()
-    screen.setup(width=600, height=600)
-    screen.tracer(0) # Turn off screen updates for faster drawing
+def kolam_geometry(axiom, rules, dot_size, iterations):
+    return lsystem_symmetric_geometry(axiom, rules, iterations, dot_size, 300 - dot_size, 300 + dot_size)
 
-    t = turtle.Turtle()
-    t.hideturtle()
+def generate_kolam_image(axiom, rules, angle, dot_size, iterations, dpi=96, geometry=None):
+    # Rendered straight from geometry with the NumPy rasterizer: no Tk screen,
+    # PostScript or Ghostscript involved, so this is safe in headless workers
+    geometry = geometry or kolam_geometry(axiom, rules, dot_size, iterations)
+    img = render_geometry(geometry, scale=dpi / 96)
 
-    lsystem_string = expand_lsystem_string(axiom, rules, iterations)
-    draw_suzhi_kolam(lsystem_string, dot_size, t, screen)
+    # The geometry is in screen coordinates (y down); turtle draws with y up
+    img = img.transpose(Image.FLIP_TOP_BOTTOM)
 
-    # Save to PostScript
-    ps_buffer = io.BytesIO()
-    screen.getcanvas().postscript(file=ps_buffer)
-
-    # Convert PostScript to PNG
-    ps_buffer.seek(0)
-    img = Image.open(ps_buffer)
-    
     # Save PNG to a bytes buffer
     png_buffer = io.BytesIO()
-    img.save(png_buffer, format="PNG")
-    png_buffer.seek(0)
-    
-    # Clean up turtle environment
-    # screen.bye()
-    
+    img.save(png_buffer, format="PNG", dpi=(dpi, dpi))
     return png_buffer.getvalue()
 
 if __name__ == '__main__':
@@ -3,6 +3,7 @@ import numpy as np
 import turtle
 import time
 import random
+from kolam_geometry import arc_segment_count
 
 # L-System parameters
 axiom = "FBFBFBFB"  # Initiator
@@ -52,7 +53,7 @@ def draw_line(length, color):
 # Function to draw an arc
 def draw_arc(radius, angle, color):
     turtle.color(color)
-    turtle.circle(radius, angle)
+    turtle.circle(radius, angle, arc_segment_count(radius, angle))
 
 # Generate random polygon coordinates
 polygon_coordinates = []
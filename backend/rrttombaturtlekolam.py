@@ -1,4 +1,5 @@
 import turtle
+from kolam_geometry import arc_segment_count
 
 # Function to draw a straight line segment
 def draw_line(length):
@@ -6,7 +7,7 @@ def draw_line(length):
 
 # Function to draw a curved line segment
 def draw_curve(radius, angle):
-    turtle.circle(radius, angle)
+    turtle.circle(radius, angle, arc_segment_count(radius, angle))
 
 # Function to draw a square loop kolam pattern
 def draw_kolam():
@@ -1,5 +1,6 @@
 import cv2
 import numpy as np
+from kolam_geometry import flatten_arc
 
 # L-System parameters
 axiom = "FBFBFBFB"  # Initiator
@@ -30,7 +31,8 @@ def draw_suzhi_kolam(lsystem_string, dot_size, frame):
         elif symbol == "A":
             cv2.circle(frame, (dot_size, dot_size), dot_size, (255, 0, 0), 1)
         elif symbol == "B":
-            cv2.ellipse(frame, (dot_size, dot_size), (dot_size, dot_size), 0, 0, 90, (255, 0, 0), 1)
+            points = np.round(flatten_arc(dot_size, dot_size, dot_size, 0, 90) * 16).astype(np.int32)
+            cv2.polylines(frame, [points], False, (255, 0, 0), 1, lineType=cv2.LINE_AA, shift=4)
 
 # Initialize video capture
 video_capture = cv2.VideoCapture(0)
@@ -0,0 +1,141 @@
+import numpy as np
+import pytest
+from PIL import Image, ImageDraw
+
+from kolam_analysis import classify_grid, color_metrics, detect_symmetry, grid_system, ink_mask, line_quality, \
+    skeletonize, structural_metrics
+
+# The local (pixel) analysis on drawings whose answers are known exactly
+
+
+def drawing(size=400):
+    image = Image.new("RGB", (size, size), "white")
+    return image, ImageDraw.Draw(image)
+
+
+def rotated_copies(draw_arm, size=400):
+    # The arm drawn four times, turned by 90 degrees about the centre
+    image, draw = drawing(size)
+    draw_arm(draw)
+    for turn in (Image.Transpose.ROTATE_90, Image.Transpose.ROTATE_180, Image.Transpose.ROTATE_270):
+        arm, draw = drawing(size)
+        draw_arm(draw)
+        image = Image.fromarray(np.minimum(np.asarray(image), np.asarray(arm.transpose(turn))))
+    return image
+
+
+def pinwheel_arm(draw):
+    # An L: turning it maps it onto the other arms, no mirror does
+    draw.rectangle((195, 60, 205, 200), fill="black")
+    draw.rectangle((195, 60, 280, 70), fill="black")
+
+
+def cross_arm(draw):
+    # A T, symmetric about its own axis: the four copies also have the mirrors
+    draw.rectangle((195, 60, 205, 200), fill="black")
+    draw.rectangle((150, 60, 250, 70), fill="black")
+
+
+def dot_grid(columns, rows, spacing, radius, diamond=False):
+    # Filled pulli dots on a lattice inside a frame (the frame isn't a dot)
+    image, draw = drawing(spacing * (max(columns, rows) + 1))
+    for i in range(columns):
+        for j in range(rows):
+            if diamond and (i + j) % 2:
+                continue
+            x, y = spacing * (i + 1), spacing * (j + 1)
+            draw.ellipse((x - radius, y - radius, x + radius, y + radius), fill="black")
+    side = image.size[0]
+    draw.rectangle((spacing // 2, spacing // 2, side - spacing // 2, side - spacing // 2), outline="black", width=3)
+    return image
+
+
+def test_pinwheel_is_cyclic_and_cross_is_dihedral():
+    pinwheel = detect_symmetry(ink_mask(rotated_copies(pinwheel_arm)))
+    assert pinwheel["group"] == "C4"
+    assert pinwheel["reflections"] == []
+    cross = detect_symmetry(ink_mask(rotated_copies(cross_arm)))
+    assert cross["group"] == "D4"
+    assert set(cross["reflections"]) == {"vertical", "horizontal", "diagonal", "antidiagonal"}
+
+
+def test_blank_and_asymmetric_drawings_have_no_symmetry():
+    assert detect_symmetry(np.zeros((64, 64), dtype=bool))["group"] == "C1"
+    image, draw = drawing()
+    pinwheel_arm(draw)
+    assert detect_symmetry(ink_mask(image))["group"] == "C1"
+
+
+def test_skeleton_of_a_plus_is_one_pixel_wide_centre_lines():
+    mask = np.zeros((100, 100), dtype=bool)
+    mask[40:47, 10:90] = True
+    mask[10:90, 40:47] = True
+    skeleton = skeletonize(mask)
+    assert not (skeleton & ~mask).any()
+    # Away from the ends and the crossing, one pixel per column / row, on the centre line
+    for index in (20, 30, 60, 75):
+        assert np.nonzero(skeleton[:, index])[0].tolist() == [43]
+        assert np.nonzero(skeleton[index])[0].tolist() == [43]
+
+
+@pytest.mark.parametrize("columns, rows, spacing, radius", [(5, 5, 40, 5), (6, 6, 30, 4), (7, 4, 36, 5)])
+def test_dot_count_and_square_grid(columns, rows, spacing, radius):
+    structure = structural_metrics(ink_mask(dot_grid(columns, rows, spacing, radius)))
+    assert len(structure["dots"]) == columns * rows
+    grid = structure["grid"]
+    assert grid["type"] == "square"
+    assert grid["spacing"] == pytest.approx(spacing, abs=0.5)
+    # Horizontal rows, top to bottom
+    assert grid["rows"] == [columns] * rows
+
+
+def test_diamond_grid_rows():
+    structure = structural_metrics(ink_mask(dot_grid(7, 7, 40, 6, diamond=True)))
+    assert len(structure["dots"]) == 25
+    assert structure["grid"]["type"] == "diamond"
+    assert structure["grid"]["rows"] == [4, 3, 4, 3, 4, 3, 4]
+    assert grid_system(structure["grid"], 25) == "Diamond Grid (Pulli Kolam, 4-3-4-3-4-3-4 dots)"
+
+
+def test_classify_grid_needs_four_dots():
+    assert classify_grid(np.array([(0, 0, 1), (10, 0, 1), (0, 10, 1)], dtype=float))["type"] == "none"
+
+
+@pytest.mark.parametrize("width", [3, 5, 8, 12])
+@pytest.mark.parametrize("scale", [1.0, 2.5])
+def test_stroke_width_and_line_length_at_known_scale(width, scale):
+    # A circle and a chord drawn `width` px wide, reported in pixels x `scale`
+    image, draw = drawing()
+    draw.ellipse((50, 50, 350, 350), outline="black", width=width)
+    draw.line((100, 200, 300, 200), fill="black", width=width)
+    structure = structural_metrics(ink_mask(image), scale)
+    assert structure["stroke_width"] == pytest.approx(width * scale, abs=0.6 * scale)
+    assert line_quality(structure)["thickness"] == pytest.approx(width * scale, abs=0.6 * scale)
+    # The centre lines stop half a stroke short of the chord's ends
+    assert structure["line_length"] == pytest.approx((np.pi * 300 + 200) * scale, rel=0.1)
+
+
+def test_straight_lines_are_smooth_and_crossings_are_counted():
+    image, draw = drawing()
+    for position in (120, 280):
+        draw.line((40, position, 360, position), fill="black", width=5)
+        draw.line((position, 40, position, 360), fill="black", width=5)
+    quality = line_quality(structural_metrics(ink_mask(image)))
+    assert quality["crossings"] == 4
+    assert quality["smoothness"] > 0.9
+
+
+def test_dominant_colour_of_a_two_colour_image():
+    pixels = np.full((100, 100, 3), 255, dtype=np.uint8)
+    pixels[:70] = (200, 30, 30)
+    colors = color_metrics(Image.fromarray(pixels))
+    assert colors["colors"] == ["#c81e1e", "#ffffff"]
+    assert colors["variance"] > 0.5
+
+
+def test_line_art_has_no_chroma_spread():
+    pixels = np.full((100, 100, 3), 255, dtype=np.uint8)
+    pixels[:30] = 0
+    colors = color_metrics(Image.fromarray(pixels))
+    assert colors["colors"] == ["#ffffff", "#000000"]
+    assert colors["variance"] == 0.0
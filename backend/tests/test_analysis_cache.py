@@ -0,0 +1,66 @@
+import random
+import sqlite3
+
+from analysis_cache import AnalysisCache, BKTree, design_signature, hamming
+
+
+def brute_force_nearest(keys, key, radius):
+    within = [hamming(key, stored) for stored in keys if hamming(key, stored) <= radius]
+    return min(within) if within else None
+
+
+def test_nearest_matches_a_linear_scan():
+    rng = random.Random(0)
+    keys = [rng.getrandbits(64) for _ in range(500)]
+    # Near copies of stored hashes, as recompressed uploads give
+    keys += [key ^ (1 << rng.randrange(64)) ^ (1 << rng.randrange(64)) for key in keys[:100]]
+    tree = BKTree()
+    for key in keys:
+        tree.add(key)
+    queries = [key ^ (1 << rng.randrange(64)) for key in keys[::7]] + [rng.getrandbits(64) for _ in range(50)]
+    for query in queries:
+        for radius in (0, 3, 6, 20):
+            found = tree.nearest(query, radius)
+            expected = brute_force_nearest(keys, query, radius)
+            if expected is None:
+                assert found is None
+            else:
+                distance, key = found
+                assert distance == expected == hamming(query, key) and key in keys
+
+
+def test_exact_and_duplicate_keys():
+    tree = BKTree()
+    assert tree.nearest(0b1011, 6) is None
+    for key in (0b1011, 0b1011, 0b0000, 0b1111):
+        tree.add(key)
+    assert tree.size == 3
+    assert tree.nearest(0b1011, 0) == (0, 0b1011)
+    assert tree.nearest(0b0001, 1) == (1, 0b0000)
+    assert tree.nearest(0b0111, 0) is None
+
+
+def test_a_hash_match_needs_the_same_design_signature():
+    cache = AnalysisCache(":memory:")
+    c4 = design_signature({"symmetryType": "C4", "gridSystem": "square", "specifications": {"dotCount": 25}})
+    d4 = design_signature({"symmetryType": "D4", "gridSystem": "square", "specifications": {"dotCount": 25}})
+    cache.put(0b1011, c4, "kolam-analysis@2", {"name": "first"})
+    # A recompressed copy of the same design: a few bits off, measured alike
+    assert cache.get(0b1011 ^ 0b11, c4, "kolam-analysis@2") == {"name": "first"}
+    # Another design that hashes alike but measures differently
+    assert cache.get(0b1011, d4, "kolam-analysis@2") is None
+    assert cache.get(0b1011, c4, "another prompt") is None
+
+
+def test_entries_without_a_signature_are_dropped(tmp_path):
+    path = str(tmp_path / "cache.sqlite3")
+    db = sqlite3.connect(path)
+    db.execute("CREATE TABLE analyses (prompt TEXT NOT NULL, phash TEXT NOT NULL, analysis TEXT NOT NULL, "
+               "created REAL NOT NULL, used REAL NOT NULL, PRIMARY KEY (prompt, phash))")
+    db.execute("INSERT INTO analyses VALUES ('p', '000000000000000b', '{}', 1e12, 1e12)")
+    db.commit()
+    db.close()
+    cache = AnalysisCache(path)
+    assert cache.trees == {}
+    cache.put(0b1011, (None, None, None), "p", {"name": "kept"})
+    assert cache.get(0b1011, (None, None, None), "p") == {"name": "kept"}
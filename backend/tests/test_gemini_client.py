@@ -0,0 +1,16 @@
+import pytest
+
+import gemini_client
+from gemini_client import UNSUPPORTED_REQUEST_ERRORS, UnsupportedRequest, rejected_options
+
+
+def test_only_the_sdk_refusing_a_template_counts_as_unsupported():
+    template = {"id": "test/v1", "system_instruction": None, "prompt": "",
+                "response_schema": {"type": "object", "properties": {"a": {"type": "string"}}, "additionalProperties": False}}
+    with pytest.raises(UnsupportedRequest):
+        gemini_client._build_template_model(template, 0)
+    assert rejected_options(TypeError("__init__() got an unexpected keyword argument 'system_instruction'"))
+    # Our own bugs are not "structured output not supported"
+    assert not rejected_options(TypeError("'NoneType' object is not subscriptable"))
+    assert not rejected_options(ValueError("Model response was not a JSON object"))
+    assert not issubclass(TypeError, UNSUPPORTED_REQUEST_ERRORS) and not issubclass(ValueError, UNSUPPORTED_REQUEST_ERRORS)
@@ -0,0 +1,54 @@
+import asyncio
+
+import pytest
+
+from gemini_quota import BULK, INTERACTIVE, MAX_QUEUE_WAITS, QuotaExceeded, QuotaScheduler
+
+
+def test_interactive_calls_go_before_queued_bulk_calls():
+    async def scenario():
+        # 10 requests a second, none left in the bucket
+        scheduler = QuotaScheduler(rpm=600, tpm=1_000_000)
+        scheduler.requests.take(600)
+        released = []
+
+        async def call(name, priority):
+            await scheduler.acquire(100, priority)
+            released.append(name)
+
+        calls = [asyncio.ensure_future(call("bulk 1", BULK)), asyncio.ensure_future(call("bulk 2", BULK))]
+        await asyncio.sleep(0)
+        calls.append(asyncio.ensure_future(call("interactive", INTERACTIVE)))
+        await asyncio.gather(*calls)
+        return released
+
+    assert asyncio.run(scenario()) == ["interactive", "bulk 1", "bulk 2"]
+
+
+def test_refused_call_is_told_when_it_would_be_accepted():
+    async def scenario():
+        # One request a second, 15 s of requests owed
+        scheduler = QuotaScheduler(rpm=60, tpm=1_000_000)
+        scheduler.requests.take(60 + 14)
+        with pytest.raises(QuotaExceeded) as refused:
+            await scheduler.acquire(100, INTERACTIVE)
+        # Bulk work waits its turn instead of being refused
+        bulk = asyncio.ensure_future(scheduler.acquire(100, BULK))
+        await asyncio.sleep(0.05)
+        assert not bulk.done()
+        bulk.cancel()
+        return refused.value.retry_after
+
+    assert asyncio.run(scenario()) == pytest.approx(15 - MAX_QUEUE_WAITS[INTERACTIVE], abs=0.1)
+
+
+def test_token_quota_also_holds_calls_back():
+    async def scenario():
+        scheduler = QuotaScheduler(rpm=1000, tpm=6000)
+        # A full minute of tokens owed: refused for ~50 s past the 10 s limit
+        scheduler.tokens.take(6000)
+        with pytest.raises(QuotaExceeded) as refused:
+            await scheduler.acquire(6000, INTERACTIVE)
+        return refused.value.retry_after
+
+    assert asyncio.run(scenario()) == pytest.approx(60 - MAX_QUEUE_WAITS[INTERACTIVE], abs=0.1)
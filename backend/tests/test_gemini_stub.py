@@ -0,0 +1,135 @@
+import asyncio
+import base64
+import importlib
+import io
+import json
+import os
+import socket
+import threading
+import time
+
+import pytest
+import uvicorn
+from PIL import Image, ImageDraw
+
+import gemini_client
+import gemini_stub
+from gemini_client import CircuitBreaker, CircuitOpen, LatencyTracker, stream_content
+from gemini_quota import QuotaScheduler
+from kolam_prompts import prompt_template
+
+# gemini_client against gemini_stub, served from a thread of this process so
+# the tests can change its faults and read its stats directly
+
+
+@pytest.fixture(scope="module")
+def stub_endpoint():
+    sock = socket.socket()
+    sock.bind(("127.0.0.1", 0))
+    server = uvicorn.Server(uvicorn.Config(gemini_stub.app, log_level="warning"))
+    thread = threading.Thread(target=server.run, kwargs={"sockets": [sock]}, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.01)
+    yield f"http://127.0.0.1:{sock.getsockname()[1]}"
+    server.should_exit = True
+    thread.join()
+
+
+@pytest.fixture
+def stub(stub_endpoint, monkeypatch):
+    # Fresh client state and a fast, fault-free stub for each test
+    monkeypatch.setattr(gemini_client, "GEMINI_API_ENDPOINT", stub_endpoint)
+    gemini_client.configure("test-key")
+    monkeypatch.setattr(gemini_client, "_model", None)
+    monkeypatch.setattr(gemini_client, "_template_models", {})
+    monkeypatch.setattr(gemini_client, "_call_slots", asyncio.Semaphore(gemini_client.MAX_CONCURRENT_CALLS))
+    monkeypatch.setattr(gemini_client, "breaker", CircuitBreaker())
+    monkeypatch.setattr(gemini_client, "first_chunk_latency", LatencyTracker())
+    monkeypatch.setattr(gemini_client, "scheduler", QuotaScheduler())
+    monkeypatch.setattr(gemini_client, "BACKOFF_BASE", 0.01)
+    monkeypatch.setattr(gemini_stub, "config", dict(gemini_stub.config, latency=0.0, chunk_delay=0.0, slow_rate=0.0,
+                                                    slow_calls=0, error_rate=0.0, reject_structured=False))
+    monkeypatch.setattr(gemini_stub, "stats", dict.fromkeys(gemini_stub.stats, 0))
+    return gemini_stub
+
+
+@pytest.fixture
+def api(stub, monkeypatch):
+    monkeypatch.setenv("GEMINI_API_KEY", "test-key")
+    monkeypatch.setenv("KOLAM_ANALYSIS_CACHE", ":memory:")
+    fastapi_app = importlib.import_module("fastapi_app")
+    monkeypatch.setattr(fastapi_app, "analysis_cache", fastapi_app.AnalysisCache(":memory:"))
+    return fastapi_app
+
+
+def kolam_png():
+    image = Image.new("RGB", (240, 240), "white")
+    draw = ImageDraw.Draw(image)
+    for x in range(40, 240, 40):
+        for y in range(40, 240, 40):
+            draw.ellipse((x - 3, y - 3, x + 3, y + 3), fill="black")
+    draw.ellipse((50, 50, 190, 190), outline="black", width=4)
+    out = io.BytesIO()
+    image.save(out, format="PNG")
+    return out.getvalue()
+
+
+def streamed(template=None, contents=("Analyze this Kolam.",)):
+    async def collect():
+        return "".join([text async for text in stream_content(list(contents), template=template)])
+    return asyncio.run(collect())
+
+
+def test_structured_output_answer(stub):
+    answer = json.loads(streamed(prompt_template("kolam-analysis")))
+    assert answer == json.loads(gemini_stub.ANSWER)
+    assert stub.stats["calls"] == 1
+
+
+def test_falls_back_to_the_prose_template_when_structured_output_is_refused(api, stub):
+    stub.config["reject_structured"] = True
+    prepared = api.prepare_upload(kolam_png())
+    response = asyncio.run(api.gemini_analysis(prepared, template=prompt_template("kolam-analysis")))
+    assert response == {"analysis": json.loads(gemini_stub.ANSWER)}
+    # One refused structured call, then the v1 prose template; no retries
+    assert stub.stats == dict(stub.stats, calls=2, rejected=1)
+
+
+def test_a_slow_call_is_hedged(stub, monkeypatch):
+    monkeypatch.setattr(gemini_client, "HEDGE_DEFAULT_DELAY", 0.2)
+    stub.config.update(slow_calls=1, slow_latency=5.0)
+    started = time.monotonic()
+    answer = streamed()
+    assert json.loads(answer) == json.loads(gemini_stub.ANSWER)
+    assert time.monotonic() - started < 2
+    assert stub.stats["calls"] == 2 and stub.stats["slow"] == 1
+
+
+def test_repeated_failures_open_the_circuit(stub, monkeypatch):
+    monkeypatch.setattr(gemini_client, "HEDGING", False)
+    monkeypatch.setattr(gemini_client, "breaker", CircuitBreaker(failures=2, reset_after=60))
+    stub.config.update(error_rate=1.0, error_status=503)
+    # Two failed attempts open the breaker; the third attempt is not made
+    with pytest.raises(CircuitOpen):
+        streamed()
+    assert stub.stats["calls"] == 2
+    assert gemini_client.breaker.is_open
+    with pytest.raises(CircuitOpen):
+        streamed()
+    assert stub.stats["calls"] == 2
+
+
+def test_quota_exhaustion_is_a_429_with_retry_after(api, stub, monkeypatch):
+    from fastapi.testclient import TestClient
+
+    # Six requests a minute, two more than that already spent: 30 s to wait
+    scheduler = QuotaScheduler(rpm=6)
+    scheduler.requests.take(8)
+    monkeypatch.setattr(gemini_client, "scheduler", scheduler)
+    image_data = "data:image/png;base64," + base64.b64encode(kolam_png()).decode()
+    with TestClient(api.app) as client:
+        response = client.post("/gemini-analyze-image", json={"image_data": image_data, "prompt": "Describe it."})
+    assert response.status_code == 429
+    assert 15 <= int(response.headers["retry-after"]) <= 21
+    assert stub.stats["calls"] == 0
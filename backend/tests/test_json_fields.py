@@ -0,0 +1,42 @@
+import json
+
+from json_fields import TopLevelFields, parse_model_text
+
+ANSWER = {
+    "complexity": "Intermediate",
+    "algorithm": ["Lay out a {5 x 5} grid", "Loop \"around\" every [dot]", "Close the line \\ at the start"],
+    "specifications": {"dotCount": 25, "notes": ["}", "]", ",", ":"]},
+    "culturalSignificance": "Quotes \" and braces } inside a string, then a comma, and a colon: done",
+    "symmetryScore": 0.75,
+    "degraded": False,
+}
+TEXT = "```json\n" + json.dumps(ANSWER, indent=1) + "\n```"
+
+
+def feed_in_pieces(text, size):
+    fields, parser = [], TopLevelFields()
+    for start in range(0, len(text), size):
+        fields.extend(parser.feed(text[start:start + size]))
+    return fields
+
+
+def test_same_fields_at_every_chunk_size():
+    expected = list(ANSWER.items())
+    for size in range(1, len(TEXT) + 1):
+        assert feed_in_pieces(TEXT, size) == expected, size
+
+
+def test_field_is_returned_once_its_value_closes():
+    parser = TopLevelFields()
+    assert parser.feed('{"complexity": "Interm') == []
+    assert parser.feed('ediate", "algorithm": ["a"') == [("complexity", "Intermediate")]
+    assert parser.feed(', "b"]}') == [("algorithm", ["a", "b"])]
+    # Nothing after the outer object closes is read
+    assert parser.feed(', "late": 1}') == []
+
+
+def test_parse_model_text():
+    assert parse_model_text(TEXT) == ANSWER
+    assert parse_model_text("json " + json.dumps(ANSWER)) == ANSWER
+    assert parse_model_text(json.dumps(json.dumps(ANSWER))) == ANSWER
+    assert parse_model_text("not json") == "not json"
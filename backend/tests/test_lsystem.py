@@ -0,0 +1,85 @@
+import random
+from itertools import groupby
+
+import pytest
+
+import kolam_lsystem
+from kolam_lsystem import lsystem_expansion
+
+GRAMMARS = [
+    ("FBFBFBFB", {"A": "AFBFA", "B": "AFBFBFBFA"}),
+    ("AB", {"A": "AB", "B": "A"}),
+    # Empty rules, and symbols without a rule
+    ("AXA", {"A": "", "X": "XAX"}),
+    ("A", {"A": "BAB", "B": ""}),
+    ("", {"A": "AA"}),
+]
+
+
+def rewrite(axiom, rules, iterations):
+    for _ in range(iterations):
+        axiom = "".join(rules.get(symbol, symbol) for symbol in axiom)
+    return axiom
+
+
+def cases():
+    for axiom, rules in GRAMMARS:
+        for iterations in range(6):
+            yield axiom, rules, iterations
+
+
+@pytest.fixture(params=[kolam_lsystem.LEAF_CACHE_LENGTH, 3], ids=["default-leaves", "tiny-leaves"])
+def leaf_length(request, monkeypatch):
+    # Tiny leaves make chunks() descend through every level of the DAG
+    monkeypatch.setattr(kolam_lsystem, "LEAF_CACHE_LENGTH", request.param)
+
+
+def test_string_length_and_iteration_match_rewriting(leaf_length):
+    for axiom, rules, iterations in cases():
+        expected = rewrite(axiom, rules, iterations)
+        expansion = lsystem_expansion(axiom, rules, iterations)
+        assert len(expansion) == len(expected)
+        assert str(expansion) == expected
+        assert "".join(expansion) == expected
+        assert "".join(expansion.chunks()) == expected
+
+
+def test_indexing_matches_rewriting():
+    for axiom, rules, iterations in cases():
+        expected = rewrite(axiom, rules, iterations)
+        expansion = lsystem_expansion(axiom, rules, iterations)
+        for index in range(-len(expected), len(expected)):
+            assert expansion[index] == expected[index]
+        for index in (len(expected), -len(expected) - 1):
+            with pytest.raises(IndexError):
+                expansion[index]
+
+
+def test_slices_runs_and_folds_match_rewriting(leaf_length):
+    rng = random.Random(0)
+    for axiom, rules, iterations in cases():
+        expected = rewrite(axiom, rules, iterations)
+        expansion = lsystem_expansion(axiom, rules, iterations)
+        n = len(expected)
+        bounds = [None, 0, 1, n // 3, n - 1, n, n + 5, -1, -(n // 2) - 1, -n - 5]
+        ranges = [(start, stop) for start in bounds for stop in bounds]
+        ranges += [tuple(rng.randint(-n - 3, n + 3) for _ in range(2)) for _ in range(30)]
+        for start, stop in ranges:
+            piece = expected[start:stop]
+            assert expansion[start:stop] == piece
+            assert list(expansion.runs(start, stop)) == [(symbol, len(list(group))) for symbol, group in groupby(piece)]
+            # Nodes tile the range; folding string concatenation rebuilds it
+            assert "".join(expansion.grammar.text(*node) for node in expansion.nodes(start, stop)) == piece
+            assert expansion.fold(start, stop, lambda symbol: symbol, str.__add__, "", {}) == piece
+        assert expansion[1::2] == expected[1::2]
+        assert expansion[::-1] == expected[::-1]
+
+
+def test_split_boundaries_cover_the_expansion():
+    expansion = lsystem_expansion(*GRAMMARS[0], 4)
+    for parts in (1, 2, 3, 7):
+        boundaries = expansion.split(parts)
+        assert boundaries[0] == 0 and boundaries[-1] == len(expansion) and len(boundaries) == parts + 1
+        assert "".join(expansion[lo:hi] for lo, hi in zip(boundaries[:-1], boundaries[1:])) == str(expansion)
+        assert max(b - a for a, b in zip(boundaries[:-1], boundaries[1:])) - \
+            min(b - a for a, b in zip(boundaries[:-1], boundaries[1:])) <= 1
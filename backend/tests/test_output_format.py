@@ -0,0 +1,44 @@
+import importlib
+
+import pytest
+
+# Output format negotiation and the thumbnail cache of fastapi_app
+
+
+@pytest.fixture
+def api(monkeypatch):
+    monkeypatch.setenv("GEMINI_API_KEY", "test-key")
+    monkeypatch.setenv("KOLAM_ANALYSIS_CACHE", ":memory:")
+    return importlib.import_module("fastapi_app")
+
+
+@pytest.mark.parametrize("accept, expected", [
+    (None, "svg"),
+    ("application/json", "svg"),
+    ("text/html,application/xhtml+xml,*/*;q=0.8", "svg"),
+    ("image/png", "png"),
+    ("image/png;q=0.5, image/svg+xml", "svg"),
+    ("image/*;q=0, image/svg+xml", "svg"),
+    ("image/svg+xml;q=0, image/png", "png"),
+    ("image/svg+xml;q=0", None),
+    ("*/*;q=0", None),
+    ("text/html, image/*;q=0", None),
+])
+def test_accept_falls_back_to_svg_unless_it_excludes_svg(api, accept, expected):
+    assert api.negotiate_output_format(None, accept) == expected
+
+
+def test_explicit_format_wins_over_accept(api):
+    assert api.negotiate_output_format("PNG", "image/svg+xml") == "png"
+    assert api.negotiate_output_format("bmp", None) is None
+
+
+def test_ensure_thumbnails_returns_the_render_even_if_evicted(api, monkeypatch):
+    # A cache too small for anything: every thumbnail is evicted as it is stored
+    monkeypatch.setattr(api, "THUMBNAIL_CACHE_BYTES", 1)
+    monkeypatch.setattr(api, "_thumbnail_cache", type(api._thumbnail_cache)())
+    monkeypatch.setattr(api, "_thumbnail_cache_bytes", 0)
+    params = api.KolamParameters()
+    thumbnails = api.ensure_thumbnails(api.kolam_design_key(params), params, (64, 128), "png")
+    assert sorted(thumbnails) == [64, 128]
+    assert all(data.startswith(b"\x89PNG") for data in thumbnails.values())
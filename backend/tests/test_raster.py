@@ -0,0 +1,26 @@
+import numpy as np
+
+from kolam_geometry import lsystem_symmetric_geometry
+from kolam_raster import render_coverage, symmetry_frame
+
+RULES = {"A": "AFBFA", "B": "AFBFBFBFA"}
+
+
+def test_symmetric_designs_replicate_one_domain_and_match_the_full_render():
+    # Starts the app uses for lsystem designs (dot size 10) and kambi designs
+    for start_x, start_y in ((290, 310), (287.5, 312.5)):
+        geometry = lsystem_symmetric_geometry("FBFBFBFB", RULES, 4, 10, start_x, start_y)
+        assert geometry.symmetry["order"] == 4
+        for scale in (1.0, 2.0):
+            assert symmetry_frame(geometry, scale) is not None
+            replicated = render_coverage(geometry, scale)
+            full = render_coverage(geometry, scale, use_symmetry=False)
+            assert np.abs(replicated - full).max() < 1e-5
+
+
+def test_centre_off_the_pixel_lattice_gets_the_full_render():
+    geometry = lsystem_symmetric_geometry("FBFBFBFB", RULES, 3, 10, 290, 310)
+    center_x, center_y = geometry.symmetry["center"]
+    geometry.symmetry["center"] = (center_x + 0.3, center_y)
+    assert symmetry_frame(geometry) is None
+    assert symmetry_frame(geometry, 3.125) is None
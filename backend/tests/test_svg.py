@@ -0,0 +1,82 @@
+import re
+
+import pytest
+
+from kolam_analysis import analyze_vectors, symmetry_type
+from kolam_geometry import flatten_geometry, lsystem_symmetric_geometry
+from kolam_svg import UnsupportedSVG, geometry_to_svg, read_svg
+
+RULES = {"A": "AFBFA", "B": "AFBFBFBFA"}
+
+PINWHEEL = (
+    '<?xml version="1.0"?><svg xmlns="http://www.w3.org/2000/svg" xmlns:xlink="http://www.w3.org/1999/xlink" '
+    'width="200" height="200" viewBox="0 0 200 200"><title>pinwheel</title>'
+    '<defs><symbol id="blade"><path d="M 0,0 l 60,0 a 30,30 0 0 1 0,40" fill="none" stroke="#aa2200" stroke-width="3"/></symbol></defs>'
+    '<g id="wheel">'
+    + "".join(f'<use xlink:href="#blade" transform="translate(100,100) rotate({turn})"/>' for turn in (0, 90, 180, 270))
+    + '</g><circle cx="100" cy="100" r="4" fill="#aa2200"/></svg>'
+)
+
+
+def generated_svg():
+    return geometry_to_svg(lsystem_symmetric_geometry("FBFBFBFB", RULES, 3, 10, 290, 310))
+
+
+def test_our_own_output_reads_back_as_generated():
+    geometry = lsystem_symmetric_geometry("FBFBFBFB", RULES, 3, 10, 290, 310)
+    document = read_svg(geometry_to_svg(geometry).encode())
+    assert document["generated"]
+    assert sorted(document["motif_names"].values()) == ["A", "B", "D"]
+    flat, read = flatten_geometry(geometry), flatten_geometry(document["geometry"])
+    for kind in ("lines", "arcs", "dots"):
+        assert len(read[kind]) == len(flat[kind])
+    analysis = analyze_vectors(document)
+    assert analysis["symmetryType"] == symmetry_type("C4")
+    assert analysis["specifications"]["dotCount"] == 0
+    assert analysis["specifications"]["strokeWidth"] == "2.0px"
+
+
+def test_foreign_svg_with_symbols_and_transformed_uses():
+    document = read_svg(PINWHEEL.encode())
+    assert not document["generated"]
+    assert len(document["geometry"].instances) == 4
+    analysis = analyze_vectors(document)
+    assert analysis["symmetryType"] == symmetry_type("C4")
+    assert analysis["specifications"]["dotCount"] == 1
+    assert analysis["specifications"]["dimensions"] == "200 x 200 pixels"
+    assert analysis["dominantColors"] == ["#aa2200"]
+    assert analysis["averageLineThickness"] == 3.0
+
+
+@pytest.mark.parametrize("markup", [
+    '<svg xmlns="http://www.w3.org/2000/svg" width="10" height="10"><g transform="scale(2)"><line x1="0" y1="0" x2="5" y2="5" stroke="black"/></g></svg>',
+    '<svg xmlns="http://www.w3.org/2000/svg" width="10" height="10"><path d="M 0,0 C 1,1 2,2 3,3" fill="none" stroke="black"/></svg>',
+    '<svg xmlns="http://www.w3.org/2000/svg" width="10" height="10"><path d="M 0,0 A 4,2 0 0 1 3,3" fill="none" stroke="black"/></svg>',
+    '<svg xmlns="http://www.w3.org/2000/svg" width="10" height="10"><text x="1" y="5">kolam</text></svg>',
+    '<svg xmlns="http://www.w3.org/2000/svg" width="10" height="10" viewBox="0 0 5 5"><line x1="0" y1="0" x2="5" y2="5" stroke="black"/></svg>',
+    '<svg xmlns="http://www.w3.org/2000/svg" width="10" height="10"><line x1="0" y1="0"',
+])
+def test_markup_outside_the_subset_is_unsupported(markup):
+    with pytest.raises(UnsupportedSVG):
+        read_svg(markup.encode())
+
+
+@pytest.mark.parametrize("tamper", [
+    # Recoloured strokes
+    lambda svg: svg.replace('stroke="black"', 'stroke="red"', 1),
+    # A symbol id that doesn't follow the kolam-<name>-<crc> pattern
+    lambda svg: re.sub(r'id="kolam-A-[0-9a-f]{8}"', 'id="loop"', svg).replace(
+        re.search(r'#kolam-A-[0-9a-f]{8}', svg).group(0), "#loop"),
+    # Mixed stroke widths
+    lambda svg: svg.replace('stroke-width="2"', 'stroke-width="5"', 1),
+    # A different background
+    lambda svg: svg.replace('<rect fill="white"', '<rect fill="ivory"'),
+    # Re-saved by an editor that drops baseProfile
+    lambda svg: svg.replace('baseProfile="full" ', ''),
+])
+def test_edited_output_does_not_count_as_generated(tamper):
+    svg = generated_svg()
+    tampered = tamper(svg)
+    assert tampered != svg
+    document = read_svg(tampered.encode())
+    assert not document["generated"]
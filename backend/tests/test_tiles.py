@@ -0,0 +1,68 @@
+import io
+
+import numpy as np
+import pytest
+from PIL import Image
+
+import kolam_columns
+from kolam_geometry import geometry_spilled, grouptheory_geometry, lsystem_geometry
+from kolam_lsystem import lsystem_expansion
+from kolam_raster import render_geometry
+from kolam_tiles import bin_boxes, export_tiled
+
+RULES = {"A": "AFBFA", "B": "AFBFBFBFA"}
+
+
+def lsystem_design():
+    return lsystem_geometry(lsystem_expansion("FBFBFBFB", RULES, 3), 10, 290, 310)
+
+
+@pytest.mark.parametrize("output_format", ["png", "tiff"])
+@pytest.mark.parametrize("design, scale", [(lsystem_design, 1.0), (lsystem_design, 1.37), (lambda: grouptheory_geometry(6, 6, 3, 8, 3), 0.9)])
+def test_tiled_export_matches_the_whole_canvas_render(design, scale, output_format):
+    geometry = design()
+    out = io.BytesIO()
+    # 600 px designs on 256 px tiles: the last tile of every row and column is partial
+    size = export_tiled(geometry, out, scale=scale, format=output_format, tile_size=256, workers=2, dpi=150)
+    tiled = Image.open(io.BytesIO(out.getvalue()))
+    expected = render_geometry(geometry, scale, use_symmetry=False)
+    assert size == tiled.size == expected.size
+    assert size[0] % 256 and size[1] % 256
+    assert tiled.mode == "RGB"
+    assert np.array_equal(np.asarray(tiled), np.asarray(expected))
+
+
+def test_bin_boxes_lists_every_primitive_on_every_tile_it_touches():
+    rng = np.random.default_rng(0)
+    corners = rng.uniform(-100, 700, size=(300, 2))
+    boxes = np.hstack([corners, corners + rng.uniform(0, 300, size=(300, 2))])
+    tile_size, tiles_x, tiles_y = 128, 5, 4
+    ids, offsets = bin_boxes(boxes, tile_size, tiles_x, tiles_y)
+    for ty in range(tiles_y):
+        for tx in range(tiles_x):
+            tile = ty * tiles_x + tx
+            x0, y0 = tx * tile_size, ty * tile_size
+            touching = np.nonzero((boxes[:, 2] >= x0) & (boxes[:, 0] < x0 + tile_size)
+                                  & (boxes[:, 3] >= y0) & (boxes[:, 1] < y0 + tile_size))[0]
+            assert sorted(ids[offsets[tile]:offsets[tile + 1]].tolist()) == touching.tolist()
+
+
+def test_spilled_columns_export_and_render_like_in_memory_ones(monkeypatch):
+    expected = render_geometry(lsystem_design(), 1.37, use_symmetry=False)
+    # A budget of a few rows: the design's columns and the tiled export's
+    # scaled columns and band ids all live in scratch files
+    monkeypatch.setattr(kolam_columns, "RAM_BUDGET_BYTES", 256)
+    geometry = lsystem_design()
+    assert geometry_spilled(geometry)
+    assert np.array_equal(np.asarray(render_geometry(geometry, 1.37, use_symmetry=False)), np.asarray(expected))
+    out = io.BytesIO()
+    export_tiled(geometry, out, scale=1.37, tile_size=256, workers=2)
+    assert np.array_equal(np.asarray(Image.open(io.BytesIO(out.getvalue()))), np.asarray(expected))
+
+
+def test_spilled_counts_pending_rows():
+    columns = kolam_columns.PrimitiveColumns(4, budget=256)
+    for i in range(20):
+        columns.append((i, i, i + 1, i + 1))
+    assert columns.spilled
+    assert np.asarray(columns)[-1].tolist() == [19, 19, 20, 20]
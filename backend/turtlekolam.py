@@ -1,4 +1,5 @@
 import turtle
+from kolam_geometry import arc_segment_count
 
 # L-System parameters
 axiom = "FBFBFBFB"  # Initiator
@@ -43,7 +44,7 @@ def draw_line(length):
 
 # Function to draw an arc
 def draw_arc(radius, angle):
-    turtle.circle(radius, angle)
+    turtle.circle(radius, angle, arc_segment_count(radius, angle))
 
 # Set the dot size and number of iterations
 dot_size = 10
@@ -2,6 +2,7 @@ import cv2
 import numpy as np
 import turtle
 import time
+from kolam_geometry import arc_segment_count
 
 # L-System parameters
 axiom = "FBFBFBFB"  # Initiator
@@ -51,7 +52,7 @@ def draw_line(length, color):
 # Function to draw an arc
 def draw_arc(radius, angle, color):
     turtle.color(color)
-    turtle.circle(radius, angle)
+    turtle.circle(radius, angle, arc_segment_count(radius, angle))
 
 # Prompt the user to enter the dot size and rhombus size
 dot_size = int(input("Enter the dot size: "))
@@ -3,12 +3,62 @@
 import { useState, useCallback } from "react"
 import { useRouter } from "next/navigation" // Import useRouter
 import { AnalysisResult } from "@/lib/types"
+import { streamKolamAnalysis } from "@/lib/analysis-stream"
 
 import { Button } from "@/components/ui/button"
 import { Card, CardContent, CardDescription, CardHeader, CardTitle } from "@/components/ui/card"
 import { Badge } from "@/components/ui/badge"
 import { Progress } from "@/components/ui/progress"
 
+// Fallback shown when the analysis is not a JSON object
+function unparsedAnalysis(algorithm: string, culturalSignificance: string): AnalysisResult {
+  return {
+    symmetryType: "N/A",
+    rotationPatterns: ["N/A"],
+    gridSystem: "N/A",
+    complexity: "N/A",
+    symmetryScore: 0,
+    complexityIndex: 0,
+    dotDensity: 0,
+    lineSmoothness: 0,
+    colorVariance: 0,
+    averageLineThickness: 0,
+    dominantColors: ["#CCCCCC"],
+    specifications: {
+      dimensions: "N/A",
+      dotCount: 0,
+      lineLength: "N/A",
+      strokeWidth: "N/A",
+    },
+    algorithm: [algorithm],
+    culturalSignificance,
+  }
+}
+
+function toAnalysisResult(analysis: unknown): AnalysisResult {
+  if (typeof analysis === 'object' && analysis !== null) {
+    // Partial until the model's fields have arrived
+    return analysis as AnalysisResult
+  }
+  if (typeof analysis === 'string') {
+    // If it's a string, try to parse it. If it fails, create a fallback.
+    try {
+      return JSON.parse(analysis) as AnalysisResult
+    } catch (jsonError) {
+      console.error("Failed to parse analysis string as JSON:", jsonError);
+      return unparsedAnalysis(
+        "Raw response: " + analysis.substring(0, 200) + (analysis.length > 200 ? "..." : ""),
+        "The AI returned content that could not be parsed as valid JSON. This might be a partial response or an error from the AI. Check the algorithm field for raw output.",
+      )
+    }
+  }
+  console.error("Unexpected analysis data type:", typeof analysis, analysis);
+  return unparsedAnalysis(
+    "Unexpected data format from backend.",
+    "The AI returned content in an unexpected format. Please try again or check backend logs.",
+  )
+}
+
 export function AnalyzeUpload() {
   const [uploadedImage, setUploadedImage] = useState<string | null>(null)
   const [isAnalyzing, setIsAnalyzing] = useState(false)
@@ -154,99 +204,21 @@ export function AnalyzeUpload() {
       return
     }
 
-    // Simulate analysis progress
-    const progressSteps = [
-      { step: 20, message: "Detecting patterns..." },
-      { step: 40, message: "Analyzing symmetry..." },
-      { step: 60, message: "Calculating dimensions..." },
-      { step: 80, message: "Identifying cultural elements..." },
-      { step: 100, message: "Generating report..." },
-    ]
-
-    for (const { step } of progressSteps) {
-      await new Promise((resolve) => setTimeout(resolve, 300)) // Reduced timeout for quicker simulation
-      setAnalysisProgress(step)
-    }
-
     try {
-      const prompt = "Analyze this Kolam design. Provide a detailed mathematical and cultural analysis in a JSON format with the following keys:\n- `symmetryType`: (string) e.g., \"D4 Dihedral Symmetry\"\n- `rotationPatterns`: (array of strings) e.g., [\"90-degree rotational symmetry\"]\n- `gridSystem`: (string) e.g., \"Square Grid (Dot-based)\"\n- `complexity`: (string) e.g., \"Intermediate\", \"High\"\n- `symmetryScore`: (number, 0-1.0) Numerical score (0 if N/A).\n- `complexityIndex`: (number, 0-1.0) Numerical score (0 if N/A).\n- `dotDensity`: (number, 0-1.0) Numerical score (0 if N/A).\n- `lineSmoothness`: (number, 0-1.0) Numerical score (0 if N/A).\n- `colorVariance`: (number, 0-1.0) Numerical score (0 if N/A).\n- `averageLineThickness`: (number) Numerical value in pixels (0 if N/A).\n- `dominantColors`: (array of hex strings) e.g., [\"#FF0000\", \"#0000FF\"], or [\"N/A\"] if none.\n- `specifications`: (object with properties below)\n  - `dimensions`: (string) e.g., \"500 x 500 pixels\", \"N/A\" if not determinable.\n  - `dotCount`: (number) Integer count (0 if N/A).\n  - `lineLength`: (string) e.g., \"Approx. 1200 units\", \"N/A\" if not determinable.\n  - `strokeWidth`: (string) e.g., \"2px\", \"N/A\" if not determinable.\n- `algorithm`: (array of strings) Step-by-step description.\n- `culturalSignificance`: (string) Detailed explanation.\n\nEnsure all numerical fields are strictly numbers (0 for N/A), and string fields are concise ('N/A' for strings if truly not determinable). Do not include any additional text outside the JSON object. The response should be in a single JSON object."
-
-      const response = await fetch("https://kolamkars.onrender.com/gemini-analyze-image", {
-        method: "POST",
-        headers: {
-          "Content-Type": "application/json",
+      // Tiered analysis: the measured fields (symmetry, grid, specifications,
+      // colours) render as soon as the server has them, and the model's fields
+      // (complexity, algorithm, culturalSignificance) are merged in as it writes them
+      const finalAnalysis = await streamKolamAnalysis(
+        "https://kolamkars.onrender.com/analyze-kolam-image",
+        { image: uploadedImage },
+        (update) => {
+          const analysis = toAnalysisResult(update)
+          setAnalysisResult(analysis)
+          setAnalysisProgress(analysis.culturalSignificance ? 90 : 50)
         },
-        body: JSON.stringify({
-          image_data: uploadedImage,
-          prompt: prompt,
-        }),
-      });
-
-      if (!response.ok) {
-        throw new Error(`HTTP error! status: ${response.status}`);
-      }
-
-      const data = await response.json();
-
-      let finalAnalysis: AnalysisResult;
-      if (typeof data.analysis === 'object' && data.analysis !== null) {
-        // If backend already parsed it into an object, use it directly
-        finalAnalysis = data.analysis as AnalysisResult;
-      } else if (typeof data.analysis === 'string') {
-        // If it's a string, try to parse it. If it fails, create a fallback.
-        try {
-          finalAnalysis = JSON.parse(data.analysis) as AnalysisResult;
-        } catch (jsonError) {
-          console.error("Failed to parse analysis string as JSON:", jsonError);
-          // Fallback for non-JSON or malformed JSON responses
-          finalAnalysis = {
-            symmetryType: "N/A",
-            rotationPatterns: ["N/A"],
-            gridSystem: "N/A",
-            complexity: "N/A",
-            symmetryScore: 0,
-            complexityIndex: 0,
-            dotDensity: 0,
-            lineSmoothness: 0,
-            colorVariance: 0,
-            averageLineThickness: 0,
-            dominantColors: ["#CCCCCC"],
-            specifications: {
-              dimensions: "N/A",
-              dotCount: 0,
-              lineLength: "N/A",
-              strokeWidth: "N/A",
-            },
-            algorithm: ["Raw response: " + data.analysis.substring(0, 200) + (data.analysis.length > 200 ? "..." : "")],
-            culturalSignificance: "The AI returned content that could not be parsed as valid JSON. This might be a partial response or an error from the AI. Check the algorithm field for raw output.",
-          };
-        }
-      } else {
-        // Fallback for unexpected data types
-        console.error("Unexpected analysis data type:", typeof data.analysis, data.analysis);
-        finalAnalysis = {
-          symmetryType: "N/A",
-          rotationPatterns: ["N/A"],
-          gridSystem: "N/A",
-          complexity: "N/A",
-          symmetryScore: 0,
-          complexityIndex: 0,
-          dotDensity: 0,
-          lineSmoothness: 0,
-          colorVariance: 0,
-          averageLineThickness: 0,
-          dominantColors: ["#CCCCCC"],
-          specifications: {
-            dimensions: "N/A",
-            dotCount: 0,
-            lineLength: "N/A",
-            strokeWidth: "N/A",
-          },
-          algorithm: ["Unexpected data format from backend."],
-          culturalSignificance: "The AI returned content in an unexpected format. Please try again or check backend logs.",
-        };
-      }
-      setAnalysisResult(finalAnalysis);
+      );
+      setAnalysisResult(toAnalysisResult(finalAnalysis));
+      setAnalysisProgress(100)
 
     } catch (e: any) {
       setError(e.message)
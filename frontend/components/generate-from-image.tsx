@@ -5,6 +5,7 @@ import { useState, useCallback } from "react"
 import { Button } from "@/components/ui/button"
 import { Card, CardContent, CardDescription, CardHeader, CardTitle } from "@/components/ui/card"
 import { KolamCanvas } from "@/components/kolam-canvas"
+import { streamKolamAnalysis } from "@/lib/analysis-stream"
 
 export function GenerateFromImage() {
   const [uploadedImage, setUploadedImage] = useState<string | null>(null)
@@ -118,17 +119,11 @@ export function GenerateFromImage() {
     try {
       // If generatedKolamSvg is an SVG string, keep as-is; if it's a data URL, use directly
       const imageData = generatedKolamSvg || uploadedImage!
-      const response = await fetch("https://kolamkars.onrender.com/analyze-kolam-image", {
-        method: "POST",
-        headers: { "Content-Type": "application/json" },
-        body: JSON.stringify({ image: imageData, prompt: "" }),
-      })
-      if (!response.ok) {
-        const text = await response.text()
-        throw new Error(`HTTP ${response.status}: ${text}`)
-      }
-      const json = await response.json()
-      setAnalysisResult(json?.analysis ?? json)
+      await streamKolamAnalysis(
+        "https://kolamkars.onrender.com/analyze-kolam-image",
+        { image: imageData, prompt: "" },
+        setAnalysisResult,
+      )
     } catch (e: any) {
       setAnalysisError(e.message || 'Failed to analyze image')
     } finally {
@@ -9,6 +9,7 @@ import { Select, SelectContent, SelectItem, SelectTrigger, SelectValue } from "@
 import { Input } from "@/components/ui/input"
 import { Slider } from "@/components/ui/slider"
 import { KolamCanvas } from "@/components/kolam-canvas"
+import { streamKolamAnalysis } from "@/lib/analysis-stream"
 
 interface KolamParametersType {
   gridType: string;
@@ -954,17 +955,11 @@ export function GenerateWithInputs() {
     setAnalysisResult(null);
     try {
       const pngDataUrl = await svgStringToPngDataUrl(kolamSvg);
-      const response = await fetch("https://kolamkars.onrender.com/analyze-kolam-image", {
-        method: "POST",
-        headers: { "Content-Type": "application/json" },
-        body: JSON.stringify({ image: pngDataUrl, prompt: "" }),
-      });
-      if (!response.ok) {
-        const text = await response.text();
-        throw new Error(`HTTP ${response.status}: ${text}`);
-      }
-      const result = await response.json();
-      setAnalysisResult(result?.analysis ?? result);
+      await streamKolamAnalysis(
+        "https://kolamkars.onrender.com/analyze-kolam-image",
+        { image: pngDataUrl, prompt: "" },
+        setAnalysisResult,
+      );
     } catch (e: any) {
       setAnalysisError(e.message || 'Failed to analyze kolam');
     } finally {
@@ -0,0 +1,61 @@
+import type { AnalysisResult } from './types'
+
+type AnalysisUpdate = Partial<AnalysisResult> | string
+
+// POSTs to /analyze-kolam-image asking for server-sent events. The measured
+// fields (symmetry, grid, specifications, colours) arrive first and the model's
+// fields (algorithm, culturalSignificance) are merged in one by one as the
+// model writes them, so onUpdate fires per tier and per model field. Servers
+// that answer with plain JSON still work.
+export async function streamKolamAnalysis(
+  url: string,
+  body: unknown,
+  onUpdate: (analysis: AnalysisUpdate) => void,
+): Promise<AnalysisUpdate> {
+  const response = await fetch(url, {
+    method: "POST",
+    headers: { "Content-Type": "application/json", Accept: "text/event-stream, application/json" },
+    body: JSON.stringify(body),
+  })
+  if (!response.ok) {
+    const text = await response.text()
+    throw new Error(`HTTP ${response.status}: ${text}`)
+  }
+  if (!response.headers.get("content-type")?.includes("text/event-stream") || !response.body) {
+    const json = await response.json()
+    const analysis = json?.analysis ?? json
+    onUpdate(analysis)
+    return analysis
+  }
+
+  let analysis: Partial<AnalysisResult> = {}
+  const reader = response.body.getReader()
+  const decoder = new TextDecoder()
+  let buffer = ""
+  while (true) {
+    const { done, value } = await reader.read()
+    if (done) break
+    buffer += decoder.decode(value, { stream: true })
+    let boundary
+    while ((boundary = buffer.indexOf("\n\n")) !== -1) {
+      const block = buffer.slice(0, boundary)
+      buffer = buffer.slice(boundary + 2)
+      let event = "message"
+      let data = ""
+      for (const line of block.split("\n")) {
+        if (line.startsWith("event:")) event = line.slice(6).trim()
+        else if (line.startsWith("data:")) data += line.slice(5).trim()
+      }
+      if (!data) continue
+      const payload = JSON.parse(data)
+      if (event === "error") {
+        throw new Error(payload.detail || "Analysis failed")
+      }
+      if (event === "local" || event === "enrichment" || event === "done") {
+        analysis = { ...analysis, ...payload.analysis }
+        onUpdate(analysis)
+      }
+    }
+  }
+  return analysis
+}
@@ -15,6 +15,8 @@ export interface AnalysisResult {
     dotCount: number;
     lineLength: string;
     strokeWidth: string;
+    // Only for SVG uploads measured from their vectors
+    boundingBox?: { x: number; y: number; width: number; height: number };
   };
   algorithm: string[];
   culturalSignificance: string;